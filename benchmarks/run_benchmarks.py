@@ -0,0 +1,243 @@
+"""Benchmarks of the data loaders, the pose sampler and the recorder's decode
+loop on generated data, kept separate from the pytest unit tests.
+
+Each benchmark runs at several input sizes and records its throughput (best of
+a few repeats) and peak traced memory to a JSON results file. Given a
+baseline results file, the run fails if any benchmark got slower, or used
+more memory, by more than the threshold.
+
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from capcup import eval_data_formatter, sciosense_data_formatter
+from capcup import serial_data_formatter, synthetic_data
+from capcup.offset_generator import Box, SuctionCup
+from capcup.serial_stream import SerialDecoder, parse_line
+
+SIZES = (10_000, 100_000, 1_000_000)
+QUICK_SIZES = (10_000, 100_000)
+FOLDER_FILES = 4
+DECODE_CHUNK = 4096  # bytes per serial read, as when the port has a backlog
+
+
+def _serial_file(directory: str, size: int) -> str:
+    path = os.path.join(directory, f"serial_{size}.txt")
+    if not os.path.isfile(path):
+        synthetic_data.write_serial(path, size, corruption=0.001, rng=0)
+    return path
+
+
+def _folder(directory: str, file_format: str, size: int) -> str:
+    folder = os.path.join(directory, f"{file_format}_folder_{size}")
+    if not os.path.isdir(folder):
+        synthetic_data.write_folder(
+            folder, file_format, FOLDER_FILES, rng=0, num_samples=size // FOLDER_FILES
+        )
+    return folder
+
+
+def setup_serial(directory, size):
+    path = _serial_file(directory, size)
+    return lambda: serial_data_formatter.SerialData(path)
+
+
+def setup_eval(directory, size):
+    path = os.path.join(directory, f"eval_{size}.txt")
+    if not os.path.isfile(path):
+        synthetic_data.write_eval(path, size, rng=0)
+    return lambda: eval_data_formatter.EvalBoardData(path)
+
+
+def setup_sciosense(directory, size):
+    path = os.path.join(directory, f"sciosense_{size}.txt")
+    if not os.path.isfile(path):
+        synthetic_data.write_sciosense(path, size, channels=3, rng=0)
+    return lambda: sciosense_data_formatter.SciosenseCapData(path)
+
+
+def setup_serial_folder(directory, size):
+    folder = _folder(directory, "serial", size)
+    return lambda: serial_data_formatter.format_folder(folder)
+
+
+def setup_eval_folder(directory, size):
+    folder = _folder(directory, "eval", size)
+    return lambda: eval_data_formatter.format_folder(folder)
+
+
+def setup_sciosense_folder(directory, size):
+    folder = _folder(directory, "sciosense", size)
+    return lambda: sciosense_data_formatter.format_folder(folder)
+
+
+def setup_box_sample(directory, size):
+    box = Box(x_size=100, y_size=100)
+    cup = SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
+    # Box.sample returns num_samples poses of each of the 3 classes
+    return lambda: box.sample(size // 3, cup, rng=0)
+
+
+def setup_decode(directory, size):
+    """The recorder's loop without the port: split a backlog of board output
+    (the serial file without its host timestamps) into lines and parse them."""
+    with open(_serial_file(directory, size), encoding="utf-8") as f:
+        stream = "".join(line.split(" ", 1)[-1] for line in f)
+    chunks = [
+        stream[idx : idx + DECODE_CHUNK] for idx in range(0, len(stream), DECODE_CHUNK)
+    ]
+
+    def decode():
+        decoder = SerialDecoder()
+        decoded = []
+        for chunk in chunks:
+            for line in decoder.lines(chunk):
+                try:
+                    decoded.append(parse_line(line))
+                except ValueError:
+                    pass
+        return decoded
+
+    return decode
+
+
+# name: setup(directory, size) -> function to time. size is in samples/poses.
+BENCHMARKS = {
+    "serial_read": setup_serial,
+    "eval_read": setup_eval,
+    "sciosense_read": setup_sciosense,
+    "serial_format_folder": setup_serial_folder,
+    "eval_format_folder": setup_eval_folder,
+    "sciosense_format_folder": setup_sciosense_folder,
+    "box_sample": setup_box_sample,
+    "recorder_decode": setup_decode,
+}
+
+
+def measure(function, size: int, repeats: int = 3) -> dict:
+    """Best time of a few runs, and the peak memory traced in one more run."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = min(times)
+    return {
+        "size": size,
+        "seconds": best,
+        "throughput": size / best,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def run(names, sizes, data_dir: str, repeats: int = 3) -> dict:
+    results = {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "benchmarks": {},
+    }
+    for name in names:
+        for size in sizes:
+            function = BENCHMARKS[name](data_dir, size)
+            result = measure(function, size, repeats)
+            results["benchmarks"][f"{name}[{size}]"] = result
+            print(
+                f"{name:>24}[{size:>8}] {result['throughput']:>12.0f} /s "
+                f"{result['peak_mb']:>8.1f} MB"
+            )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2) -> list:
+    """Regressions of results against a baseline.
+
+    Args:
+        results: output of run
+        baseline: an earlier output of run
+        threshold: allowed fractional loss of throughput, or growth of peak
+            memory
+
+    Returns:
+        a message per regression"""
+    regressions = []
+    for key, result in results["benchmarks"].items():
+        reference = baseline["benchmarks"].get(key)
+        if reference is None:
+            continue
+        if result["throughput"] < reference["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{key}: throughput {result['throughput']:.0f}/s vs "
+                f"{reference['throughput']:.0f}/s in the baseline"
+            )
+        if result["peak_mb"] > reference["peak_mb"] * (1 + threshold):
+            regressions.append(
+                f"{key}: peak memory {result['peak_mb']:.1f} MB vs "
+                f"{reference['peak_mb']:.1f} MB in the baseline"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-b", "--benchmark", action="append", choices=BENCHMARKS, help="Run only these"
+    )
+    parser.add_argument("--quick", action="store_true", help="Skip the largest size")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="Runs per timing")
+    parser.add_argument("-o", "--output", type=str, help="Results JSON to write")
+    parser.add_argument("--baseline", type=str, help="Results JSON to compare with")
+    parser.add_argument(
+        "--save-baseline", type=str, help="Also write the results as a baseline"
+    )
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=0.2, help="Allowed regression"
+    )
+    parser.add_argument(
+        "--data-dir", type=str, help="Where generated data is kept between runs"
+    )
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or os.path.join(
+        tempfile.gettempdir(), "capcup_benchmark_data"
+    )
+    os.makedirs(data_dir, exist_ok=True)
+    results = run(
+        args.benchmark or list(BENCHMARKS),
+        QUICK_SIZES if args.quick else SIZES,
+        data_dir,
+        args.repeats,
+    )
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
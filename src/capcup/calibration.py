@@ -0,0 +1,403 @@
+"""Module for calibrating capacitance counts to cup compression and offset.
+
+A ground truth run presses the cup once per row of its ground truth CSV, so
+the k-th press of the recording is labeled by the k-th pose. Each press is
+reduced to its level: the per-channel median of the settled part of the
+press minus the baseline before it. The targets are the lip compression
+(Box.cup_compression, 0 without contact) and the x, y offset of the pose.
+
+The calibration is fitted in two vectorized stages:
+    1. per channel, a polynomial from level to compression (one batched least
+        squares solve for all channels), tabulated on a uniform grid
+    2. across channels, a ridge regression from the 8 per-channel
+        compressions, and each one's share of their mean, to every target.
+        The shares carry the offset, which leans the response towards the
+        channels on one side whatever the compression.
+Evaluating it is a table lookup with linear interpolation per channel and a
+small matrix product, about 20 microseconds per sample, so the recorder can
+apply it live.
+"""
+
+import argparse
+from dataclasses import dataclass
+import os
+
+import numpy as np
+import pandas as pd
+
+from capcup.offset_generator import Box, SuctionCup, frame_to_poses
+from capcup.segment_index import press_bounds
+from capcup.serial_data_formatter import SerialData
+from capcup.trial_cache import TrialCache
+
+TARGETS = ("compression", "x", "y")
+
+
+def press_levels(
+    cap_counts: np.ndarray,
+    actuations: np.ndarray,
+    baseline_samples: int = 20,
+    settle: float = 0.5,
+) -> np.ndarray:
+    """(presses, channels) level of every press of a trial.
+
+    Args:
+        cap_counts: (samples, channels) signal
+        actuations: (samples,) actuation flag
+        baseline_samples: samples before a press its baseline is the median of
+        settle: fraction of each press skipped before the level is taken"""
+    starts, ends = press_bounds(actuations)
+    levels = np.empty((len(starts), cap_counts.shape[1]))
+    for idx, (start, end) in enumerate(zip(starts, ends)):
+        baseline = np.median(cap_counts[max(start - baseline_samples, 0) : start], 0)
+        settled = cap_counts[start + int(settle * (end - start)) : end]
+        levels[idx] = np.median(settled, axis=0) - baseline
+    return levels
+
+
+def pose_targets(poses: np.ndarray, box: Box, cup: SuctionCup) -> np.ndarray:
+    """(poses, len(TARGETS)) targets of POSE_DTYPE poses."""
+    compression = np.nan_to_num(box.cup_compression(poses, cup), nan=0.0)
+    return np.stack([np.maximum(compression, 0), poses["x"], poses["y"]], axis=1)
+
+
+@dataclass
+class LabeledPresses:
+    """The levels and targets of the presses of one ground truth trial.
+
+    Attributes:
+        name: the trial's file name
+        levels: (presses, channels)
+        targets: (presses, len(TARGETS))
+    """
+
+    name: str
+    levels: np.ndarray
+    targets: np.ndarray
+
+
+def label_trial(
+    file_path: str,
+    ground_truth,
+    box: Box,
+    cup: SuctionCup,
+    cache: TrialCache = None,
+    **level_kwargs,
+) -> LabeledPresses:
+    """Pairs the presses of a SerialData ground truth recording with the rows
+    of its ground truth CSV.
+
+    Args:
+        file_path: the recording
+        ground_truth: the ground truth CSV path, or its DataFrame
+        box: the tool the poses were pressed with
+        cup: the cup that was pressed
+        cache: optional TrialCache
+        level_kwargs: passed on to press_levels
+
+    Raises:
+        ValueError: if the number of presses and poses differ"""
+    if not isinstance(ground_truth, pd.DataFrame):
+        ground_truth = pd.read_csv(ground_truth)
+    trial = SerialData(file_path, cache=cache)
+    levels = press_levels(trial.cap_counts, trial.actuations, **level_kwargs)
+    if len(levels) != len(ground_truth):
+        raise ValueError(
+            f"{trial.name} has {len(levels)} presses but the ground truth has "
+            f"{len(ground_truth)} poses"
+        )
+    targets = pose_targets(frame_to_poses(ground_truth), box, cup)
+    return LabeledPresses(trial.name, levels, targets)
+
+
+def polyfit_channels(levels: np.ndarray, target: np.ndarray, degree: int = 3):
+    """Least squares polynomials from each channel's level to the target, all
+    channels in one batched solve.
+
+    Args:
+        levels: (presses, channels)
+        target: (presses,)
+        degree: polynomial degree
+
+    Returns:
+        (channels, degree + 1) coefficients, highest power first, of the
+        polynomials in the standardized level (level - mean) / scale, and the
+        (channels,) means and scales"""
+    mean = levels.mean(axis=0)
+    scale = levels.std(axis=0)
+    scale[scale == 0] = 1
+    standard = ((levels - mean) / scale).T  # (channels, presses)
+    powers = standard[..., None] ** np.arange(degree, -1, -1)
+    gram = powers.transpose(0, 2, 1) @ powers
+    gram += 1e-9 * np.eye(degree + 1)
+    moments = (powers.transpose(0, 2, 1) @ target)[..., None]
+    return np.linalg.solve(gram, moments)[..., 0], mean, scale
+
+
+def cross_features(estimates: np.ndarray) -> np.ndarray:
+    """(..., 2 * channels) per-channel compressions and their ratios to the
+    mean compression, the inputs of the cross-channel stage."""
+    mean = estimates.mean(axis=-1, keepdims=True)
+    mean = np.where(np.abs(mean) > 1e-6, mean, 1e-6)
+    return np.concatenate([estimates, estimates / mean], axis=-1)
+
+
+@dataclass
+class Calibration:
+    """Lookup tables from channel level to compression, and the weights that
+    combine the channels into every target.
+
+    Attributes:
+        start: (channels,) level of the first table entry
+        step: (channels,) level between entries
+        tables: (channels, points) compression per channel on the grid
+        weights: (2 * channels + 1, len(TARGETS)) weights of the
+            cross_features, bias last
+    """
+
+    start: np.ndarray
+    step: np.ndarray
+    tables: np.ndarray
+    weights: np.ndarray
+
+    def channel_estimates(self, levels: np.ndarray) -> np.ndarray:
+        """Per-channel compressions of (..., channels) levels: a linear
+        interpolation on each channel's grid, clamped at its ends, as
+        np.interp would do."""
+        points = self.tables.shape[1]
+        position = np.clip((levels - self.start) / self.step, 0, points - 1)
+        below = np.minimum(position.astype(int), points - 2)
+        fraction = position - below
+        channels = np.arange(self.tables.shape[0])
+        lower = self.tables[channels, below]
+        upper = self.tables[channels, below + 1]
+        return lower + fraction * (upper - lower)
+
+    def predict(self, levels: np.ndarray) -> np.ndarray:
+        """(..., len(TARGETS)) targets of (..., channels) levels."""
+        estimates = self.channel_estimates(np.asarray(levels, dtype=float))
+        return cross_features(estimates) @ self.weights[:-1] + self.weights[-1]
+
+    def save(self, file_path: str) -> None:
+        np.savez(
+            file_path,
+            start=self.start,
+            step=self.step,
+            tables=self.tables,
+            weights=self.weights,
+            targets=np.array(TARGETS),
+        )
+
+    @classmethod
+    def load(cls, file_path: str) -> "Calibration":
+        with np.load(file_path) as saved:
+            return cls(saved["start"], saved["step"], saved["tables"], saved["weights"])
+
+
+def fit_calibration(
+    labeled: list,
+    degree: int = 3,
+    points: int = 256,
+    ridge: float = 1e-3,
+) -> Calibration:
+    """Fits a Calibration to every press of the labeled trials.
+
+    Args:
+        labeled: LabeledPresses of the training trials
+        degree: degree of the per-channel polynomials
+        points: entries per channel table
+        ridge: regularization of the cross-channel weights, on standardized
+            cross_features"""
+    levels = np.concatenate([trial.levels for trial in labeled])
+    targets = np.concatenate([trial.targets for trial in labeled])
+    compression = targets[:, TARGETS.index("compression")]
+
+    coefficients, mean, scale = polyfit_channels(levels, compression, degree)
+    low, high = levels.min(axis=0), levels.max(axis=0)
+    step = (high - low) / (points - 1)
+    step[step == 0] = 1
+    grid = low[:, None] + step[:, None] * np.arange(points)
+    standard = (grid - mean[:, None]) / scale[:, None]
+    powers = standard[..., None] ** np.arange(degree, -1, -1)
+    tables = np.einsum("cpd,cd->cp", powers, coefficients)
+    calibration = Calibration(low, step, tables, np.empty(0))
+
+    features = cross_features(calibration.channel_estimates(levels))
+    # ridge regression on standardized features, so the small spread of the
+    # shares is not swamped by the penalty on the compressions
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1
+    design = np.c_[(features - mean) / scale, np.ones(len(features))]
+    penalty = ridge * len(features) * np.eye(design.shape[1])
+    penalty[-1, -1] = 0  # the bias is not regularized
+    weights = np.linalg.solve(design.T @ design + penalty, design.T @ targets)
+    weights[:-1] /= scale[:, None]
+    weights[-1] -= mean @ weights[:-1]
+    calibration.weights = weights
+    return calibration
+
+
+def validation_report(calibration: Calibration, labeled: list) -> pd.DataFrame:
+    """Errors of the calibration on labeled trials, eg. held out ones.
+
+    Returns:
+        DataFrame indexed by (trial, target), "all" for every trial together,
+        with the columns "presses", "mae", "rmse", "p95" (absolute error) and
+        "r2"."""
+    rows = {}
+    groups = [(trial.name, trial.levels, trial.targets) for trial in labeled]
+    if len(labeled) > 1:
+        groups.append(
+            (
+                "all",
+                np.concatenate([trial.levels for trial in labeled]),
+                np.concatenate([trial.targets for trial in labeled]),
+            )
+        )
+    for name, levels, targets in groups:
+        errors = calibration.predict(levels) - targets
+        for idx, target in enumerate(TARGETS):
+            error = errors[:, idx]
+            variance = np.var(targets[:, idx])
+            rows[(name, target)] = {
+                "presses": len(error),
+                "mae": np.mean(np.abs(error)),
+                "rmse": np.sqrt(np.mean(error**2)),
+                "p95": np.percentile(np.abs(error), 95),
+                "r2": 1 - np.mean(error**2) / variance if variance > 0 else np.nan,
+            }
+    report = pd.DataFrame.from_dict(rows, orient="index")
+    report.index.names = ["trial", "target"]
+    return report
+
+
+def holdout_report(labeled: list, holdout: list = None, **fit_kwargs) -> pd.DataFrame:
+    """Fits on all but the held out trials and reports on those.
+
+    Args:
+        labeled: LabeledPresses of every trial
+        holdout: names of the trials held out. If None, every trial is held
+            out in turn (leave one trial out) and the reports are stacked.
+        fit_kwargs: passed on to fit_calibration"""
+    if holdout is not None:
+        train = [trial for trial in labeled if trial.name not in holdout]
+        test = [trial for trial in labeled if trial.name in holdout]
+        return validation_report(fit_calibration(train, **fit_kwargs), test)
+    reports = [holdout_report(labeled, [trial.name], **fit_kwargs) for trial in labeled]
+    return pd.concat(reports)
+
+
+class LiveCalibration:
+    """Applies a Calibration to a live sample stream, taking the baseline from
+    the samples recorded while the flag is low."""
+
+    def __init__(self, calibration: Calibration, baseline_samples: int = 20):
+        self.calibration = calibration
+        self.baseline_samples = baseline_samples
+        self._released = []
+        self.baseline = None
+        self.estimate = None
+        self.press = None  # estimate at the deepest compression of the last press
+        self.released = False  # whether the last sample ended a press
+        self._peak = None
+        self._flag = 0
+
+    def update(self, values, flag) -> np.ndarray:
+        """Adds a sample (channel counts) and returns its TARGETS estimate,
+        or None until a baseline is known."""
+        values = np.asarray(values, dtype=float)
+        self.released = bool(self._flag and not flag)
+        self._flag = flag
+        if self.released:
+            self.press, self._peak = self._peak, None
+        if not flag:
+            self._released.append(values)
+            if len(self._released) >= self.baseline_samples:
+                self.baseline = np.median(self._released, axis=0)
+                self._released = []
+        if self.baseline is None:
+            return None
+        self.estimate = self.calibration.predict(values - self.baseline)
+        if flag and (self._peak is None or self.estimate[0] > self._peak[0]):
+            self._peak = self.estimate
+        return self.estimate
+
+    @staticmethod
+    def _format(estimate) -> str:
+        return " ".join(
+            f"{target} {value:.2f} mm" for target, value in zip(TARGETS, estimate)
+        )
+
+    def status(self) -> str:
+        if self.estimate is None:
+            return "Calibration: waiting for a baseline"
+        return "Calibration: " + self._format(self.estimate)
+
+    def press_status(self) -> str:
+        """The estimate of the last press, eg. to print once it is released."""
+        if self.press is None:
+            return "Calibration: no press estimated yet"
+        return "Calibration: press at " + self._format(self.press)
+
+
+def calibrate_folder(
+    folder_path: str,
+    box: Box,
+    cup: SuctionCup,
+    cache: TrialCache = None,
+    **level_kwargs,
+) -> list:
+    """LabeledPresses of every recording in a folder that has a ground truth
+    CSV next to it named <recording stem>.ground_truth.csv."""
+    labeled = []
+    for item in sorted(os.listdir(folder_path)):
+        stem, extension = os.path.splitext(item)
+        ground_truth = os.path.join(folder_path, stem + ".ground_truth.csv")
+        if extension == ".csv" and os.path.isfile(ground_truth):
+            labeled.append(
+                label_trial(
+                    os.path.join(folder_path, item),
+                    ground_truth,
+                    box,
+                    cup,
+                    cache,
+                    **level_kwargs,
+                )
+            )
+    return labeled
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit a calibration to the ground truth recordings of a folder"
+    )
+    parser.add_argument("folder", help="Recordings with <stem>.ground_truth.csv files")
+    parser.add_argument("-o", "--output", default="calibration.npz")
+    parser.add_argument(
+        "--holdout", nargs="*", default=[], help="Recordings to validate on only"
+    )
+    parser.add_argument("--degree", type=int, default=3)
+    args = parser.parse_args()
+
+    box = Box(x_size=100, y_size=100)
+    cup = SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
+    labeled = calibrate_folder(args.folder, box, cup)
+    train = [trial for trial in labeled if trial.name not in args.holdout]
+    test = [trial for trial in labeled if trial.name in args.holdout]
+    if not train:
+        parser.error(f"no recordings with ground truth to fit on in {args.folder}")
+    if not test and len(train) < 2:
+        parser.error(
+            "leave one trial out validation needs two or more recordings, "
+            "give more or name one to validate on with --holdout"
+        )
+    calibration = fit_calibration(train, degree=args.degree)
+    calibration.save(args.output)
+    print("Saved", args.output)
+    report = validation_report(calibration, test) if test else holdout_report(train)
+    print(report.to_string(float_format="{:.3f}".format))
+
+
+if __name__ == "__main__":
+    main()
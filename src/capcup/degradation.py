@@ -0,0 +1,399 @@
+"""Module for tracking how a cup's response changes over an endurance run.
+
+The ring and cup cycle scripts actuate the cup thousands of times with the
+actuation flag raised during each press. A cycle runs from one rising flag
+edge to the next, and is summarized per channel by:
+    - baseline: median of the last samples before the press
+    - peak: the largest departure from the baseline while the flag is on
+        (signed)
+    - hysteresis: how far the baseline before the next press is from this
+        one, ie. what the cup did not recover
+
+CycleTracker computes these from chunks of samples as they are recorded or
+read, holding only the last baseline window, so a day long run is summarized
+in constant memory. The summaries are appended to a CycleTable, a file of
+fixed size records that can be queried while it grows, and rolling_slope and
+CusumDetector follow the trend of any summary over the cycle index.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from capcup.recording_segments import open_recording
+
+NUM_CHANNELS = 8
+SUMMARY_FIELDS = ("baseline", "peak", "hysteresis")
+
+
+def cycle_dtype(channels: int = NUM_CHANNELS) -> np.dtype:
+    return np.dtype(
+        [
+            ("cycle", np.int64),
+            ("start_time", np.float64),
+            ("on_duration", np.float64),
+            ("duration", np.float64),
+        ]
+        + [(field, np.float64, (channels,)) for field in SUMMARY_FIELDS]
+    )
+
+
+class CycleTracker:
+    """Summarizes actuation cycles from a stream of samples."""
+
+    def __init__(self, channels: int = NUM_CHANNELS, baseline_samples: int = 20):
+        """
+        Args:
+            channels: number of signal channels
+            baseline_samples: samples before a press the baseline is taken over
+        """
+        self.channels = channels
+        self.baseline_samples = baseline_samples
+        self.dtype = cycle_dtype(channels)
+        self.cycles = 0
+        self._off = np.empty((0, channels))
+        self._flag = None
+        self._cycle = None  # the summary of the cycle in progress
+
+    def update(self, times, counts, flags) -> np.ndarray:
+        """Adds a chunk of samples.
+
+        Args:
+            times: (samples,) sample times
+            counts: (samples, channels) signal
+            flags: (samples,) actuation flag
+
+        Returns:
+            records (of cycle_dtype) of the cycles completed in this chunk"""
+        times = np.asarray(times, dtype=float)
+        counts = np.asarray(counts, dtype=float).reshape(len(times), self.channels)
+        flags = np.asarray(flags).astype(bool)
+        if not len(times):
+            return np.empty(0, self.dtype)
+        if self._flag is None:
+            self._flag = flags[0]
+
+        previous = np.r_[self._flag, flags[:-1]]
+        edges = np.flatnonzero(flags != previous)
+        bounds = np.r_[0, edges, len(flags)]
+        completed = []
+        for idx, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if idx > 0 and flags[start]:
+                record = self._press(times[start])
+                if record is not None:
+                    completed.append(record)
+            elif idx > 0 and self._cycle is not None:
+                self._cycle["release_time"] = times[start]
+            if stop > start:
+                self._add(counts[start:stop], flags[start], times[stop - 1])
+        self._flag = flags[-1]
+        return np.array(completed, dtype=self.dtype)
+
+    def finish(self) -> np.ndarray:
+        """Closes the cycle in progress, eg. at the end of a recording."""
+        record = self._close()
+        return np.array([] if record is None else [record], dtype=self.dtype)
+
+    def _baseline(self) -> np.ndarray:
+        if not len(self._off):
+            return np.full(self.channels, np.nan)
+        return np.median(self._off, axis=0)
+
+    def _press(self, edge_time: float):
+        record = self._close(edge_time)
+        baseline = self._baseline()
+        self._cycle = {
+            "start_time": edge_time,
+            "release_time": np.nan,
+            "last_time": edge_time,
+            "baseline": baseline,
+            "peak": np.where(np.isnan(baseline), np.nan, 0.0),
+        }
+        self._off = self._off[:0]
+        return record
+
+    def _add(self, counts: np.ndarray, flag: bool, last_time: float) -> None:
+        if not flag:
+            self._off = np.concatenate([self._off, counts])[-self.baseline_samples :]
+        elif self._cycle is not None:
+            delta = counts - self._cycle["baseline"]
+            largest = delta[np.abs(delta).argmax(axis=0), np.arange(self.channels)]
+            peak = self._cycle["peak"]
+            self._cycle["peak"] = np.where(
+                np.abs(largest) > np.abs(peak), largest, peak
+            )
+        if self._cycle is not None:
+            self._cycle["last_time"] = last_time
+
+    def _close(self, end_time: float = None):
+        """The record of the cycle in progress, which ends at end_time, the
+        next press, or else at its last sample."""
+        cycle, self._cycle = self._cycle, None
+        if cycle is None:
+            return None
+        if end_time is None:
+            end_time = cycle["last_time"]
+        release = cycle["release_time"]
+        record = (
+            self.cycles,
+            cycle["start_time"],
+            (release if not np.isnan(release) else end_time) - cycle["start_time"],
+            end_time - cycle["start_time"],
+            cycle["baseline"],
+            cycle["peak"],
+            self._baseline() - cycle["baseline"],
+        )
+        self.cycles += 1
+        return record
+
+
+class CycleTable:
+    """An append-only file of cycle summaries, with a JSON sidecar holding
+    the record layout. Records are fixed size, so the table is read with a
+    memory map and a partially written last record is ignored."""
+
+    def __init__(self, file_path: str, channels: int = NUM_CHANNELS):
+        """
+        Args:
+            file_path: the table file, eg. "run.cycles"
+            channels: number of channels, if the table is new"""
+        self.file_path = file_path
+        meta_path = file_path + ".json"
+        if os.path.isfile(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                channels = json.load(f)["channels"]
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"channels": channels, "fields": SUMMARY_FIELDS}, f)
+        self.channels = channels
+        self.dtype = cycle_dtype(channels)
+
+    def __len__(self) -> int:
+        if not os.path.isfile(self.file_path):
+            return 0
+        return os.path.getsize(self.file_path) // self.dtype.itemsize
+
+    def append(self, records: np.ndarray) -> None:
+        if not len(records):
+            return
+        records = np.asarray(records, dtype=self.dtype)
+        with open(self.file_path, "ab") as f:
+            # drop a torn record left by an interrupted append
+            f.truncate(len(self) * self.dtype.itemsize)
+            f.write(records.tobytes())
+
+    def read(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """Records of cycles [start, stop), as a read only memory map."""
+        count = len(self)
+        start, stop, _ = slice(start, stop).indices(count)
+        if stop <= start:
+            return np.empty(0, self.dtype)
+        table = np.memmap(self.file_path, self.dtype, mode="r", shape=(count,))
+        return table[start:stop]
+
+    def to_frame(self, start: int = 0, stop: int = None) -> pd.DataFrame:
+        """The records as a DataFrame indexed by cycle, with a column per
+        summary and channel, eg. "peak_3"."""
+        records = self.read(start, stop)
+        columns = {
+            name: np.asarray(records[name])
+            for name in ("start_time", "on_duration", "duration")
+        }
+        for field in SUMMARY_FIELDS:
+            for channel in range(self.channels):
+                columns[f"{field}_{channel}"] = records[field][:, channel]
+        return pd.DataFrame(columns, index=pd.Index(records["cycle"], name="cycle"))
+
+
+def rolling_slope(values: np.ndarray, window: int) -> np.ndarray:
+    """Least squares slope per cycle of the last window values, for each
+    value from window - 1 on (NaN before).
+
+    Args:
+        values: (cycles,) or (cycles, channels)
+        window: cycles per fit"""
+    values = np.asarray(values, dtype=float)
+    flat = values.reshape(len(values), -1)
+    slopes = np.full(flat.shape, np.nan)
+    if len(values) >= window:
+        x = np.arange(len(values), dtype=float)[:, None]
+        sums = [
+            np.cumsum(np.r_[np.zeros((1, term.shape[1])), term], axis=0)
+            for term in (flat, x * flat)
+        ]
+        sum_y, sum_xy = (total[window:] - total[:-window] for total in sums)
+        x_start = np.arange(len(values) - window + 1)[:, None]
+        sum_x = window * x_start + window * (window - 1) / 2
+        sum_xx = (
+            window * x_start**2
+            + x_start * window * (window - 1)
+            + (window - 1) * window * (2 * window - 1) / 6
+        )
+        slopes[window - 1 :] = (window * sum_xy - sum_x * sum_y) / (
+            window * sum_xx - sum_x**2
+        )
+    return slopes.reshape(values.shape)
+
+
+class CusumDetector:
+    """Two sided CUSUM change detection of a per cycle value, for several
+    channels at once. Each channel's reference mean and spread are learnt
+    from its first warmup cycles, and relearnt after it changes."""
+
+    def __init__(self, warmup: int = 100, drift: float = 0.5, threshold: float = 10.0):
+        """
+        Args:
+            warmup: cycles the reference is estimated over
+            drift: slack, in standard deviations, before deviations add up
+            threshold: cumulative standard deviations that signal a change"""
+        self.warmup = warmup
+        self.drift = drift
+        self.threshold = threshold
+        self.changes = []  # (cycle, channel, +1 for an increase or -1)
+        self._count = None
+        self._mean = None
+        self._m2 = None
+        self._high = None
+        self._low = None
+
+    def _reset(self, channels) -> None:
+        for state in (self._count, self._mean, self._m2, self._high, self._low):
+            state[channels] = 0
+
+    def update(self, cycle: int, value) -> list:
+        """Adds one cycle's values and returns the changes detected on it.
+        NaN values are ignored."""
+        value = np.atleast_1d(np.asarray(value, dtype=float))
+        if self._count is None:
+            self._count = np.zeros(value.shape, dtype=int)
+            self._mean, self._m2, self._high, self._low = (
+                np.zeros(value.shape) for _ in range(4)
+            )
+        valid = ~np.isnan(value)
+        value = np.where(valid, value, 0)
+
+        # Welford's running mean and variance for the channels still warming up
+        learning = valid & (self._count < self.warmup)
+        self._count += learning
+        delta = value - self._mean
+        self._mean += np.where(learning, delta / np.maximum(self._count, 1), 0)
+        self._m2 += np.where(learning, delta * (value - self._mean), 0)
+
+        watching = valid & ~learning & (self._count > 1)
+        std = np.sqrt(self._m2 / np.maximum(self._count - 1, 1))
+        score = np.where(watching, (value - self._mean) / np.where(std > 0, std, 1), 0)
+        self._high = np.where(
+            watching, np.maximum(0, self._high + score - self.drift), self._high
+        )
+        self._low = np.where(
+            watching, np.maximum(0, self._low - score - self.drift), self._low
+        )
+        rising = np.flatnonzero(self._high > self.threshold)
+        falling = np.flatnonzero(self._low > self.threshold)
+        changes = [(cycle, int(ch), 1) for ch in rising]
+        changes += [(cycle, int(ch), -1) for ch in falling]
+        self._reset(np.r_[rising, falling].astype(int))
+        self.changes += changes
+        return changes
+
+
+def serial_chunks(file_path: str, chunk_lines: int = 100_000):
+    """Yields (times, counts, flags) chunks of a serial recording, skipping
+    the lines SerialData skips, without loading the whole file."""
+    with open_recording(file_path) as f:
+        while True:
+            lines = [line for _, line in zip(range(chunk_lines), f)]
+            if not lines:
+                return
+            rows = [line.split() for line in lines if line[0] != "#"]
+            rows = [
+                row
+                for row in rows
+                if len(row) == 10 and all(len(entry) == 8 for entry in row[1:-1])
+            ]
+            if rows:
+                values = np.array(rows, dtype=float)
+                yield values[:, 0], values[:, 1:9], values[:, -1]
+
+
+def summarize_recording(
+    file_path: str,
+    table: CycleTable = None,
+    baseline_samples: int = 20,
+    chunk_lines: int = 100_000,
+) -> np.ndarray:
+    """Summarizes every cycle of a serial recording, a chunk at a time.
+
+    Args:
+        file_path: a recording, or the index of a segmented recording
+        table: if given, the cycles are appended to it as they complete
+        baseline_samples: see CycleTracker
+        chunk_lines: lines read at a time
+
+    Returns:
+        the cycle records"""
+    tracker = CycleTracker(baseline_samples=baseline_samples)
+    records = []
+    for chunk in serial_chunks(file_path, chunk_lines):
+        records.append(tracker.update(*chunk))
+        if table is not None:
+            table.append(records[-1])
+    records.append(tracker.finish())
+    if table is not None:
+        table.append(records[-1])
+    return np.concatenate(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize the cycles of an endurance run and flag changes"
+    )
+    parser.add_argument("recording", nargs="?", help="Serial recording to summarize")
+    parser.add_argument("--live", type=str, help="Follow a recorder's sample bus")
+    parser.add_argument("-o", "--table", type=str, help="Cycle table to append to")
+    parser.add_argument("--field", choices=SUMMARY_FIELDS, default="peak")
+    parser.add_argument("--window", type=int, default=100, help="Cycles per trend")
+    args = parser.parse_args()
+    if args.recording is None and args.live is None:
+        parser.error("give a recording to summarize or --live")
+
+    table = CycleTable(args.table) if args.table else None
+    detector = CusumDetector()
+
+    def report(records):
+        for record in records:
+            for cycle, channel, sign in detector.update(
+                record["cycle"], record[args.field]
+            ):
+                direction = "up" if sign > 0 else "down"
+                print(f"Cycle {cycle}: {args.field} of channel {channel} {direction}")
+
+    if args.live:
+        from capcup.sample_bus import SampleReader
+
+        tracker = CycleTracker()
+        with SampleReader(args.live) as reader:
+            while True:
+                frames = reader.read()
+                if len(frames):
+                    records = tracker.update(frames[:, 0], frames[:, 1:9], frames[:, 9])
+                    if table is not None:
+                        table.append(records)
+                    report(records)
+                time.sleep(0.1)
+
+    records = summarize_recording(args.recording, table)
+    report(records)
+    slopes = rolling_slope(records[args.field], args.window)
+    print(f"{len(records)} cycles")
+    if len(records) >= args.window:
+        print(f"{args.field} slope per cycle over the last {args.window}:")
+        print(np.array2string(slopes[-1], precision=4))
+
+
+if __name__ == "__main__":
+    main()
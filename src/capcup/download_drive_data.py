@@ -1,9 +1,27 @@
-"""Methods for downloading files and folders from google drive."""
+"""Methods for downloading files and folders from google drive.
 
+sync_folder keeps a local folder up to date with a remote one instead: it
+diffs the remote listing against a manifest of what was downloaded before
+(name, size, md5) and only fetches missing or changed files, several at a
+time, retrying failed downloads with exponential backoff. Google drive
+listings only carry file ids, so for drive folders a file edited in place is
+not detected, only new or missing files are fetched.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import time
+import urllib.request
 
 import gdown
 
+MANIFEST_NAME = ".manifest.json"  # hidden, so folder readers skip it (is_trial_file)
+
 
 def download_file(url: str, data_directory: str = None) -> None:
     """Downloads a file from the google drive url to a local location
@@ -80,9 +98,220 @@ def check_if_downloaded(
         # the directory does not exist, so no chance of duplicate
         return False
 
-    potential_duplicate = False
-    for file in file_list:
-        if file.path in os.listdir(folder_directory):
-            potential_duplicate = True
+    existing = set(os.listdir(folder_directory))
+    return any(file.path in existing for file in file_list)
+
+
+@dataclass
+class RemoteFile:
+    """A file in a remote folder listing.
+
+    Attributes:
+        name: file name within the folder
+        url: where to download it from
+        size: size in bytes, if the listing has it
+        md5: hex md5 checksum, if the listing has it
+    """
+
+    name: str
+    url: str
+    size: int = None
+    md5: str = None
+
+
+def list_drive_folder(url: str):
+    """The files of a shared google drive folder. gdown's listing only has
+    file ids, with no sizes, checksums or modified times, and the id of a file
+    edited in place does not change. Syncing a drive folder therefore only
+    fetches new or missing files.
+
+    Returns:
+        the folder's name and a list of RemoteFiles"""
+    file_list = gdown.download_folder(url, skip_download=True)
+    _, folder_name = os.path.split(os.path.dirname(file_list[0].local_path))
+    remote_files = [
+        RemoteFile(file.path, f"https://drive.google.com/uc?id={file.id}")
+        for file in file_list
+    ]
+    return folder_name, remote_files
+
+
+def list_index(url: str) -> list:
+    """The files of a folder served over HTTP with an index.json listing
+    (a list of {"name", "size", "md5"}), as RemoteFiles."""
+    url = url if url.endswith("/") else url + "/"
+    with urllib.request.urlopen(url + "index.json") as response:
+        index = json.load(response)
+    return [
+        RemoteFile(item["name"], url + item["name"], item.get("size"), item.get("md5"))
+        for item in index
+    ]
+
+
+def fetch_url(url: str, file_path: str) -> None:
+    """Downloads a url to file_path with urllib."""
+    with urllib.request.urlopen(url) as response, open(file_path, "wb") as f:
+        shutil.copyfileobj(response, f)
+
+
+def fetch_drive(url: str, file_path: str) -> None:
+    """Downloads a google drive url to file_path with gdown."""
+    if gdown.download(url, output=file_path, quiet=True, fuzzy=True) is None:
+        raise OSError(f"Could not download {url}")
+
+
+def file_md5(file_path: str, chunk_size: int = 1 << 20) -> str:
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def load_manifest(folder_directory: str) -> dict:
+    """{name: {"url", "size", "md5"}} of the files synced into a folder."""
+    path = os.path.join(folder_directory, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
 
-    return potential_duplicate
+
+def save_manifest(folder_directory: str, manifest: dict) -> None:
+    """Writes the manifest to a temporary file and moves it into place."""
+    handle, temp_path = tempfile.mkstemp(dir=folder_directory, suffix=".tmp")
+    with os.fdopen(handle, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, os.path.join(folder_directory, MANIFEST_NAME))
+
+
+def is_stale(remote: RemoteFile, entry: dict, folder_directory: str) -> bool:
+    """Whether a remote file has to be (re)downloaded.
+
+    Args:
+        remote: the remote file
+        entry: its manifest entry, None if it was never synced
+        folder_directory: the local folder"""
+    local_path = os.path.join(folder_directory, remote.name)
+    if entry is None or not os.path.isfile(local_path):
+        return True
+    if remote.size is not None and remote.size != entry["size"]:
+        return True
+    if remote.md5 is not None and remote.md5 != entry["md5"]:
+        return True
+    # Without a size or checksum, only a new url (ie. file id) is a change
+    return remote.size is None and remote.md5 is None and remote.url != entry["url"]
+
+
+def download_with_retries(
+    remote: RemoteFile,
+    folder_directory: str,
+    fetch=fetch_url,
+    retries: int = 3,
+    backoff: float = 0.5,
+) -> dict:
+    """Downloads a remote file into a folder, retrying with exponential
+    backoff. The file is only moved into place once complete (and matching
+    the listed size and checksum).
+
+    Returns:
+        the file's manifest entry"""
+    for attempt in range(retries + 1):
+        handle, temp_path = tempfile.mkstemp(dir=folder_directory, suffix=".part")
+        os.close(handle)
+        try:
+            fetch(remote.url, temp_path)
+            entry = {
+                "url": remote.url,
+                "size": os.path.getsize(temp_path),
+                "md5": file_md5(temp_path),
+            }
+            if remote.size is not None and entry["size"] != remote.size:
+                raise OSError(
+                    f"{remote.name}: got {entry['size']} of {remote.size} bytes"
+                )
+            if remote.md5 is not None and entry["md5"] != remote.md5:
+                raise OSError(f"{remote.name}: checksum mismatch")
+            file_path = os.path.join(folder_directory, remote.name)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(temp_path, file_path)
+            return entry
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+
+
+def sync_folder(
+    remote_files: list,
+    folder_directory: str,
+    fetch=fetch_url,
+    workers: int = 4,
+    retries: int = 3,
+    backoff: float = 0.5,
+) -> dict:
+    """Downloads the remote files that are missing or changed locally.
+
+    Args:
+        remote_files: RemoteFiles, eg. from list_drive_folder or list_index
+        folder_directory: the local folder to sync into
+        fetch: function(url, file_path) that downloads one file
+        workers: most downloads running at once
+        retries: retries per file before giving up on it
+        backoff: seconds before the first retry, doubled on every retry
+
+    Returns:
+        {"downloaded": names, "skipped": names, "failed": {name: error}}"""
+    os.makedirs(folder_directory, exist_ok=True)
+    manifest = load_manifest(folder_directory)
+    stale = [
+        remote
+        for remote in remote_files
+        if is_stale(remote, manifest.get(remote.name), folder_directory)
+    ]
+    stale_names = {remote.name for remote in stale}
+    report = {
+        "downloaded": [],
+        "skipped": [r.name for r in remote_files if r.name not in stale_names],
+        "failed": {},
+    }
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            remote.name: executor.submit(
+                download_with_retries, remote, folder_directory, fetch, retries, backoff
+            )
+            for remote in stale
+        }
+        try:
+            for name, future in futures.items():
+                try:
+                    manifest[name] = future.result()
+                    report["downloaded"].append(name)
+                except Exception as error:
+                    report["failed"][name] = error
+        finally:
+            save_manifest(folder_directory, manifest)
+    return report
+
+
+def sync_drive_folder(url: str, data_directory: str = None, **kwargs) -> dict:
+    """sync_folder for a shared google drive folder, into a subfolder of
+    data_directory named like the drive folder (as download_folder does).
+    Only new or missing files are fetched, see list_drive_folder. Delete the
+    local copy of a file edited on drive to fetch it again.
+
+    Args:
+        url: the sharable folder link, only works if anyone with link has access
+        data_directory: defaults to a folder in the working directory called
+            'data/'
+        kwargs: passed on to sync_folder"""
+    if data_directory is None:
+        data_directory = os.path.join(os.getcwd(), "data", "")
+    folder_name, remote_files = list_drive_folder(url)
+    kwargs.setdefault("fetch", fetch_drive)
+    return sync_folder(
+        remote_files, os.path.join(data_directory, folder_name), **kwargs
+    )
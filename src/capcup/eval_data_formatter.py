@@ -4,6 +4,12 @@ import os
 import re
 import numpy as np
 
+from capcup.profiling import stage
+from capcup.recording_segments import is_trial_file, open_recording
+from capcup.trial_cache import LazyTrial, TrialCache, cached_read, trial_hash
+
+CACHE_FIELDS = ("headers", "cap_counts", "volt_temp_data")
+
 
 class EvalBoardData:
     """An object defining a single data collection done on the AD7746 eval
@@ -13,12 +19,19 @@ class EvalBoardData:
 
     """
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, cache: TrialCache = None):
         """
         Args:
-            file_path:"""
+            file_path:
+            cache: if given, the parsed arrays are stored in and loaded from
+                this cache instead of parsing the file every time"""
         self.trial_name = os.path.split(file_path)[1]
-        self.headers, self.cap_counts, self.volt_temp_data = self._read_file(file_path)
+        self.file_path = file_path
+        self.cache_key = trial_hash(file_path)
+        with stage("eval.load"):
+            self.headers, self.cap_counts, self.volt_temp_data = cached_read(
+                cache, file_path, "eval", self._read_file, CACHE_FIELDS
+            )
         self.sampling_period = float(self.headers["Conv. Time"].split()[0]) / 1000
         self.time = np.arange(
             0, len(self.cap_counts) * self.sampling_period, self.sampling_period
@@ -30,8 +43,11 @@ class EvalBoardData:
         data_start = False
         cap_data, volt_temp_data = [], []
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f.readlines():
+        with stage("eval.io"), open_recording(file_path) as f:
+            lines = f.readlines()
+
+        with stage("eval.parse"):
+            for line in lines:
                 line = line.strip()
                 if not line:
                     continue
@@ -54,20 +70,30 @@ class EvalBoardData:
                     cap_data.append(int(data_columns[0], 16))
                     volt_temp_data.append(int(data_columns[1], 16))
 
-        cap_counts = np.array(cap_data, dtype=np.int32)
-        volt_temp_array = np.array(volt_temp_data, dtype=np.int32)
+        with stage("eval.to_numpy"):
+            cap_counts = np.array(cap_data, dtype=np.int32)
+            volt_temp_array = np.array(volt_temp_data, dtype=np.int32)
 
         return headers, cap_counts, volt_temp_array
 
 
-def format_folder(folder_path: str):
-    """Given a folder path, generate EvalBoardData objects for all files."""
+def format_folder(folder_path: str, cache: TrialCache = None, lazy: bool = False):
+    """Given a folder path, generate EvalBoardData objects for all files.
+
+    Args:
+        folder_path: the folder of recordings
+        cache: optional TrialCache used by every trial
+        lazy: if True, return LazyTrial objects that only read their file when
+            first used"""
     data_objects = []
     directory_items = sorted(os.listdir(folder_path))
     for item in directory_items:
-        if item == "Settings.txt":
+        if not is_trial_file(item):
             continue
         item_path = os.path.join(folder_path, item)
         if os.path.isfile(item_path):
-            data_objects.append(EvalBoardData(item_path))
+            if lazy:
+                data_objects.append(LazyTrial(EvalBoardData, item_path, cache=cache))
+            else:
+                data_objects.append(EvalBoardData(item_path, cache=cache))
     return data_objects
@@ -0,0 +1,211 @@
+"""Module for turning folders of SerialData trials into windowed feature
+matrices for training contact/pose models.
+
+Windows are strided views over cap_counts (no copies), features are computed
+for a batch of windows at a time, trials are processed in parallel and the
+result for every (trial hash, window, stride, feature set) is cached, so
+changing one parameter only recomputes what depends on it.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import hashlib
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from capcup.recording_segments import is_trial_file
+from capcup.serial_data_formatter import SerialData
+from capcup.trial_cache import TrialCache, trial_hash
+
+
+def _slope(windows: np.ndarray) -> np.ndarray:
+    """Least squares slope of each window, in counts per sample."""
+    steps = np.arange(windows.shape[-1]) - (windows.shape[-1] - 1) / 2
+    return windows @ steps / (steps @ steps)
+
+
+# Each feature maps windows of shape (num_windows, channels, window) to
+# (num_windows, channels). New features can be registered by adding to this
+# dictionary (before starting worker processes).
+FEATURES = {
+    "mean": lambda windows: windows.mean(axis=-1),
+    "std": lambda windows: windows.std(axis=-1),
+    "min": lambda windows: windows.min(axis=-1),
+    "max": lambda windows: windows.max(axis=-1),
+    "ptp": lambda windows: np.ptp(windows, axis=-1),
+    "delta": lambda windows: windows[..., -1] - windows[..., 0],
+    "slope": _slope,
+}
+DEFAULT_FEATURES = ("mean", "std", "ptp", "slope")
+
+
+@dataclass
+class FeatureMatrix:
+    """Features of every window of one trial.
+
+    Attributes:
+        name: the trial's file name
+        features: (num_windows, len(feature_names)) features
+        starts: (num_windows,) index of the first sample of each window
+        actuated: (num_windows,) fraction of each window with the actuation
+            flag high
+        feature_names: column names, eg. "mean_C1"
+    """
+
+    name: str
+    features: np.ndarray
+    starts: np.ndarray
+    actuated: np.ndarray
+    feature_names: list
+
+
+def feature_names(features: tuple, channels: int) -> list:
+    return [f"{feature}_C{ch + 1}" for feature in features for ch in range(channels)]
+
+
+def feature_set_id(features: tuple) -> str:
+    return hashlib.sha1(",".join(features).encode()).hexdigest()[:8]
+
+
+def window_features(
+    data: np.ndarray,
+    window: int,
+    stride: int = 1,
+    features: tuple = DEFAULT_FEATURES,
+    batch_size: int = 4096,
+) -> np.ndarray:
+    """Computes features over sliding windows of a (samples, channels) array.
+
+    Args:
+        data: (samples, channels) data, eg. cap_counts
+        window: window length in samples
+        stride: samples between the starts of consecutive windows
+        features: names of FEATURES to compute
+        batch_size: windows processed at a time, which bounds the size of the
+            temporaries some features need
+
+    Returns:
+        (num_windows, len(features) * channels) array, feature-major columns"""
+    if data.ndim == 1:
+        data = data[:, None]
+    if len(data) < window:
+        return np.empty((0, len(features) * data.shape[1]))
+    windows = sliding_window_view(data, window, axis=0)[::stride]
+    output = np.empty((len(windows), len(features) * data.shape[1]))
+    for start in range(0, len(windows), batch_size):
+        batch = windows[start : start + batch_size].astype(float)
+        output[start : start + batch_size] = np.concatenate(
+            [FEATURES[feature](batch) for feature in features], axis=1
+        )
+    return output
+
+
+def trial_features(
+    trial, window: int, stride: int = 1, features: tuple = DEFAULT_FEATURES
+) -> FeatureMatrix:
+    """The FeatureMatrix of a loaded SerialData trial."""
+    num_windows = max(len(trial.cap_counts) - window + 1, 0)
+    starts = np.arange(0, num_windows, stride)
+    actuated = (
+        sliding_window_view(trial.actuations, window)[::stride].mean(axis=1)
+        if num_windows
+        else np.empty(0)
+    )
+    return FeatureMatrix(
+        trial.name,
+        window_features(trial.cap_counts, window, stride, features),
+        starts,
+        actuated,
+        feature_names(features, trial.cap_counts.shape[1]),
+    )
+
+
+def _cache_name(window: int, stride: int, features: tuple) -> str:
+    return f"features_w{window}_s{stride}_{feature_set_id(features)}"
+
+
+def _compute(file_path: str, window: int, stride: int, features: tuple, cache_dir):
+    """Worker: loads a trial and computes (and caches) its features."""
+    cache = None if cache_dir is None else TrialCache(cache_dir)
+    matrix = trial_features(
+        SerialData(file_path, cache=cache), window, stride, features
+    )
+    arrays = {
+        "features": matrix.features,
+        "starts": matrix.starts,
+        "actuated": matrix.actuated,
+    }
+    if cache is not None:
+        cache.save(
+            trial_hash(file_path), _cache_name(window, stride, features), **arrays
+        )
+    return arrays
+
+
+def build_feature_matrices(
+    file_paths: list,
+    window: int,
+    stride: int = 1,
+    features: tuple = DEFAULT_FEATURES,
+    cache: TrialCache = None,
+    workers: int = None,
+) -> list:
+    """Builds the FeatureMatrix of every trial, reusing cached results.
+
+    Args:
+        file_paths: SerialData files
+        window: window length in samples
+        stride: samples between window starts
+        features: names of FEATURES to compute
+        cache: optional TrialCache for parsed trials and feature matrices
+        workers: number of worker processes. Defaults to the CPU count, 1 runs
+            everything in this process.
+
+    Returns:
+        a list of FeatureMatrix, in the order of file_paths"""
+    features = tuple(features)
+    name = _cache_name(window, stride, features)
+    results = [None] * len(file_paths)
+    missing = []
+    for idx, file_path in enumerate(file_paths):
+        cached = None if cache is None else cache.load(trial_hash(file_path), name)
+        if cached is None:
+            missing.append(idx)
+        else:
+            results[idx] = cached
+
+    cache_dir = None if cache is None else cache.cache_dir
+    args = [(file_paths[idx], window, stride, features, cache_dir) for idx in missing]
+    if workers == 1 or len(missing) <= 1:
+        computed = [_compute(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            computed = list(executor.map(_compute, *zip(*args)))
+    for idx, arrays in zip(missing, computed):
+        results[idx] = arrays
+
+    matrices = []
+    for file_path, arrays in zip(file_paths, results):
+        channels = arrays["features"].shape[1] // max(len(features), 1)
+        matrices.append(
+            FeatureMatrix(
+                os.path.split(file_path)[1],
+                arrays["features"],
+                arrays["starts"],
+                arrays["actuated"],
+                feature_names(features, channels),
+            )
+        )
+    return matrices
+
+
+def build_folder_features(folder_path: str, window: int, **kwargs) -> list:
+    """build_feature_matrices for every trial in a folder, see format_folder."""
+    file_paths = [
+        os.path.join(folder_path, item)
+        for item in sorted(os.listdir(folder_path))
+        if is_trial_file(item) and os.path.isfile(os.path.join(folder_path, item))
+    ]
+    return build_feature_matrices(file_paths, window, **kwargs)
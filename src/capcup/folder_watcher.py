@@ -0,0 +1,379 @@
+"""Module for following a data folder during a campaign and ingesting each new
+or changed trial once, instead of re-reading the whole folder.
+
+FolderWatcher reports the trials of a folder that were added, changed or
+removed. On Linux it sleeps on inotify events, elsewhere (or if inotify is
+unavailable) it polls the folder. Either way a file is only reported once its
+trial_hash has stopped changing for a settle time, or as soon as its writer
+closed it, so recordings still being written are not read half way. Segments
+of a segmented recording count as changes to its index.
+
+FolderIngest then parses only the reported trials into the TrialCache, adds
+their presses to a SegmentIndex and updates their FeatureMatrix, so the work
+per update is proportional to the new data.
+
+    python folder_watcher.py data/ --window 20 --index data/.index
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from capcup.feature_matrix import DEFAULT_FEATURES, build_feature_matrices
+from capcup.recording_segments import INDEX_SUFFIX, SEGMENT_PATTERN
+from capcup.segment_index import SegmentIndex
+from capcup.serial_data_formatter import SerialData
+from capcup.trial_cache import LazyTrial, TrialCache, trial_hash
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class Inotify:
+    """The inotify events of one directory, through libc with ctypes."""
+
+    def __init__(self, folder_path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        watch = libc.inotify_add_watch(self.fd, os.fsencode(folder_path), WATCH_MASK)
+        if watch < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"cannot watch {folder_path}")
+
+    def read(self, timeout: float) -> list:
+        """Waits up to timeout seconds for events.
+
+        Returns:
+            (mask, file name) of every event, oldest first"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def trial_name(item: str):
+    """The trial a file of a data folder belongs to: the file itself, the index
+    of a segmented recording for one of its segments, or None for files that
+    are not trials."""
+    if item == "Settings.txt" or item.startswith(".") or item.endswith(".tmp"):
+        return None
+    match = SEGMENT_PATTERN.search(item)
+    if match:
+        return item[: match.start()] + INDEX_SUFFIX
+    return item
+
+
+class FolderWatcher:
+    """Reports the trials of a folder that were added, changed or removed,
+    once they stopped changing."""
+
+    def __init__(
+        self,
+        folder_path: str,
+        settle: float = 2.0,
+        poll_interval: float = 1.0,
+        use_inotify: bool = True,
+    ):
+        """
+        Args:
+            folder_path: the folder of recordings
+            settle: seconds a trial must stay unchanged before it is reported
+            poll_interval: seconds between scans of the folder when polling
+            use_inotify: sleep on inotify events where available. The folder
+                is polled otherwise."""
+        self.folder_path = folder_path
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.seen = {}  # name: trial hash when last reported
+        self._pending = {}  # name: [trial hash, time it last changed]
+        self._inotify = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify = Inotify(folder_path)
+            except (OSError, AttributeError, TypeError):
+                # no inotify (or no libc), fall back on polling
+                self._inotify = None
+        self._rescan = True
+
+    @property
+    def backend(self) -> str:
+        return "polling" if self._inotify is None else "inotify"
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _signature(self, name: str):
+        """The trial hash of a file, or None once it is gone."""
+        path = os.path.join(self.folder_path, name)
+        if not os.path.isfile(path):
+            return None
+        try:
+            return trial_hash(path)
+        except OSError:
+            # a segment was compressed under our feet, look again later
+            return f"unreadable {time.monotonic()}"
+
+    def _touch(self, name: str, closed: bool = False) -> None:
+        signature = self._signature(name)
+        now = time.monotonic()
+        if closed:
+            # the writer is done, no need to wait for the file to settle
+            now -= self.settle
+        pending = self._pending.get(name)
+        if pending is not None:
+            if pending[0] != signature or closed:
+                self._pending[name] = [signature, now]
+        elif signature != self.seen.get(name):
+            self._pending[name] = [signature, now]
+
+    def _scan(self) -> None:
+        names = {trial_name(item) for item in os.listdir(self.folder_path)}
+        for name in sorted((names - {None}) | set(self.seen)):
+            self._touch(name)
+        self._rescan = False
+
+    def _wait(self, timeout: float) -> None:
+        if self._inotify is None:
+            time.sleep(timeout)
+            self._rescan = True
+            return
+        if self._pending:
+            # wake up in time for the next trial to settle
+            first = min(since for _, since in self._pending.values())
+            timeout = min(timeout, max(first + self.settle - time.monotonic(), 0))
+        for mask, item in self._inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                self._rescan = True
+                continue
+            name = trial_name(item)
+            if name is not None:
+                closed = item == name and bool(mask & IN_CLOSE_WRITE)
+                self._touch(name, closed)
+
+    def settled(self) -> tuple:
+        """The pending trials that stopped changing.
+
+        Returns:
+            (changed, removed) file paths, sorted"""
+        now = time.monotonic()
+        changed, removed = [], []
+        for name, (signature, since) in sorted(self._pending.items()):
+            current = self._signature(name)
+            if current != signature:
+                self._pending[name] = [current, now]
+                continue
+            if now - since < self.settle:
+                continue
+            del self._pending[name]
+            path = os.path.join(self.folder_path, name)
+            if current is None:
+                if self.seen.pop(name, None) is not None:
+                    removed.append(path)
+            elif self.seen.get(name) != current:
+                self.seen[name] = current
+                changed.append(path)
+        return changed, removed
+
+    def poll(self, timeout: float = None) -> tuple:
+        """Waits up to timeout seconds (poll_interval by default) for activity
+        in the folder, see settled. The first call reports every trial of the
+        folder once it settled."""
+        if self._rescan:
+            self._scan()
+        self._wait(self.poll_interval if timeout is None else timeout)
+        if self._rescan:
+            self._scan()
+        return self.settled()
+
+
+class FolderIngest:
+    """Keeps the parsed trials, segment index and feature matrices of a folder
+    up to date with the changes a FolderWatcher reports."""
+
+    def __init__(
+        self,
+        cache: TrialCache = None,
+        index: SegmentIndex = None,
+        window: int = None,
+        stride: int = 1,
+        features: tuple = DEFAULT_FEATURES,
+    ):
+        """
+        Args:
+            cache: TrialCache the trials are parsed into
+            index: optional SegmentIndex the presses of every trial are added to
+            window: window length of the feature matrices, None to skip them
+            stride: samples between window starts
+            features: names of FEATURES to compute"""
+        self.cache = cache
+        self.index = index
+        self.window = window
+        self.stride = stride
+        self.features = tuple(features)
+        self.trials = {}  # file_path: SerialData, or LazyTrial with a cache
+        self.matrices = {}  # file_path: FeatureMatrix
+        self.errors = {}  # file_path: why it could not be ingested
+
+    def ingest(self, file_path: str) -> None:
+        """Parses one new or changed trial and updates what depends on it."""
+        trial = SerialData(file_path, cache=self.cache)
+        if self.cache is not None:
+            # read back from the cache when it is used, instead of held
+            trial = LazyTrial(SerialData, file_path, cache=self.cache)
+        self.trials[file_path] = trial
+        if self.index is not None:
+            self.index.add_trial(file_path)
+        if self.window is not None:
+            self.matrices[file_path] = build_feature_matrices(
+                [file_path],
+                self.window,
+                self.stride,
+                self.features,
+                cache=self.cache,
+                workers=1,
+            )[0]
+
+    def remove(self, file_path: str) -> None:
+        self.trials.pop(file_path, None)
+        self.matrices.pop(file_path, None)
+        self.errors.pop(file_path, None)
+        if self.index is not None:
+            self.index.remove_trial(file_path)
+
+    def update(self, changed: list, removed: list) -> list:
+        """Ingests the changed trials and forgets the removed ones. Files that
+        could not be ingested, and the index directory if the index could not
+        be saved, are kept in errors.
+
+        Returns:
+            the file paths that were ingested"""
+        for file_path in removed:
+            self.remove(file_path)
+        ingested = []
+        for file_path in changed:
+            try:
+                self.ingest(file_path)
+            except (OSError, ValueError, IndexError) as error:
+                # not a recording (yet), it is retried when it changes again
+                self.remove(file_path)
+                self.errors[file_path] = str(error)
+                continue
+            self.errors.pop(file_path, None)
+            ingested.append(file_path)
+        if self.index is not None and self.index.index_dir is not None:
+            index_dir = self.index.index_dir
+            if ingested or removed or index_dir in self.errors:
+                try:
+                    self.index.save()
+                except (OSError, ValueError) as error:
+                    # still up to date in memory, saving is retried next update
+                    self.errors[index_dir] = f"could not save the index: {error}"
+                else:
+                    self.errors.pop(index_dir, None)
+        return ingested
+
+    def feature_matrices(self) -> list:
+        """The FeatureMatrix of every ingested trial, in the order
+        build_folder_features would give."""
+        return [self.matrices[path] for path in sorted(self.matrices)]
+
+
+def watch_folder(
+    watcher: FolderWatcher, ingest: FolderIngest, on_update=None, stop=None
+) -> None:
+    """Ingests the changes of a folder until stop() is True.
+
+    Args:
+        watcher: FolderWatcher of the folder
+        ingest: FolderIngest the changes go to
+        on_update: called with (ingested, removed) file paths after changes
+        stop: called before each poll, the loop ends when it returns True"""
+    while stop is None or not stop():
+        changed, removed = watcher.poll()
+        if changed or removed:
+            ingested = ingest.update(changed, removed)
+            if on_update is not None:
+                on_update(ingested, removed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest the trials of a data folder as they are recorded"
+    )
+    parser.add_argument("folder", help="Folder of recordings")
+    parser.add_argument("--cache", type=str, help="Trial cache directory")
+    parser.add_argument("--index", type=str, help="Segment index directory")
+    parser.add_argument("--window", type=int, help="Feature window in samples")
+    parser.add_argument("--stride", type=int, default=1, help="Feature stride")
+    parser.add_argument("--settle", type=float, default=2.0, help="Settle seconds")
+    parser.add_argument("--poll", action="store_true", help="Poll, skip inotify")
+    args = parser.parse_args()
+
+    cache = TrialCache(args.cache)
+    index = None if args.index is None else SegmentIndex(args.index, cache=cache)
+    ingest = FolderIngest(cache, index, args.window, args.stride)
+
+    skipped = {}
+
+    def report(ingested, removed):
+        for file_path in ingested:
+            print(f"Ingested {file_path}")
+        for file_path in removed:
+            print(f"Removed {file_path}")
+        for file_path, error in ingest.errors.items():
+            if skipped.get(file_path) != error:
+                print(f"Skipped {file_path}: {error}")
+        skipped.clear()
+        skipped.update(ingest.errors)
+
+    with FolderWatcher(args.folder, args.settle, use_inotify=not args.poll) as watcher:
+        print(f"Watching {args.folder} ({watcher.backend})")
+        try:
+            watch_folder(watcher, ingest, report)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,223 @@
-"""Visualize the ground truth generated by offset_generator.py."""
+"""Visualize the ground truth generated by offset_generator.py.
 
+Every sample is drawn as a translucent footprint (the tool in the cup-centric
+view, the cup in the tool-centric view). There are three ways to draw them:
+    - "patches": one matplotlib patch per sample. Slow past a few thousand.
+    - "collection": one collection artist per label, built from vectorized
+        vertices/offsets. Fine up to ~100k samples.
+    - "density": the number of footprints covering each pixel is rasterized
+        with numpy and shown as an image with the same color and opacity the
+        overlapping patches would have. Takes seconds for millions of samples.
+"""
+
+import matplotlib.collections as mcoll
+import matplotlib.colors as mcolors
 import matplotlib.patches as pch
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from scipy.signal import fftconvolve
+
+from capcup.offset_generator import Box, SuctionCup
+
+MODES = ("patches", "collection", "density")
+ALPHA = 0.05
+
+
+def pixel_centers(extent, resolution: float):
+    """x and y pixel centers covering extent (xmin, xmax, ymin, ymax)."""
+    xmin, xmax, ymin, ymax = extent
+    x = np.arange(xmin + resolution / 2, xmax, resolution)
+    y = np.arange(ymin + resolution / 2, ymax, resolution)
+    return x, y
+
+
+def rectangle_coverage(
+    x: np.ndarray, y: np.ndarray, width: float, height: float, extent, resolution
+) -> np.ndarray:
+    """Number of rectangles centered on (x, y) covering each pixel center.
+
+    Each rectangle adds +1/-1 to the four corners of its pixel range in a
+    difference array, which a cumulative sum along both axes turns into
+    counts, so the cost does not depend on the rectangle size."""
+    cx, cy = pixel_centers(extent, resolution)
+    i0 = np.searchsorted(cx, x - width / 2, side="left")
+    i1 = np.searchsorted(cx, x + width / 2, side="right")
+    j0 = np.searchsorted(cy, y - height / 2, side="left")
+    j1 = np.searchsorted(cy, y + height / 2, side="right")
+
+    shape = (len(cy) + 1, len(cx) + 1)
+    corners = np.concatenate(
+        [
+            np.ravel_multi_index(index, shape)
+            for index in ((j0, i0), (j0, i1), (j1, i0), (j1, i1))
+        ]
+    )
+    signs = np.repeat([1, -1, -1, 1], len(x))
+    diff = np.bincount(corners, signs, minlength=shape[0] * shape[1]).reshape(shape)
+    return diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1].round().astype(int)
+
+
+def circle_coverage(
+    x: np.ndarray, y: np.ndarray, radius: float, extent, resolution
+) -> np.ndarray:
+    """Number of circles centered on (x, y) covering each pixel center.
+
+    The centers are binned into a histogram (padded by the radius, so circles
+    centered outside the extent still count) and convolved with a disk."""
+    cx, cy = pixel_centers(extent, resolution)
+    pad = int(np.ceil(radius / resolution))
+    offsets = resolution * np.arange(-pad, pad + 1)
+    disk = np.hypot(*np.meshgrid(offsets, offsets)) <= radius
+
+    x_edges = cx[0] - resolution / 2 + resolution * np.arange(-pad, len(cx) + pad + 1)
+    y_edges = cy[0] - resolution / 2 + resolution * np.arange(-pad, len(cy) + pad + 1)
+    centers, _, _ = np.histogram2d(y, x, bins=(y_edges, x_edges))
+    return fftconvolve(centers, disk, mode="valid").round().astype(int)
+
+
+def coverage_image(counts: np.ndarray, color, alpha: float = ALPHA) -> np.ndarray:
+    """RGBA image of counts overlapping footprints of one color. n layers of
+    opacity alpha composite to an opacity of 1 - (1 - alpha)^n."""
+    image = np.empty(counts.shape + (4,))
+    image[..., :3] = mcolors.to_rgb(color)
+    image[..., 3] = 1 - (1 - alpha) ** counts
+    return image
+
+
+def draw_footprints(
+    ax,
+    x: np.ndarray,
+    y: np.ndarray,
+    shape: str,
+    size,
+    color: str,
+    mode: str = "patches",
+    resolution: float = 0.25,
+):
+    """Draws a translucent footprint centered on each (x, y).
 
-from offset_generator import Box, SuctionCup
+    Args:
+        ax: the matplotlib axis to draw on
+        x, y: footprint centers
+        shape: "rectangle" or "circle"
+        size: (width, height) of rectangles, or the radius of circles
+        color: footprint color
+        mode: one of MODES
+        resolution: pixel size of the "density" mode, in mm"""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, not {mode}")
 
+    if mode == "patches":
+        for x_center, y_center in zip(x, y):
+            if shape == "rectangle":
+                patch = pch.Rectangle(
+                    (x_center - size[0] / 2, y_center - size[1] / 2),
+                    *size,
+                    fill=True,
+                    color=color,
+                    alpha=ALPHA,
+                )
+            else:
+                patch = pch.Circle(
+                    (x_center, y_center),
+                    size,
+                    fill=True,
+                    color=color,
+                    linestyle="-",
+                    alpha=ALPHA,
+                )
+            ax.add_patch(patch)
+    elif mode == "collection":
+        if shape == "rectangle":
+            corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * np.divide(
+                size, 2
+            )
+            vertices = np.stack((x, y), axis=-1)[:, None, :] + corners
+            collection = mcoll.PolyCollection(vertices, color=color, alpha=ALPHA)
+        else:
+            collection = mcoll.EllipseCollection(
+                2 * size,
+                2 * size,
+                0,
+                units="xy",
+                offsets=np.stack((x, y), axis=-1),
+                offset_transform=ax.transData,
+                color=color,
+                alpha=ALPHA,
+            )
+        ax.add_collection(collection)
+    else:
+        extent = (*ax.get_xlim(), *ax.get_ylim())
+        if shape == "rectangle":
+            counts = rectangle_coverage(x, y, *size, extent, resolution)
+        else:
+            counts = circle_coverage(x, y, size, extent, resolution)
+        # Snap the extent to whole pixels so the image lines up with the data
+        cx, cy = pixel_centers(extent, resolution)
+        ax.imshow(
+            coverage_image(counts, color),
+            extent=(
+                cx[0] - resolution / 2,
+                cx[-1] + resolution / 2,
+                cy[0] - resolution / 2,
+                cy[-1] + resolution / 2,
+            ),
+            origin="lower",
+            interpolation="nearest",
+        )
 
-def cup_centric(labeled_data: pd.DataFrame, box: Box, cup: SuctionCup):
+
+def cup_centric(
+    labeled_data: pd.DataFrame,
+    box: Box,
+    cup: SuctionCup,
+    mode: str = "patches",
+    resolution: float = 0.25,
+):
+    """Tool footprints relative to the cup, one subplot per label. mode and
+    resolution are passed on to draw_footprints."""
     labels = labeled_data["label"].unique()
 
     fig, axs = plt.subplots(len(labels))
-    for ax, label in zip(axs, labels):
+    for ax, label in zip(np.atleast_1d(axs), labels):
         cup_patch = pch.Circle(
             (0, 0), cup.diameter / 2, fill=False, color="black", linestyle="-"
         )
         ax.add_patch(cup_patch)
-        samples = labeled_data[labeled_data["label"] == label]
-        for _, sample in samples.iterrows():
-            tool_patch = pch.Rectangle(
-                (sample["x"] - box.x_size / 2, sample["y"] - box.y_size / 2),
-                box.x_size,
-                box.y_size,
-                fill=True,
-                color="blue",
-                alpha=0.05,
-            )
-            ax.add_patch(tool_patch)
-
         ax.set_xlim(-box.x_size / 2 - cup.diameter, box.x_size / 2 + cup.diameter)
         ax.set_ylim(-box.y_size / 2 - cup.diameter, box.y_size / 2 + cup.diameter)
+
+        samples = labeled_data[labeled_data["label"] == label]
+        draw_footprints(
+            ax,
+            samples["x"].to_numpy(),
+            samples["y"].to_numpy(),
+            "rectangle",
+            (box.x_size, box.y_size),
+            "blue",
+            mode,
+            resolution,
+        )
+
         ax.set_aspect("equal")
         ax.set_title(label)
     fig.suptitle("Cup-Centric View")
 
 
-def tool_centric(labeled_data: pd.DataFrame, box: Box, cup: SuctionCup):
+def tool_centric(
+    labeled_data: pd.DataFrame,
+    box: Box,
+    cup: SuctionCup,
+    mode: str = "patches",
+    resolution: float = 0.25,
+):
+    """Cup footprints relative to the tool, one subplot per label. mode and
+    resolution are passed on to draw_footprints."""
     labels = labeled_data["label"].unique()
 
     fig, axs = plt.subplots(len(labels))
-    for ax, label in zip(axs, labels):
+    for ax, label in zip(np.atleast_1d(axs), labels):
         tool_patch = pch.Rectangle(
             (-box.x_size / 2, -box.y_size / 2),
             box.x_size,
@@ -49,21 +227,21 @@ def tool_centric(labeled_data: pd.DataFrame, box: Box, cup: SuctionCup):
             linestyle="-",
         )
         ax.add_patch(tool_patch)
+        ax.set_xlim(-box.x_size / 2 - cup.diameter, box.x_size / 2 + cup.diameter)
+        ax.set_ylim(-box.y_size / 2 - cup.diameter, box.y_size / 2 + cup.diameter)
 
         samples = labeled_data[labeled_data["label"] == label]
-        for _, sample in samples.iterrows():
-            cup_patch = pch.Circle(
-                (-sample["x"], -sample["y"]),
-                cup.diameter / 2,
-                fill=True,
-                color="red",
-                linestyle="-",
-                alpha=0.05,
-            )
-            ax.add_patch(cup_patch)
+        draw_footprints(
+            ax,
+            -samples["x"].to_numpy(),
+            -samples["y"].to_numpy(),
+            "circle",
+            cup.diameter / 2,
+            "red",
+            mode,
+            resolution,
+        )
 
-        ax.set_xlim(-box.x_size / 2 - cup.diameter, box.x_size / 2 + cup.diameter)
-        ax.set_ylim(-box.y_size / 2 - cup.diameter, box.y_size / 2 + cup.diameter)
         ax.set_aspect("equal")
         ax.set_title(label)
     fig.suptitle("Tool-Centric View")
@@ -75,9 +253,11 @@ def main():
     labeled_data = pd.read_csv(file_name)
     box = Box(x_size=100, y_size=100)
     cup = SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
-    cup_centric(labeled_data, box, cup)
+    # Individual patches are only practical for small ground truth files
+    mode = "patches" if len(labeled_data) < 5000 else "density"
+    cup_centric(labeled_data, box, cup, mode)
     plt.tight_layout()
-    tool_centric(labeled_data, box, cup)
+    tool_centric(labeled_data, box, cup, mode)
     plt.tight_layout()
     plt.show()
 
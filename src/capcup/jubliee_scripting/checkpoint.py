@@ -0,0 +1,171 @@
+"""Progress tracking for long Jubilee runs, so an interrupted run (network
+drop, e-stop) can resume from the last completed pose instead of restarting.
+
+Progress is kept in a JSON run manifest next to the ground truth CSV. It is
+rewritten atomically after every completed pose and records each session the
+run took, ie. which rows were completed when, so recordings of the separate
+sessions can be joined back up against the ground truth.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from gcode_program import (
+    SYNC,
+    GcodeProgram,
+    compile_ground_truth_end,
+    compile_ground_truth_rows,
+    compile_ground_truth_setup,
+    read_ground_truth,
+    submit,
+)
+
+
+def write_json_atomic(file_path: str, data) -> None:
+    """Writes JSON to a temporary file and moves it into place, so the file is
+    never left half written if the process dies mid-write."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def manifest_path(csv_path: str) -> str:
+    """The default run manifest of a ground truth CSV."""
+    return os.path.splitext(csv_path)[0] + ".progress.json"
+
+
+class RunManifest:
+    """Checkpoints of a run over the rows of a ground truth CSV.
+
+    Attributes:
+        csv_path: the ground truth CSV being run
+        completed_row: index of the last completed row, -1 if none
+        sessions: one dictionary per (possibly interrupted) session with its
+            first and last completed row, start and end time, and whether it
+            finished the run
+    """
+
+    def __init__(self, file_path: str, csv_path: str):
+        """Loads the manifest if it exists, otherwise starts a new run.
+
+        Args:
+            file_path: the manifest JSON
+            csv_path: the ground truth CSV being run"""
+        self.file_path = file_path
+        self.csv_path = csv_path
+        self.completed_row = -1
+        self.time = None
+        self.position = None
+        self.sessions = []
+        if os.path.isfile(file_path):
+            with open(file_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if os.path.abspath(data["csv_path"]) != os.path.abspath(csv_path):
+                raise ValueError(
+                    f"{file_path} tracks {data['csv_path']}, not {csv_path}"
+                )
+            self.completed_row = data["completed_row"]
+            self.time = data["time"]
+            self.position = data["position"]
+            self.sessions = data["sessions"]
+
+    @property
+    def next_row(self) -> int:
+        """The row to resume from."""
+        return self.completed_row + 1
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.sessions) and self.sessions[-1]["finished"]
+
+    def start_session(self) -> dict:
+        """Starts a session from the next row. An unfinished previous session
+        is marked as interrupted after its last completed row."""
+        if self.sessions and not self.sessions[-1]["finished"]:
+            self.sessions[-1]["interrupted"] = True
+        now = time.time()
+        self.sessions.append(
+            {
+                "first_row": self.next_row,
+                "last_row": self.completed_row,
+                "start_time": now,
+                "end_time": now,
+                "finished": False,
+                "interrupted": False,
+            }
+        )
+        self.save()
+        return self.sessions[-1]
+
+    def complete(self, row: int, position) -> None:
+        """Checkpoints a completed row and the position it was run at."""
+        self.completed_row = row
+        self.time = time.time()
+        self.position = [float(value) for value in position]
+        self.sessions[-1]["last_row"] = row
+        self.sessions[-1]["end_time"] = self.time
+        self.save()
+
+    def finish(self) -> None:
+        self.sessions[-1]["finished"] = True
+        self.sessions[-1]["end_time"] = time.time()
+        self.save()
+
+    def save(self) -> None:
+        write_json_atomic(
+            self.file_path,
+            {
+                "csv_path": self.csv_path,
+                "completed_row": self.completed_row,
+                "time": self.time,
+                "position": self.position,
+                "sessions": self.sessions,
+            },
+        )
+
+
+def resume_ground_truth(
+    jubilee,
+    csv_path: str,
+    manifest: RunManifest,
+    center,
+    dwell: float,
+    sleep=time.sleep,
+) -> None:
+    """Runs the rows of a ground truth CSV not completed yet, checkpointing
+    after every pose. Each pose is compiled and sent in a few batches instead
+    of one network round trip per command, and ends in a sync. A pose is only
+    checkpointed once the controller reports it has run to the end (see
+    submit), so a pose that was sent but interrupted is pressed again. sleep
+    is passed on to submit."""
+    rows = read_ground_truth(csv_path)
+    session = manifest.start_session()
+    print(
+        f"Session {len(manifest.sessions)}: rows {session['first_row']}-{len(rows) - 1}"
+    )
+
+    program = GcodeProgram(jubilee.position)
+    compile_ground_truth_setup(program, center)
+    submit(jubilee, program, sleep=sleep)
+
+    for idx in range(manifest.next_row, len(rows)):
+        program = GcodeProgram(jubilee.position)
+        compile_ground_truth_rows(program, rows[idx : idx + 1], center, dwell)
+        program.gcode(SYNC)
+        submit(jubilee, program, sleep=sleep)
+        manifest.complete(idx, rows[idx][:3])
+
+    program = GcodeProgram(jubilee.position)
+    compile_ground_truth_end(program, center)
+    submit(jubilee, program, sleep=sleep)
+    manifest.finish()
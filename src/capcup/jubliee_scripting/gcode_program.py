@@ -0,0 +1,333 @@
+"""Compiles Jubilee runs into G-code programs that are sent in a few batches.
+
+The scripts send every dwell, sync, flag toggle and move as its own
+jubilee.gcode(...) round trip, which adds network latency and jitter to every
+actuation. A GcodeProgram records the same calls instead (it has the gcode,
+move_xyz_absolute and position of a JubileeMotionController), so a whole run
+can be compiled up front and submitted as newline-joined batches.
+
+The controller only buffers a few commands, and a batch sent while an earlier
+G4 or M400 is still running can be rejected. submit therefore waits for the
+controller to report itself idle (M408) after every batch. Batches are only
+cut while the actuation flag is low, so the round trip and the wait between
+two batches never fall inside an actuation, and submit sleeps through the
+least time a batch can take before it first polls.
+"""
+
+import csv
+import json
+import time
+
+import numpy as np
+
+from capcup.visit_order import move_time
+
+FLAG_SETUP = 'M950 P4 C"io4.out"'  # set connector 4 as the actuation flag
+FLAG_ON = "M42 P4 S1"
+FLAG_OFF = "M42 P4 S0"
+SYNC = "M400"
+STATUS = "M408 S0"  # JSON status report, "status" is "I" when idle
+CLEAR = np.array([0, 0, 5])
+
+
+def move_command(x: float = None, y: float = None, z: float = None) -> str:
+    """The absolute move sent for move_xyz_absolute, skipping unset axes."""
+    axes = [
+        f"{axis}{value:.3f}"
+        for axis, value in zip("XYZ", (x, y, z))
+        if value is not None
+    ]
+    return " ".join(["G0"] + axes)
+
+
+class GcodeProgram:
+    """A list of G-code lines, built with the same calls the scripts make on a
+    JubileeMotionController."""
+
+    def __init__(self, position=(0.0, 0.0, 0.0)):
+        """
+        Args:
+            position: the tool position the program starts from"""
+        self.lines = []
+        self.start = np.array(position, dtype=float)
+        self._position = self.start.copy()
+
+    @property
+    def position(self) -> np.ndarray:
+        return self._position.copy()
+
+    def gcode(self, command: str) -> None:
+        self.lines.extend(line for line in command.splitlines() if line.strip())
+
+    def move_xyz_absolute(self, x: float = None, y: float = None, z: float = None):
+        self.gcode(move_command(x, y, z))
+        for idx, value in enumerate((x, y, z)):
+            if value is not None:
+                self._position[idx] = value
+
+    def dwell(self, milliseconds: float) -> None:
+        self.gcode(f"G4 P{milliseconds}")
+
+    def actuate_absolute(self, coordinate) -> None:
+        """Moves with the actuation flag high, as concentric_cycles does."""
+        self.gcode(SYNC)
+        self.gcode(FLAG_ON)
+        self.gcode(SYNC)
+        self.move_xyz_absolute(*coordinate)
+        self.gcode(SYNC)
+        self.gcode(FLAG_OFF)
+
+    def load_unload(self, dwell: float, displacements) -> None:
+        """concentric_cycles.load_unload: dwell, then move to each z
+        displacement and finally back to the starting z, each with the flag
+        high while moving."""
+        current_z = self._position[2]
+        for displacement in displacements:
+            self.dwell(dwell)
+            self.actuate_absolute((None, None, displacement))
+        self.dwell(dwell)
+        self.actuate_absolute((None, None, current_z))
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+    def save(self, file_path: str) -> None:
+        """Writes the program, eg. to upload and run it as a job file."""
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(self.text())
+
+    def line_groups(self) -> list:
+        """The lines in groups that are sent together: each actuation, from
+        FLAG_ON to FLAG_OFF, is one group and every other line its own."""
+        groups, group = [], []
+        for line in self.lines:
+            group.append(line)
+            if line == FLAG_ON or (group[0] == FLAG_ON and line != FLAG_OFF):
+                continue
+            groups.append(group)
+            group = []
+        if group:
+            groups.append(group)
+        return groups
+
+    def batches(self, max_bytes: int = 200) -> list:
+        """Splits the program into newline-joined batches of whole lines, each
+        at most max_bytes long (the controller's command buffer is small).
+        Batches are only cut between actuations, so a single actuation longer
+        than max_bytes makes a longer batch."""
+        batches, batch, size = [], [], 0
+        for group in self.line_groups():
+            group_size = sum(len(line) + 1 for line in group)
+            if batch and size + group_size > max_bytes:
+                batches.append("\n".join(batch))
+                batch, size = [], 0
+            batch += group
+            size += group_size
+        if batch:
+            batches.append("\n".join(batch))
+        return batches
+
+    def batch_durations(self, max_bytes: int = 200) -> list:
+        """The least time, in seconds, each of batches(max_bytes) takes to
+        run: its dwells, and its moves at the XY speed limit of visit_order
+        (Z is slower)."""
+        durations = []
+        position = self.start.copy()
+        for batch in self.batches(max_bytes):
+            duration = 0.0
+            for line in batch.splitlines():
+                words = line.split()
+                if words[0] == "G4":
+                    unit, value = words[1][0], float(words[1][1:])
+                    duration += value / 1000 if unit == "P" else value
+                elif words[0] in ("G0", "G1"):
+                    target = position.copy()
+                    for word in words[1:]:
+                        if word[0] in "XYZ":
+                            target["XYZ".index(word[0])] = float(word[1:])
+                    duration += float(move_time(np.abs(target - position).max()))
+                    position = target
+            durations.append(duration)
+        return durations
+
+
+def machine_idle(jubilee) -> bool:
+    """Whether the controller has finished every command sent to it, from its
+    M408 status report."""
+    reply = jubilee.gcode(STATUS)
+    try:
+        return json.loads(reply)["status"] == "I"
+    except (TypeError, ValueError, KeyError) as error:
+        raise ValueError(f"Unexpected controller status report: {reply!r}") from error
+
+
+def wait_until_idle(
+    jubilee, poll: float = 0.05, sleep=time.sleep, expected: float = 0.0
+) -> int:
+    """Waits until the controller is idle.
+
+    Args:
+        poll: least seconds between status reports
+        sleep: called with the seconds to wait, eg. a simulator's virtual clock
+        expected: the least seconds the commands sent take. They are slept
+            through before the first status report, and a tenth of them
+            between further reports, so long dwells are polled only a few times.
+
+    Returns:
+        the number of round trips made"""
+    if expected > 0:
+        sleep(expected)
+    round_trips = 1
+    while not machine_idle(jubilee):
+        sleep(max(poll, expected / 10))
+        round_trips += 1
+    return round_trips
+
+
+def submit(
+    jubilee,
+    program: GcodeProgram,
+    max_bytes: int = 200,
+    poll: float = 0.05,
+    sleep=time.sleep,
+) -> int:
+    """Sends a program to a JubileeMotionController (or a stand-in) in batches.
+
+    Each batch is only sent once the controller has run the previous one, so
+    the small command buffer never overflows, and submit returns once the
+    whole program has run. See wait_until_idle for poll and sleep.
+
+    Returns:
+        the number of round trips made"""
+    round_trips = 0
+    batches = program.batches(max_bytes)
+    for batch, duration in zip(batches, program.batch_durations(max_bytes)):
+        jubilee.gcode(batch)
+        round_trips += 1 + wait_until_idle(jubilee, poll, sleep, duration)
+    return round_trips
+
+
+def end_signal(program: GcodeProgram, origin) -> None:
+    """Quick dance over the origin to signal the end, as the scripts do."""
+    done_offset = np.array([10, 0, 0])
+    program.move_xyz_absolute(z=(origin + CLEAR)[-1])
+    program.move_xyz_absolute(*(origin + CLEAR))
+    for _ in range(5):
+        program.move_xyz_absolute(*(origin + CLEAR))
+        program.move_xyz_absolute(*(origin + CLEAR + done_offset))
+    program.move_xyz_absolute(*(origin + CLEAR))
+
+
+def compile_ground_truth_rows(
+    program: GcodeProgram, rows, center, dwell: float = 5000
+) -> None:
+    """Appends the press and release of each ground truth pose, as in
+    ground_truth_runner.main. rows are (x, y, z, ...) sequences."""
+    for row in rows:
+        position = np.array(row[:3], dtype=float)
+        program.move_xyz_absolute(*position[:-1])
+        program.dwell(dwell)
+        program.actuate_absolute((None, None, position[-1]))
+        program.dwell(dwell)
+        program.actuate_absolute((None, None, center[-1]))
+
+
+def read_ground_truth(file_path: str) -> list:
+    """The rows of a ground truth CSV, without the header."""
+    with open(file_path, newline="", encoding="utf-8") as csvfile:
+        return list(csv.reader(csvfile, delimiter=","))[1:]
+
+
+def ground_truth_center(lip_to_board_height: float = 6.7) -> np.ndarray:
+    """Where the tool waits between ground truth poses."""
+    return np.array([0, 0, lip_to_board_height + 5])
+
+
+def compile_ground_truth_setup(program: GcodeProgram, center) -> None:
+    """Sets up the actuation flag and moves over the center."""
+    program.gcode(FLAG_SETUP)
+    program.move_xyz_absolute(z=center[-1])
+    program.move_xyz_absolute(*center)
+
+
+def compile_ground_truth_end(program: GcodeProgram, center) -> None:
+    """Quick dance over the center to signal the end of a ground truth run."""
+    done_offset = np.array([10, 0, 0])
+    for _ in range(4):
+        program.move_xyz_absolute(*center)
+        program.move_xyz_absolute(*(center + done_offset))
+    program.move_xyz_absolute(*center)
+
+
+def compile_ground_truth(
+    file_path: str,
+    lip_to_board_height: float = 6.7,
+    dwell: float = 5000,
+    position=(0.0, 0.0, 0.0),
+) -> GcodeProgram:
+    """ground_truth_runner.main as a single program."""
+    center = ground_truth_center(lip_to_board_height)
+    program = GcodeProgram(position)
+    compile_ground_truth_setup(program, center)
+    compile_ground_truth_rows(program, read_ground_truth(file_path), center, dwell)
+    compile_ground_truth_end(program, center)
+    return program
+
+
+def _start(suction_cup, position) -> GcodeProgram:
+    program = GcodeProgram(position)
+    program.gcode(FLAG_SETUP)
+    program.gcode(FLAG_OFF)
+    program.move_xyz_absolute(z=(suction_cup.origin + CLEAR)[-1])
+    program.move_xyz_absolute(*(suction_cup.origin + CLEAR))
+    return program
+
+
+def compile_ring_cycles(
+    suction_cup, dwell: float = 5000, cycles: int = 1, position=(0.0, 0.0, 0.0)
+) -> GcodeProgram:
+    """concentric_cycles.ring_cycles: press 8 points around the lip."""
+    program = _start(suction_cup, position)
+    thetas = np.linspace(-np.pi / 2 + np.pi / 8, -np.pi / 2 - np.pi / 8 + 2 * np.pi, 8)
+    offsets = suction_cup.radius * np.stack(
+        (np.cos(thetas), np.sin(thetas), np.zeros_like(thetas)), axis=-1
+    )
+    for _ in range(cycles):
+        for sample in suction_cup.origin + offsets:
+            program.move_xyz_absolute(*sample)
+            program.load_unload(dwell, [suction_cup.lip_height - 3])
+    end_signal(program, suction_cup.origin)
+    return program
+
+
+def compile_cup_cycles(
+    suction_cup,
+    dwell: float = 5000,
+    actuation: float = 3,
+    cycles: int = 1,
+    position=(0.0, 0.0, 0.0),
+) -> GcodeProgram:
+    """concentric_cycles.cup_cycles with a fixed number of cycles."""
+    program = _start(suction_cup, position)
+    program.move_xyz_absolute(*suction_cup.origin)
+    for _ in range(cycles):
+        program.load_unload(dwell, [suction_cup.origin[-1] - actuation])
+    end_signal(program, suction_cup.origin)
+    return program
+
+
+def compile_triangles(
+    suction_cup, cycles: int = 1, position=(0.0, 0.0, 0.0)
+) -> GcodeProgram:
+    """concentric_cycles.triangles with a fixed number of cycles."""
+    program = _start(suction_cup, position)
+    actuation = np.array([0, 0, suction_cup.max_deflection])
+    program.move_xyz_absolute(*suction_cup.origin)
+    for _ in range(cycles):
+        program.actuate_absolute(suction_cup.origin - actuation)
+        program.gcode(SYNC)
+        program.actuate_absolute(suction_cup.origin)
+        program.gcode(SYNC)
+        program.gcode(SYNC)  # finish moves before moving on to next loop.
+    end_signal(program, suction_cup.origin)
+    return program
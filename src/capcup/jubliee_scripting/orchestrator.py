@@ -0,0 +1,210 @@
+"""Runs a Jubilee experiment and records the mux board in one process.
+
+The Jubilee commands and the serial acquisition share one asyncio event loop.
+The blocking controller calls run in a worker thread, so sampling carries on
+while a command waits on the network. Every commanded pose, move and flag
+toggle is stamped into the recording as an event line (see
+serial_data_formatter.format_event), so ground truth is linked to the data by
+time rather than by press order. Flags are stamped when their command
+returned. The controller queues moves and returns right away, so moves are
+stamped when the sync (M400) that follows them returns, ie. once the motion
+has finished. A move followed by anything but a move or a sync gets a sync
+sent after it.
+
+Recording starts before the first command, once the board is streaming, and
+stops as soon as the last step has synced (plus an optional tail), so no
+idle timeout is needed at either end.
+
+    python orchestrator.py ground_truth.csv -f run
+    python orchestrator.py ground_truth.csv -f run --stand-in --dwell 200
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from capcup.serial_data_formatter import format_event
+from capcup.serial_stream import SerialDecoder, parse_line
+from gcode_program import (
+    FLAG_OFF,
+    FLAG_ON,
+    SYNC,
+    GcodeProgram,
+    compile_ground_truth_rows,
+    compile_ground_truth_setup,
+    ground_truth_center,
+    read_ground_truth,
+)
+from stand_in import MOVE_PATTERN, StandInJubilee, StandInSerial
+
+
+class Orchestrator:
+    """Sends steps of G-code to a Jubilee while recording a serial port."""
+
+    def __init__(
+        self,
+        jubilee,
+        port,
+        output,
+        poll_interval: float = 0.002,
+        tail: float = 0.0,
+        ready_timeout: float = 10.0,
+    ):
+        """
+        Args:
+            jubilee: a JubileeMotionController, or a stand-in
+            port: the mux board's pyserial port, or a StandInSerial
+            output: text file the samples and events are written to, eg. an
+                open file or a recording_segments.SegmentWriter
+            poll_interval: seconds between polls of an idle port
+            tail: seconds to keep recording after the last command
+            ready_timeout: seconds to wait for the board's first sample"""
+        self.jubilee = jubilee
+        self.port = port
+        self.output = output
+        self.poll_interval = poll_interval
+        self.tail = tail
+        self.ready_timeout = ready_timeout
+        self.samples = 0
+        self.events = 0
+        self._ready = None
+        self._stopping = None
+        self._moved = False  # a move was sent and has not been synced yet
+
+    def stamp(self, kind: str, **payload) -> None:
+        """Writes an event line at the current host time."""
+        self.output.write(format_event(time.time(), kind, **payload))
+        self.events += 1
+
+    async def acquire(self) -> None:
+        """Records the port until the run is stopped."""
+        decoder = SerialDecoder()
+        while True:
+            waiting = self.port.in_waiting
+            stopping = self._stopping.is_set()
+            if waiting:
+                chunk = self.port.read(waiting).decode("utf-8", errors="replace")
+                for line in decoder.lines(chunk):
+                    try:
+                        parse_line(line)
+                    except ValueError:
+                        continue
+                    self.output.write(f"{time.time()} {line}\n")
+                    self.samples += 1
+                    self._ready.set()
+                self.output.flush()
+            if stopping:
+                # the port was drained once more after the stop
+                return
+            # yield even while the board keeps the port busy, so the commands
+            # sharing the loop can resume
+            await asyncio.sleep(self.poll_interval if not waiting else 0)
+
+    async def command(self, line: str) -> None:
+        """Sends one G-code line and stamps it once it returned. A move is
+        stamped once the next sync returned, which is sent first if line is
+        neither a move nor a sync."""
+        moving = MOVE_PATTERN.match(line) is not None
+        if self._moved and not moving and line != SYNC:
+            await self.command(SYNC)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.jubilee.gcode, line)
+        if line == FLAG_ON or line == FLAG_OFF:
+            self.stamp("flag", value=int(line == FLAG_ON))
+        elif moving:
+            self._moved = True
+        elif line == SYNC and self._moved:
+            self._moved = False
+            self.stamp("move", position=np.round(self.jubilee.position, 3).tolist())
+
+    async def run_steps(self, steps) -> None:
+        """Records while sending steps, then stops.
+
+        Args:
+            steps: (kind, payload, lines) tuples. The event kind with payload
+                is stamped before the step's G-code lines are sent, and a
+                step with no kind is only sent. A step ending in a move is
+                synced before the next one starts."""
+        self._ready = asyncio.Event()
+        self._stopping = asyncio.Event()
+        acquisition = asyncio.create_task(self.acquire())
+        try:
+            await asyncio.wait_for(self._ready.wait(), self.ready_timeout)
+            self.stamp("start")
+            for kind, payload, lines in steps:
+                if kind is not None:
+                    self.stamp(kind, **payload)
+                for line in lines:
+                    await self.command(line)
+                if self._moved:
+                    await self.command(SYNC)
+            if self.tail:
+                await asyncio.sleep(self.tail)
+            self.stamp("end")
+        finally:
+            self._stopping.set()
+            await acquisition
+            self.output.flush()
+
+    def run(self, steps) -> None:
+        asyncio.run(self.run_steps(steps))
+
+
+def ground_truth_steps(rows, center, dwell: float = 5000, position=(0, 0, 0)):
+    """Steps pressing every ground truth row, with a "pose" event per row
+    holding its index and (x, y, z). The last step syncs, so the run only ends
+    once the tool is back over the center."""
+    program = GcodeProgram(position)
+    compile_ground_truth_setup(program, center)
+    yield None, {}, program.lines
+    for idx, row in enumerate(rows):
+        program = GcodeProgram(program.position)
+        compile_ground_truth_rows(program, [row], center, dwell)
+        x, y, z = (float(value) for value in row[:3])
+        yield "pose", {"row": idx, "x": x, "y": y, "z": z}, program.lines
+    program = GcodeProgram(program.position)
+    program.move_xyz_absolute(*center)
+    program.gcode(SYNC)
+    yield None, {}, program.lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv", help="Ground truth CSV")
+    parser.add_argument("-f", "--file", default="run", help="Recording name")
+    parser.add_argument("--dwell", type=float, default=5000, help="Dwell in ms")
+    parser.add_argument("--tail", type=float, default=0.5, help="Seconds after")
+    parser.add_argument(
+        "--stand-in",
+        action="store_true",
+        help="Run against local stand-ins for the Jubilee and the board",
+    )
+    args = parser.parse_args()
+
+    if args.stand_in:
+        jubilee = StandInJubilee(dwell=True, speed=100)
+        port = StandInSerial(jubilee)
+    else:
+        import serial
+        from jubilee_controller.jubilee_controller import JubileeMotionController
+
+        jubilee = JubileeMotionController("192.168.2.5", debug=True)
+        port = serial.Serial("/dev/ttyACM0", 115200, timeout=1)
+
+    steps = ground_truth_steps(
+        read_ground_truth(args.csv), ground_truth_center(6.7), args.dwell
+    )
+    with open(args.file + ".csv", "w", encoding="utf-8") as output:
+        orchestrator = Orchestrator(jubilee, port, output, tail=args.tail)
+        orchestrator.run(steps)
+    port.close()
+    print(
+        f"Recorded {orchestrator.samples} samples and {orchestrator.events} "
+        f"events to {args.file}.csv"
+    )
+
+
+if __name__ == "__main__":
+    main()
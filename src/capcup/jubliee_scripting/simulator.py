@@ -0,0 +1,261 @@
+"""Dry runs of Jubilee scripts on a simulated controller, to predict how long a
+run takes and when the actuation flag toggles before booking the machine.
+
+The controller is modelled the way RepRapFirmware behaves for these scripts:
+moves are queued and return immediately, G4 and M400 wait for the queue to
+empty, and M42 toggles the flag as soon as it is processed (which is why the
+scripts sync with M400 around it). Every gcode() call also costs a network
+round trip. Scripts that loop on time.time() run on a virtual clock, so a ten
+minute campaign is simulated in a fraction of a second.
+"""
+
+import argparse
+import json
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from capcup.visit_order import XY_ACCELERATION, XY_SPEED
+from gcode_program import compile_ground_truth, submit
+from stand_in import AXIS_PATTERN, MOVE_PATTERN, StandInJubilee
+
+# Assumed Z motion limits of the Jubilee, see visit_order for XY.
+Z_SPEED = 10.0  # mm/s
+Z_ACCELERATION = 100.0  # mm/s^2
+LATENCY = 0.005  # s per network round trip
+DWELL_PATTERN = re.compile(r"([PS])(\d+(?:\.\d*)?)")
+
+
+def axis_time(distance: float, speed: float, acceleration: float) -> float:
+    """Duration of a move along one axis with a trapezoidal (or triangular,
+    for short moves) velocity profile, starting and ending at rest. The scalar
+    version of visit_order.move_time, which is much faster per move."""
+    distance = abs(distance)
+    if distance >= speed**2 / acceleration:
+        return distance / speed + speed / acceleration
+    return 2 * math.sqrt(distance / acceleration)
+
+
+class VirtualClock:
+    """Stands in for the time module in a simulated script."""
+
+    def __init__(self, jubilee: "SimulatedJubilee"):
+        self.jubilee = jubilee
+
+    def time(self) -> float:
+        return self.jubilee.clock
+
+    monotonic = perf_counter = time
+
+    def sleep(self, seconds: float) -> None:
+        self.jubilee.clock += seconds
+
+
+class SimulatedJubilee(StandInJubilee):
+    """A StandInJubilee that also predicts when every command happens.
+
+    Attributes:
+        clock: simulated host time in seconds, ie. when the next command is
+            sent
+        motion_end: time at which the queued moves are finished
+    """
+
+    def __init__(
+        self,
+        address: str = "simulator",
+        debug: bool = False,
+        latency: float = LATENCY,
+        position=(0.0, 0.0, 0.0),
+        max_speed=(XY_SPEED, XY_SPEED, Z_SPEED),
+        max_acceleration=(XY_ACCELERATION, XY_ACCELERATION, Z_ACCELERATION),
+    ):
+        """
+        Args:
+            address: ignored, for the JubileeMotionController signature
+            debug: print every command received
+            latency: seconds each gcode() round trip takes
+            position: the starting tool position
+            max_speed: per axis speed limits, in mm/s
+            max_acceleration: per axis acceleration limits, in mm/s^2"""
+        super().__init__(address, debug, latency, False, position)
+        self.max_speed = tuple(max_speed)
+        self.max_acceleration = tuple(max_acceleration)
+        self.feedrate = None  # mm/s, set by the F word of G0/G1
+        self.clock = 0.0
+        self._sent = 0.0  # when the last command other than M408 was sent
+        self._polled = False  # whether the status was polled since
+        self.motion_end = 0.0
+        self._xyz = [float(value) for value in position]
+        # (start, end, command, flag) of every command, see timeline()
+        self._events = []
+
+    @property
+    def position(self) -> np.ndarray:
+        return np.array(self._xyz)
+
+    @property
+    def duration(self) -> float:
+        """Time until everything sent so far has finished."""
+        return max(self.clock, self.motion_end)
+
+    def gcode(self, command: str) -> str:
+        self.round_trips += 1
+        if command.startswith("M408"):
+            self._polled = True
+        else:
+            self._sent, self._polled = self.clock, False
+        self.clock += self.latency
+        replies = []
+        for line in command.splitlines():
+            line = line.strip()
+            if line:
+                replies.append(self._execute(line))
+        return "\n".join(reply for reply in replies if reply)
+
+    def submit_sleep(self, seconds: float) -> None:
+        """The sleep of submit on the virtual clock. A gcode() call returns
+        only once its waits are done, so the sleep through a batch's expected
+        duration counts from when the batch was sent."""
+        if self._polled:
+            self.clock += seconds
+        else:
+            self.clock = max(self.clock, self._sent + seconds)
+
+    def status(self) -> str:
+        return json.dumps({"status": "I" if self.clock >= self.motion_end else "B"})
+
+    def _execute(self, line: str) -> str:
+        if line.startswith("M408"):
+            return self.status()
+        if self.debug:
+            print(line)
+        self.commands.append(line)
+        start = self.clock
+        if MOVE_PATTERN.match(line):
+            start = max(self.clock, self.motion_end)
+            self.motion_end = start + self._move(line)
+            end = self.motion_end
+        elif line == "M400":
+            self.clock = end = self.duration
+        elif line.startswith("G4"):
+            words = dict(DWELL_PATTERN.findall(line))
+            seconds = float(words.get("P", 0)) / 1000 + float(words.get("S", 0))
+            start = self.duration
+            self.clock = self.motion_end = end = start + seconds
+        else:
+            if line.startswith("M42 P4"):
+                self.flag = int(line.split("S")[-1])
+            end = start
+        self._events.append((start, end, line, self.flag))
+        return ""
+
+    def _move(self, line: str) -> float:
+        """Updates the position and returns the duration of a move."""
+        target = list(self._xyz)
+        for axis, value in AXIS_PATTERN.findall(line):
+            if axis == "F":
+                self.feedrate = float(value) / 60
+            else:
+                target["XYZ".index(axis)] = float(value)
+        deltas = [end - start for start, end in zip(self._xyz, target)]
+        self._xyz = target
+        duration = max(
+            axis_time(delta, speed, acceleration)
+            for delta, speed, acceleration in zip(
+                deltas, self.max_speed, self.max_acceleration
+            )
+        )
+        if self.feedrate:
+            length = math.sqrt(sum(delta**2 for delta in deltas))
+            duration = max(
+                duration,
+                axis_time(length, self.feedrate, min(self.max_acceleration)),
+            )
+        return duration
+
+    def timeline(self) -> pd.DataFrame:
+        """Every command with its predicted start and end time in seconds, and
+        the actuation flag after it."""
+        return pd.DataFrame(self._events, columns=["start", "end", "command", "flag"])
+
+    def flag_intervals(self) -> np.ndarray:
+        """(n, 2) predicted times the actuation flag goes high and back low."""
+        times = []
+        flag = 0
+        for start, _, line, new_flag in self._events:
+            if line.startswith("M42 P4") and new_flag != flag:
+                times.append(start)
+                flag = new_flag
+        if flag:
+            times.append(self.duration)
+        return np.array(times).reshape(-1, 2)
+
+    def simulate(self, script, *args, **kwargs):
+        """Runs a script function against this simulator.
+
+        While it runs, the script's module uses the virtual clock as its time
+        module and builds this simulator whenever it creates a
+        JubileeMotionController, so scripts such as
+        concentric_cycles.board_cycles or a duration based cup_cycles run
+        unchanged.
+
+        Returns:
+            whatever the script returns"""
+        namespace = script.__globals__
+        patches = {"time": VirtualClock(self), "JubileeMotionController": self._self}
+        originals = {name: namespace[name] for name in patches if name in namespace}
+        namespace.update((name, patches[name]) for name in originals)
+        try:
+            return script(*args, **kwargs)
+        finally:
+            namespace.update(originals)
+
+    def _self(self, *args, **kwargs) -> "SimulatedJubilee":
+        return self
+
+
+def estimate_program(program, max_bytes: int = 200, **kwargs) -> SimulatedJubilee:
+    """Simulates submitting a compiled GcodeProgram in batches.
+
+    Args:
+        program: a GcodeProgram
+        max_bytes: see GcodeProgram.batches
+        kwargs: passed on to SimulatedJubilee
+
+    Returns:
+        the simulator after the run, with its duration and timeline"""
+    jubilee = SimulatedJubilee(**kwargs)
+    submit(jubilee, program, max_bytes, sleep=jubilee.submit_sleep)
+    return jubilee
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", type=str, help="Ground truth CSV to simulate")
+    parser.add_argument(
+        "-l", "--latency", type=float, default=LATENCY, help="Round trip latency, s"
+    )
+    parser.add_argument(
+        "-d", "--dwell", type=float, default=5000, help="Dwell per press, ms"
+    )
+    parser.add_argument("-o", "--output", type=str, help="File to save the timeline")
+    args = parser.parse_args()
+
+    program = compile_ground_truth(args.input, dwell=args.dwell)
+    batched = estimate_program(program, latency=args.latency)
+    per_command = SimulatedJubilee(latency=args.latency)
+    for line in program.lines:
+        per_command.gcode(line)
+    print(
+        f"{len(program.lines)} commands, {len(batched.flag_intervals())} actuations\n"
+        f"Batched: {batched.duration / 60:.1f} min in {batched.round_trips} round trips\n"
+        f"Per command: {per_command.duration / 60:.1f} min"
+    )
+    if args.output:
+        batched.timeline().to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Local stand-ins for JubileeMotionController and the mux board's serial
+port, to test and time Jubilee scripts, compiled programs and the
+orchestrator without the machine."""
+
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+MOVE_PATTERN = re.compile(r"^G[01]\b")
+AXIS_PATTERN = re.compile(r"([XYZF])(-?\d+(?:\.\d*)?)")
+DWELL_PATTERN = re.compile(r"^G4 ([PS])(\d+(?:\.\d*)?)")
+
+
+class StandInJubilee:
+    """Accepts the same calls the scripts make on a JubileeMotionController
+    and records the command stream instead of moving anything.
+
+    Every gcode() call counts as one network round trip, which can be given a
+    latency to estimate how much time a script spends waiting on the network.
+    As on RepRapFirmware, moves are queued and return right away, and only M400
+    and G4 wait for the queued motion to finish.
+    """
+
+    def __init__(
+        self,
+        address: str = "stand-in",
+        debug: bool = False,
+        latency: float = 0.0,
+        sleep: bool = False,
+        position=(0.0, 0.0, 0.0),
+        dwell: bool = False,
+        speed: float = None,
+    ):
+        """
+        Args:
+            address: ignored, for the JubileeMotionController signature
+            debug: print every command received
+            latency: seconds each round trip is assumed to take
+            sleep: actually wait `latency` seconds per round trip, to time a
+                script in real time
+            position: the starting tool position
+            dwell: actually wait out G4 dwells, so a run takes (roughly) real
+                time
+            speed: if given, queued moves take their length over this speed
+                (mm/s) of real time to finish, otherwise they are instant"""
+        self.address = address
+        self.debug = debug
+        self.latency = latency
+        self.sleep = sleep
+        self.dwell = dwell
+        self.speed = speed
+        self.commands = []  # every G-code line received, in order, but M408
+        self.round_trips = 0
+        self.flag = 0
+        self._position = np.array(position, dtype=float)
+        self._motion_end = time.monotonic()  # when the queued moves finish
+
+    @property
+    def position(self) -> np.ndarray:
+        """The target of the last move sent, which may still be under way."""
+        return self._position.copy()
+
+    @property
+    def network_time(self) -> float:
+        """Total assumed round trip latency so far, in seconds."""
+        return self.round_trips * self.latency
+
+    def gcode(self, command: str) -> str:
+        """Runs newline separated commands and returns their replies."""
+        self.round_trips += 1
+        if self.sleep and self.latency:
+            time.sleep(self.latency)
+        replies = []
+        for line in command.splitlines():
+            line = line.strip()
+            if line:
+                replies.append(self._execute(line))
+        return "\n".join(reply for reply in replies if reply)
+
+    def status(self) -> str:
+        """The M408 status report, busy until the queued moves finish."""
+        busy = time.monotonic() < self._motion_end
+        return json.dumps({"status": "B" if busy else "I"})
+
+    def _wait_for_motion(self) -> None:
+        time.sleep(max(self._motion_end - time.monotonic(), 0))
+
+    def move_xyz_absolute(self, x: float = None, y: float = None, z: float = None, **_):
+        axes = [
+            f"{axis}{value:.3f}"
+            for axis, value in zip("XYZ", (x, y, z))
+            if value is not None
+        ]
+        self.gcode(" ".join(["G0"] + axes))
+
+    def _execute(self, line: str) -> str:
+        if line.startswith("M408"):
+            return self.status()  # status polls are not part of the stream
+        if self.debug:
+            print(line)
+        self.commands.append(line)
+        if MOVE_PATTERN.match(line):
+            start = self.position
+            for axis, value in AXIS_PATTERN.findall(line):
+                if axis != "F":
+                    self._position["XYZ".index(axis)] = float(value)
+            if self.speed:
+                start_time = max(time.monotonic(), self._motion_end)
+                length = np.linalg.norm(self._position - start)
+                self._motion_end = start_time + length / self.speed
+        elif line.startswith("M42 P4"):
+            self.flag = int(line.split("S")[-1])
+        elif line == "M400":
+            self._wait_for_motion()
+        elif DWELL_PATTERN.match(line):
+            self._wait_for_motion()
+            if self.dwell:
+                unit, value = DWELL_PATTERN.match(line).groups()
+                time.sleep(float(value) / (1000 if unit == "P" else 1))
+        return ""
+
+
+class StandInSerial:
+    """Stands in for the pyserial port of the mux board: a background thread
+    produces a sample line every period in real time, with the actuation flag
+    of a stand-in Jubilee and a response on every channel while it is high."""
+
+    def __init__(
+        self,
+        jubilee: StandInJubilee = None,
+        period: float = 0.01,
+        response: int = 1000,
+        noise: int = 5,
+        rng=None,
+    ):
+        """
+        Args:
+            jubilee: whose flag is sent, and raises the counts. None for a
+                flag that stays low.
+            period: seconds between samples
+            response: counts added to every channel while the flag is high
+            noise: counts of uniform noise
+            rng: seed or numpy Generator of the noise"""
+        self.jubilee = jubilee
+        self.period = period
+        self.response = response
+        self.noise = noise
+        self.rng = np.random.default_rng(rng)
+        self.samples = 0
+        self._buffer = b""
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._stream, daemon=True)
+        self._thread.start()
+
+    def _stream(self) -> None:
+        next_time = time.monotonic()
+        while not self._closed.is_set():
+            flag = self.jubilee.flag if self.jubilee is not None else 0
+            counts = 10_000_000 + self.rng.integers(0, self.noise + 1, 8)
+            counts += flag * self.response
+            line = " ".join(f"{count:08d}" for count in counts) + f" {flag}\n"
+            with self._lock:
+                self._buffer += line.encode()
+                self.samples += 1
+            next_time += self.period
+            self._closed.wait(max(next_time - time.monotonic(), 0))
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._buffer)
+
+    def read(self, size: int = 1) -> bytes:
+        with self._lock:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self) -> bytes:
+        while b"\n" not in self._buffer:
+            time.sleep(self.period)
+        with self._lock:
+            line, self._buffer = self._buffer.split(b"\n", 1)
+        return line + b"\n"
+
+    def close(self) -> None:
+        self._closed.set()
+        self._thread.join()
@@ -0,0 +1,239 @@
+"""Module for measuring the lag between the Jubilee's actuation flag and the
+capacitance response.
+
+The Jubilee raises the flag (M42 P4) right before a move and lowers it right
+after, and the recorder stores it with every sample. The latency of an edge on
+a channel is the time from the flag edge to the first sample that departs
+from the pre-edge baseline by more than a noise threshold.
+
+The board reads the flag and the counts into the same line, so both share one
+host timestamp and the serial and host buffering delay cancels out. What is
+measured is the delay from the flag reaching the board to the counts
+responding: the motion and mechanical response of the cup plus the sensor's
+conversion time, resolved to one sample period. The host timestamps only
+convert that sample gap to seconds, so reads that bunch several lines
+together can add up to a read interval of jitter.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from capcup.serial_data_formatter import format_folder
+from capcup.trial_cache import TrialCache
+
+MAD_TO_STD = 1.4826  # median absolute deviation to standard deviation
+
+
+@dataclass
+class TrialLatency:
+    """Latencies of every flag edge of one trial.
+
+    Attributes:
+        name: the trial's file name
+        edge_times: (edges,) time of the first sample after each edge
+        rising: (edges,) True for flag rising edges
+        latencies: (edges, channels) seconds from edge to onset, NaN where no
+            onset was detected in the search window
+    """
+
+    name: str
+    edge_times: np.ndarray
+    rising: np.ndarray
+    latencies: np.ndarray
+
+    @property
+    def first_onset(self) -> np.ndarray:
+        """(edges,) latency of the earliest responding channel."""
+        latencies = np.where(np.isnan(self.latencies), np.inf, self.latencies)
+        first = latencies.min(axis=1)
+        return np.where(np.isinf(first), np.nan, first)
+
+
+def flag_edges(actuations: np.ndarray):
+    """Returns (index of the first sample after each flag change, rising)."""
+    change = np.diff(np.asarray(actuations).astype(int))
+    edges = np.flatnonzero(change) + 1
+    return edges, change[edges - 1] > 0
+
+
+def thresholds(
+    baseline: np.ndarray, threshold: float = 5.0, min_threshold: float = 1.0
+):
+    """Baseline medians and onset thresholds of baseline windows of shape
+    (..., samples, channels). The thresholds are `threshold` robust standard
+    deviations, but at least min_threshold counts."""
+    median = np.median(baseline, axis=-2)
+    mad = np.median(np.abs(baseline - median[..., None, :]), axis=-2)
+    return median, np.maximum(threshold * MAD_TO_STD * mad, min_threshold)
+
+
+def onset_latencies(
+    time: np.ndarray,
+    cap_counts: np.ndarray,
+    actuations: np.ndarray,
+    window: int = 100,
+    baseline: int = 20,
+    threshold: float = 5.0,
+    min_threshold: float = 1.0,
+):
+    """Latency from every flag edge to the signal onset on each channel,
+    computed for all edges at once.
+
+    Args:
+        time: (samples,) sample times in seconds
+        cap_counts: (samples, channels) counts
+        actuations: (samples,) actuation flag
+        window: samples after an edge searched for the onset
+        baseline: samples before an edge used as the baseline
+        threshold: onset threshold in robust standard deviations of the
+            baseline
+        min_threshold: smallest onset threshold, in counts
+
+    Returns:
+        (edge indices, rising, (edges, channels) latencies with NaN where no
+        onset was found). Edges without a full baseline before them are
+        skipped, windows are cut short at the end of the data."""
+    cap_counts = np.asarray(cap_counts, dtype=float)
+    if cap_counts.ndim == 1:
+        cap_counts = cap_counts[:, None]
+    edges, rising = flag_edges(actuations)
+    keep = edges >= baseline
+    edges, rising = edges[keep], rising[keep]
+    if len(edges) == 0:
+        return edges, rising, np.empty((0, cap_counts.shape[1]))
+
+    before = edges[:, None] - np.arange(baseline, 0, -1)
+    median, limit = thresholds(cap_counts[before], threshold, min_threshold)
+
+    after = edges[:, None] + np.arange(window)
+    in_range = after < len(cap_counts)
+    after = np.minimum(after, len(cap_counts) - 1)
+    departed = np.abs(cap_counts[after] - median[:, None, :]) > limit[:, None, :]
+    departed &= in_range[..., None]
+
+    found = departed.any(axis=1)
+    onset = after[np.arange(len(edges))[:, None], departed.argmax(axis=1)]
+    latencies = np.where(found, time[onset] - time[edges][:, None], np.nan)
+    return edges, rising, latencies
+
+
+def trial_latency(trial, **kwargs) -> TrialLatency:
+    """The TrialLatency of a loaded SerialData trial, kwargs as in
+    onset_latencies."""
+    edges, rising, latencies = onset_latencies(
+        trial.time, trial.cap_counts, trial.actuations, **kwargs
+    )
+    return TrialLatency(trial.name, trial.time[edges], rising, latencies)
+
+
+def folder_latencies(folder_path: str, cache: TrialCache = None, **kwargs) -> list:
+    """trial_latency of every trial in a folder, see format_folder."""
+    return [
+        trial_latency(trial, **kwargs) for trial in format_folder(folder_path, cache)
+    ]
+
+
+def latency_summary(results: list, percentiles=(50, 90, 99)) -> pd.DataFrame:
+    """Latency distribution per channel and edge direction over many trials.
+
+    Args:
+        results: TrialLatency objects, eg. from folder_latencies
+        percentiles: latency percentiles to report, in ms
+
+    Returns:
+        a DataFrame indexed by (edge, channel) with the number of edges, the
+        fraction with a detected onset and the latency percentiles"""
+    latencies = np.concatenate([result.latencies for result in results])
+    rising = np.concatenate([result.rising for result in results])
+    first = np.concatenate([result.first_onset for result in results])
+    columns = np.c_[latencies, first]
+    names = [f"C{ch + 1}" for ch in range(latencies.shape[1])] + ["first"]
+
+    rows = {}
+    for edge, mask in (("rising", rising), ("falling", ~rising)):
+        selected = columns[mask]
+        detected = ~np.isnan(selected)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+            quantiles = np.nanpercentile(selected, percentiles, axis=0) * 1000
+        for idx, name in enumerate(names):
+            rows[(edge, name)] = {
+                "edges": len(selected),
+                "detected": detected[:, idx].mean() if len(selected) else np.nan,
+                **{f"p{p}_ms": quantiles[q, idx] for q, p in enumerate(percentiles)},
+            }
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+class RollingLatency:
+    """Measures latencies live, one sample at a time, and keeps rolling
+    percentiles of the most recent ones (earliest responding channel)."""
+
+    def __init__(
+        self,
+        window: int = 100,
+        baseline: int = 20,
+        threshold: float = 5.0,
+        min_threshold: float = 1.0,
+        history: int = 200,
+    ):
+        """
+        Args:
+            window, baseline, threshold, min_threshold: see onset_latencies
+            history: number of recent latencies the percentiles are over"""
+        self.window = window
+        self.threshold = threshold
+        self.min_threshold = min_threshold
+        self.latencies = deque(maxlen=history)
+        self.missed = 0
+        self._recent = deque(maxlen=baseline)
+        self._flag = None
+        self._edge = None  # (time, baseline median, limit, samples seen)
+
+    def update(self, time: float, values, flag: int):
+        """Adds a sample. Returns the latency of the edge it completes, if any."""
+        values = np.asarray(values, dtype=float)
+        latency = None
+        if self._edge is not None:
+            edge_time, median, limit, seen = self._edge
+            if np.any(np.abs(values - median) > limit):
+                latency = time - edge_time
+                self.latencies.append(latency)
+                self._edge = None
+            elif seen + 1 >= self.window:
+                self.missed += 1
+                self._edge = None
+            else:
+                self._edge = (edge_time, median, limit, seen + 1)
+
+        if self._flag is not None and flag != self._flag:
+            if len(self._recent) == self._recent.maxlen:
+                median, limit = thresholds(
+                    np.array(self._recent), self.threshold, self.min_threshold
+                )
+                self._edge = (time, median, limit, 0)
+                if np.any(np.abs(values - median) > limit):
+                    latency = 0.0
+                    self.latencies.append(latency)
+                    self._edge = None
+        self._flag = flag
+        self._recent.append(values)
+        return latency
+
+    def percentiles(self, percentiles=(50, 99)) -> np.ndarray:
+        """Rolling latency percentiles in seconds, NaN before any edge."""
+        if not self.latencies:
+            return np.full(len(percentiles), np.nan)
+        return np.percentile(self.latencies, percentiles)
+
+    def status(self) -> str:
+        """A short p50/p99 report for the recorder."""
+        p50, p99 = self.percentiles((50, 99)) * 1000
+        return (
+            f"Latency p50/p99: {p50:.0f}/{p99:.0f} ms "
+            f"(n={len(self.latencies)}, missed={self.missed})"
+        )
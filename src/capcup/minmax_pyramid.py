@@ -0,0 +1,259 @@
+"""Module for plotting long recordings interactively with min/max pyramids.
+
+Level k of a pyramid summarizes consecutive blocks of factor**(k + 1) samples
+by their per-channel minimum and maximum. Drawing a level as an envelope looks
+the same as drawing every sample (peaks are never lost) but only needs as many
+points as there are pixels, so the plot helper swaps in the coarsest level that
+still resolves the visible x-range whenever the view is zoomed or panned.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from capcup.trial_cache import TrialCache
+
+MAX_LEVELS = 16
+
+
+class MinMaxPyramid:
+    """Per-channel min/max decimation pyramid that is built in a single
+    streaming pass and can keep being extended while a recording grows."""
+
+    def __init__(self, channels: int, factor: int = 4):
+        """
+        Args:
+            channels: number of data channels
+            factor: number of blocks of one level summarized by one block of
+                the next level"""
+        self.channels = channels
+        self.factor = factor
+        self.num_samples = 0
+        # Per level: list of (block start times, block mins, block maxs) chunks
+        self._levels = []
+        # Per level: inputs that do not fill a complete block yet
+        self._pending = []
+
+    @property
+    def num_levels(self) -> int:
+        return len(self._levels)
+
+    def extend(self, time: np.ndarray, values: np.ndarray) -> None:
+        """Adds samples to the end of the pyramid.
+
+        Args:
+            time: (n,) sample times
+            values: (n,) or (n, channels) sample values"""
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values[:, None]
+        self.num_samples += len(time)
+        blocks = (np.asarray(time, dtype=float), values, values)
+
+        for level in range(MAX_LEVELS):
+            if level == len(self._levels):
+                if len(blocks[0]) == 0:
+                    break
+                self._levels.append([])
+                self._pending.append(self._empty(values.dtype))
+            times, mins, maxs = (
+                np.concatenate((pending, new))
+                for pending, new in zip(self._pending[level], blocks)
+            )
+            num_full = len(times) // self.factor * self.factor
+            self._pending[level] = (
+                times[num_full:],
+                mins[num_full:],
+                maxs[num_full:],
+            )
+            if num_full == 0:
+                break
+            shape = (-1, self.factor, self.channels)
+            blocks = (
+                times[: num_full : self.factor],
+                mins[:num_full].reshape(shape).min(axis=1),
+                maxs[:num_full].reshape(shape).max(axis=1),
+            )
+            self._levels[level].append(blocks)
+
+    def level(self, level: int):
+        """Returns (block start times, mins, maxs) of a level, including a
+        final partial block that covers the samples not yet in a full block."""
+        chunks = self._levels[level]
+        if len(chunks) > 1:
+            # Consolidate so repeated lookups are cheap.
+            chunks[:] = [tuple(map(np.concatenate, zip(*chunks)))]
+        times, mins, maxs = chunks[0] if chunks else self._empty(float)
+
+        tail = [self._pending[idx] for idx in range(level + 1)]
+        tail = [pending for pending in tail if len(pending[0])]
+        if tail:
+            times = np.r_[times, min(pending[0][0] for pending in tail)]
+            mins = np.r_[mins, np.min([p[1].min(axis=0) for p in tail], axis=0)[None]]
+            maxs = np.r_[maxs, np.max([p[2].max(axis=0) for p in tail], axis=0)[None]]
+        return times, mins, maxs
+
+    def to_arrays(self) -> dict:
+        """The pyramid as a flat dictionary of arrays, for TrialCache.save."""
+        arrays = {
+            "factor": self.factor,
+            "channels": self.channels,
+            "num_samples": self.num_samples,
+            "num_levels": self.num_levels,
+        }
+        for level in range(self.num_levels):
+            self.level(level)  # consolidate
+            complete = self._levels[level][0] if self._levels[level] else None
+            for name, idx in (("time", 0), ("min", 1), ("max", 2)):
+                if complete is not None:
+                    arrays[f"level{level}_{name}"] = complete[idx]
+                arrays[f"pending{level}_{name}"] = self._pending[level][idx]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "MinMaxPyramid":
+        """Rebuilds a pyramid saved with to_arrays. It can be extended further."""
+        pyramid = cls(int(arrays["channels"]), int(arrays["factor"]))
+        pyramid.num_samples = int(arrays["num_samples"])
+        for level in range(int(arrays["num_levels"])):
+            names = ("time", "min", "max")
+            if f"level{level}_time" in arrays:
+                pyramid._levels.append(
+                    [tuple(arrays[f"level{level}_{name}"] for name in names)]
+                )
+            else:
+                pyramid._levels.append([])
+            pyramid._pending.append(
+                tuple(arrays[f"pending{level}_{name}"] for name in names)
+            )
+        return pyramid
+
+    @classmethod
+    def from_trial(
+        cls,
+        trial,
+        cache: TrialCache = None,
+        factor: int = 4,
+        chunk_size: int = 1 << 16,
+    ) -> "MinMaxPyramid":
+        """Builds (or loads from the cache) the pyramid of a trial's cap_counts.
+
+        Args:
+            trial: a trial object with `time`, `cap_counts` and `cache_key`
+            cache: optional TrialCache the pyramid is stored in
+            factor: see __init__
+            chunk_size: samples added per streaming step"""
+
+        def build():
+            values = trial.cap_counts
+            channels = 1 if values.ndim == 1 else values.shape[1]
+            pyramid = cls(channels, factor)
+            for idx in range(0, len(trial.time), chunk_size):
+                pyramid.extend(
+                    trial.time[idx : idx + chunk_size],
+                    values[idx : idx + chunk_size],
+                )
+            return pyramid.to_arrays()
+
+        if cache is None:
+            return cls.from_arrays(build())
+        return cls.from_arrays(
+            cache.get_or_compute(trial.cache_key, f"pyramid{factor}", build)
+        )
+
+    def _empty(self, dtype):
+        return (
+            np.empty(0),
+            np.empty((0, self.channels), dtype=dtype),
+            np.empty((0, self.channels), dtype=dtype),
+        )
+
+
+def envelope(times: np.ndarray, mins: np.ndarray, maxs: np.ndarray):
+    """Interleaves mins and maxs so a single line draws the filled envelope."""
+    x = np.repeat(times, 2)
+    y = np.empty((2 * len(times),) + mins.shape[1:], dtype=float)
+    y[0::2] = mins
+    y[1::2] = maxs
+    return x, y
+
+
+class MinMaxPlot:
+    """Plots the channels of a long recording on an axis. The drawn data is
+    replaced with the appropriate pyramid level whenever the x-limits change,
+    so zooming and panning stay interactive. Zoomed far enough in, the raw
+    samples are drawn."""
+
+    def __init__(
+        self,
+        ax,
+        time: np.ndarray,
+        values: np.ndarray,
+        pyramid: MinMaxPyramid = None,
+        max_points: int = None,
+        **line_kwargs,
+    ):
+        """
+        Args:
+            ax: the matplotlib axis to draw on
+            time: (n,) raw sample times
+            values: (n,) or (n, channels) raw samples
+            pyramid: the pyramid of values. Built here if not given.
+            max_points: most points drawn per channel. Defaults to twice the
+                axis width in pixels.
+            line_kwargs: passed on to ax.plot"""
+        self.ax = ax
+        self.time = time
+        self.values = values if values.ndim == 2 else values[:, None]
+        if pyramid is None:
+            pyramid = MinMaxPyramid(self.values.shape[1])
+            pyramid.extend(time, self.values)
+        self.pyramid = pyramid
+        self.max_points = max_points
+        self.current_level = None
+
+        self.lines = ax.plot(time[:1], self.values[:1], **line_kwargs)
+        ax.set_xlim(time[0], time[-1])
+        self.update()
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+        ax.callbacks.connect("xlim_changed", lambda ax: self.update())
+
+    def extend(self, time: np.ndarray, values: np.ndarray) -> None:
+        """Appends samples from a growing recording and redraws."""
+        values = values if values.ndim == 2 else values[:, None]
+        self.time = np.r_[self.time, time]
+        self.values = np.r_[self.values, values]
+        self.pyramid.extend(time, values)
+        self.update()
+
+    def update(self) -> None:
+        x_start, x_end = self.ax.get_xlim()
+        max_points = self.max_points or max(int(2 * self.ax.bbox.width), 100)
+
+        start, end = np.searchsorted(self.time, (x_start, x_end))
+        start, end = max(start - 1, 0), min(end + 1, len(self.time))
+        level = -1
+        while (end - start) / self.pyramid.factor ** (level + 1) > max_points:
+            if level + 1 == self.pyramid.num_levels:
+                break
+            level += 1
+        self.current_level = level
+
+        if level < 0:
+            x, y = self.time[start:end], self.values[start:end]
+        else:
+            times, mins, maxs = self.pyramid.level(level)
+            first, last = np.searchsorted(times, (x_start, x_end))
+            first, last = max(first - 1, 0), min(last + 1, len(times))
+            x, y = envelope(times[first:last], mins[first:last], maxs[first:last])
+        for idx, line in enumerate(self.lines):
+            line.set_data(x, y[:, idx])
+        self.ax.figure.canvas.draw_idle()
+
+
+def plot_trial(trial, ax=None, cache: TrialCache = None, **line_kwargs):
+    """Plots the cap_counts of a trial with a cached pyramid."""
+    if ax is None:
+        _, ax = plt.subplots()
+    pyramid = MinMaxPyramid.from_trial(trial, cache)
+    return MinMaxPlot(ax, trial.time, trial.cap_counts, pyramid, **line_kwargs)
@@ -9,9 +9,11 @@ Output to a file that can be used for ground truth and for gcode.
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+import warnings
 
 import numpy as np
 import pandas as pd
+from scipy.stats import qmc
 
 
 @dataclass
@@ -43,6 +45,88 @@ class Tool(ABC):
         raise NotImplementedError
 
 
+# Pose samples are stored in a structured array, with the label stored as an
+# index into LABELS.
+LABELS = ("aligned", "edge_misaligned", "corner_misaligned")
+POSE_DTYPE = np.dtype(
+    [
+        ("x", np.float64),
+        ("y", np.float64),
+        ("z", np.float64),
+        ("alpha", np.float64),
+        ("beta", np.float64),
+        ("gamma", np.float64),
+        ("label", np.uint8),
+    ],
+    align=True,
+)
+
+
+def rotation_matrices(alpha, beta, gamma) -> np.ndarray:
+    """(n, 3, 3) rotation matrices Rz(gamma) @ Ry(beta) @ Rx(alpha)."""
+    ca, sa = np.cos(alpha), np.sin(alpha)
+    cb, sb = np.cos(beta), np.sin(beta)
+    cg, sg = np.cos(gamma), np.sin(gamma)
+    rotation = np.empty(np.shape(alpha) + (3, 3))
+    rotation[..., 0, 0] = cg * cb
+    rotation[..., 0, 1] = cg * sb * sa - sg * ca
+    rotation[..., 0, 2] = cg * sb * ca + sg * sa
+    rotation[..., 1, 0] = sg * cb
+    rotation[..., 1, 1] = sg * sb * sa + cg * ca
+    rotation[..., 1, 2] = sg * sb * ca - cg * sa
+    rotation[..., 2, 0] = -sb
+    rotation[..., 2, 1] = cb * sa
+    rotation[..., 2, 2] = cb * ca
+    return rotation
+
+
+def _unit_engine(method: str, rng: np.random.Generator):
+    """Returns a function filling a (3, n) array with unit cube samples."""
+    if method == "random":
+        return lambda out: rng.random(out=out)
+    engines = {"sobol": qmc.Sobol, "halton": qmc.Halton}
+    if method not in engines:
+        raise ValueError(f"Unknown sampling method {method}")
+    sampler = engines[method](d=3, scramble=True, seed=rng)
+
+    def fill(out):
+        with warnings.catch_warnings():
+            # Sobol' prefers powers of 2, but any count is still well spread.
+            warnings.filterwarnings("ignore", message=".*balance properties")
+            out[:] = sampler.random(out.shape[1]).T
+
+    return fill
+
+
+def class_counts(num_samples: int, proportions=None) -> np.ndarray:
+    """Splits num_samples between the LABELS according to proportions (equal if
+    None), rounding so the counts add up exactly."""
+    if proportions is None:
+        proportions = np.ones(len(LABELS))
+    proportions = np.asarray(proportions, dtype=float)
+    exact = num_samples * proportions / proportions.sum()
+    counts = np.floor(exact).astype(int)
+    remainder = num_samples - counts.sum()
+    counts[np.argsort(counts - exact)[:remainder]] += 1
+    return counts
+
+
+def poses_to_frame(poses: np.ndarray) -> pd.DataFrame:
+    """Converts a POSE_DTYPE array to a DataFrame with string labels."""
+    frame = pd.DataFrame({name: poses[name] for name in POSE_DTYPE.names[:-1]})
+    frame["label"] = pd.Categorical.from_codes(poses["label"], LABELS)
+    return frame
+
+
+def frame_to_poses(frame: pd.DataFrame) -> np.ndarray:
+    """Converts a DataFrame like the ground truth CSV to a POSE_DTYPE array."""
+    poses = np.zeros(len(frame), dtype=POSE_DTYPE)
+    for name in POSE_DTYPE.names[:-1]:
+        poses[name] = frame[name]
+    poses["label"] = [LABELS.index(label) for label in frame["label"]]
+    return poses
+
+
 @dataclass
 class Box(Tool):
     """Class representing a box with size and pose. All lengths in mm, angles in
@@ -52,158 +136,389 @@ class Box(Tool):
     y_size: float = 1
     z_size: float = 1
 
-    def sample(self, num_samples: int, cup: SuctionCup) -> np.ndarray:
-        labeled_data = pd.concat(
-            [
-                self.sample_aligned(num_samples, cup),
-                self.sample_edge_misaligned(num_samples, cup),
-                self.sample_corner_misaligned(num_samples, cup),
-            ],
-            ignore_index=True,
+    def sample(
+        self, num_samples: int, cup: SuctionCup, rng=None, method: str = "random"
+    ) -> pd.DataFrame:
+        """Samples num_samples poses of each label, shuffled together."""
+        poses = self.sample_poses(
+            len(LABELS) * num_samples, cup, rng=rng, method=method
         )
+        return poses_to_frame(poses)
 
-        shuffled_data = labeled_data.sample(frac=1).reset_index(drop=True)
-        return shuffled_data
+    def sample_poses(
+        self,
+        num_samples: int,
+        cup: SuctionCup,
+        proportions=None,
+        rng=None,
+        shuffle: bool = True,
+        method: str = "random",
+        chunk_size: int = 1 << 16,
+    ) -> np.ndarray:
+        """Samples shuffled, labeled poses into a single POSE_DTYPE array.
 
-    def sample_aligned(self, num_samples: int, cup: SuctionCup) -> pd.DataFrame:
-        x_bound = (
-            -(self.x_size / 2 - cup.diameter / 2),
-            self.x_size / 2 - cup.diameter / 2,
-        )
-        y_bound = (
-            -(self.y_size / 2 - cup.diameter / 2),
-            self.y_size / 2 - cup.diameter / 2,
-        )
-        z_bound = (cup.lip_to_board_height - cup.max_actuation, cup.lip_to_board_height)
-
-        x_samples = np.random.uniform(*x_bound, num_samples)
-        y_samples = np.random.uniform(*y_bound, num_samples)
-        z_samples = np.random.uniform(*z_bound, num_samples)
-        alpha_samples = np.zeros(num_samples)
-        beta_samples = np.zeros(num_samples)
-        gamma_samples = np.zeros(num_samples)
-
-        labels = ["aligned"] * num_samples
-        labeled_data = pd.DataFrame(
-            {
-                "x": x_samples,
-                "y": y_samples,
-                "z": z_samples,
-                "alpha": alpha_samples,
-                "beta": beta_samples,
-                "gamma": gamma_samples,
-                "label": labels,
-            }
-        )
-        return labeled_data
-
-    def sample_edge_misaligned(self, num_samples: int, cup: SuctionCup) -> pd.DataFrame:
-        # Because the set is nonconvex, generate random samples for each and then randomly
-        # choose between them.
-        horizontal_x_bound = (
-            self.x_size / 2 - cup.diameter / 2,
-            self.x_size / 2 + cup.diameter / 2,
-        )
-        horizontal_y_bound = (
-            -(self.y_size / 2 - cup.diameter / 2),
-            self.y_size / 2 - cup.diameter / 2,
-        )
-        horizontal_x_samples = np.random.uniform(*horizontal_x_bound, num_samples)
-        horizontal_y_samples = np.random.uniform(*horizontal_y_bound, num_samples)
-        horizontal_side_sample = np.random.choice([-1, 1], num_samples)
-        horizontal_x_samples *= horizontal_side_sample
-
-        vertical_x_bound = (
-            -(self.x_size / 2 - cup.diameter / 2),
-            self.x_size / 2 - cup.diameter / 2,
-        )
-        vertical_y_bound = (
-            self.y_size / 2 - cup.diameter / 2,
-            self.y_size / 2 + cup.diameter / 2,
-        )
-        vertical_x_samples = np.random.uniform(*vertical_x_bound, num_samples)
-        vertical_y_samples = np.random.uniform(*vertical_y_bound, num_samples)
-        vertical_side_sample = np.random.choice([-1, 1], num_samples)
-        vertical_y_samples *= vertical_side_sample
-
-        # Now randomly choose between horizontal and vertical samples
-        choose_horizontal = np.random.choice([True, False], num_samples)
-        x_samples = np.where(
-            choose_horizontal, horizontal_x_samples, vertical_x_samples
-        )
-        y_samples = np.where(
-            choose_horizontal, horizontal_y_samples, vertical_y_samples
-        )
-        z_samples = np.random.uniform(
-            cup.lip_to_board_height - cup.max_actuation,
-            cup.lip_to_board_height,
-            num_samples,
-        )
-        alpha_samples = np.zeros(num_samples)
-        beta_samples = np.zeros(num_samples)
-        gamma_samples = np.zeros(num_samples)
-
-        labels = ["edge_misaligned"] * num_samples
-        labeled_data = pd.DataFrame(
-            {
-                "x": x_samples,
-                "y": y_samples,
-                "z": z_samples,
-                "alpha": alpha_samples,
-                "beta": beta_samples,
-                "gamma": gamma_samples,
-                "label": labels,
+        Each label's poses are written directly into their slice of the output
+        from samples of the unit cube (see map_unit), a chunk at a time, and
+        the whole array is shuffled in place at the end.
+
+        With a low-discrepancy method every label region gets its own
+        scrambled sequence, so each region is covered evenly by far fewer
+        samples than i.i.d. draws need (see coverage_report).
+
+        Args:
+            num_samples: the total number of poses
+            cup: the suction cup being actuated
+            proportions: relative amount of each of LABELS, equal by default
+            rng: a np.random.Generator or a seed, for reproducible samples
+            shuffle: if False, the poses are left grouped by label, which is
+                about twice as fast for offline coverage studies
+            method: "random" for i.i.d. uniform samples, or "sobol" or
+                "halton" for scrambled low-discrepancy sequences
+            chunk_size: unit cube samples drawn at a time
+
+        Returns:
+            an array of POSE_DTYPE"""
+        rng = np.random.default_rng(rng)
+        poses = np.zeros(num_samples, dtype=POSE_DTYPE)
+        unit = np.empty(3 * min(chunk_size, num_samples))
+
+        start = 0
+        for code, count in enumerate(class_counts(num_samples, proportions)):
+            poses["label"][start : start + count] = code
+            engine = _unit_engine(method, rng)
+            for chunk_start in range(start, start + count, chunk_size):
+                chunk_end = min(chunk_start + chunk_size, start + count)
+                chunk = unit[: 3 * (chunk_end - chunk_start)].reshape(3, -1)
+                engine(chunk)
+                self.map_unit(code, chunk, cup, poses[chunk_start:chunk_end])
+            start += count
+
+        if shuffle:
+            rng.shuffle(poses)
+        return poses
+
+    def map_unit(self, code: int, unit: np.ndarray, cup: SuctionCup, out: np.ndarray):
+        """Maps points of the unit cube onto the poses of a label, writing x, y
+        and z into out. Uniform points give uniformly distributed poses.
+
+        The first coordinate picks one of the 4 edge strips or corner disks and
+        the position along it, so no random numbers are thrown away. unit is
+        used as scratch space and overwritten.
+
+        Args:
+            code: the index of the label in LABELS
+            unit: (3, n) points in [0, 1), one row per coordinate
+            cup: the suction cup being actuated
+            out: (n,) POSE_DTYPE array to write to"""
+        radius = cup.diameter / 2
+        x_inner = self.x_size / 2 - radius
+        y_inner = self.y_size / 2 - radius
+        first, second, third = unit
+        third *= cup.max_actuation
+        out["z"] = third + (cup.lip_to_board_height - cup.max_actuation)
+
+        if LABELS[code] == "aligned":
+            out["x"] = x_inner * (2 * first - 1)
+            out["y"] = y_inner * (2 * second - 1)
+            return
+
+        first *= 4
+        region = first.astype(np.int8)
+        first -= region  # now the position within the region
+        side = 1 - 2 * (region & 1)  # + for even regions, - for odd
+
+        if LABELS[code] == "edge_misaligned":
+            # Regions 0, 1 are the strips at +/- x and 2, 3 the strips at +/- y
+            second *= 2 * radius
+            second -= radius
+            first *= 2
+            first -= 1
+            x_strip = region < 2
+            out["x"] = np.where(
+                x_strip, side * (self.x_size / 2) + second, x_inner * first
+            )
+            out["y"] = np.where(
+                x_strip, y_inner * first, side * (self.y_size / 2) + second
+            )
+            return
+
+        # corner_misaligned: region's bits pick the x and y side of the corner
+        np.sqrt(first, out=first)
+        first *= radius
+        second *= 2 * np.pi
+        y_side = 1 - 2 * (region >> 1)
+        out["x"] = side * (self.x_size / 2) + first * np.cos(second)
+        out["y"] = y_side * (self.y_size / 2) + first * np.sin(second)
+
+    def unit_from_poses(self, code: int, poses: np.ndarray, cup: SuctionCup):
+        """Inverse of map_unit: the (n, 3) unit cube points of poses of a label."""
+        radius = cup.diameter / 2
+        x_inner = self.x_size / 2 - radius
+        y_inner = self.y_size / 2 - radius
+        unit = np.empty((len(poses), 3))
+        unit[:, 2] = (
+            poses["z"] - cup.lip_to_board_height + cup.max_actuation
+        ) / cup.max_actuation
+        x, y = poses["x"], poses["y"]
+
+        if LABELS[code] == "aligned":
+            unit[:, 0] = (x / x_inner + 1) / 2
+            unit[:, 1] = (y / y_inner + 1) / 2
+            return unit
+
+        if LABELS[code] == "edge_misaligned":
+            x_strip = np.abs(x) > x_inner
+            region = np.where(x_strip, x < 0, 2 + (y < 0))
+            side = np.where(region % 2, -1, 1)
+            along = np.where(x_strip, y / y_inner, x / x_inner)
+            across = np.where(
+                x_strip, x - side * self.x_size / 2, y - side * self.y_size / 2
+            )
+            unit[:, 0] = (region + (along + 1) / 2) / 4
+            unit[:, 1] = (across / radius + 1) / 2
+            return unit
+
+        region = (x < 0) + 2 * (y < 0)
+        dx = x - np.sign(x) * self.x_size / 2
+        dy = y - np.sign(y) * self.y_size / 2
+        unit[:, 0] = (region + (dx**2 + dy**2) / radius**2) / 4
+        unit[:, 1] = np.mod(np.arctan2(dy, dx), 2 * np.pi) / (2 * np.pi)
+        return unit
+
+    def coverage_report(
+        self, poses: np.ndarray, cup: SuctionCup, max_points: int = 4096, rng=None
+    ) -> dict:
+        """How evenly the poses of each label cover their region.
+
+        The poses are mapped back onto the unit cube (unit_from_poses), where
+        evenly covered regions have a low centered L2 discrepancy and a high
+        fraction of occupied cells in a grid of about one cell per pose.
+
+        Args:
+            poses: array of POSE_DTYPE, or a DataFrame from Box.sample
+            cup: the suction cup the poses were sampled for
+            max_points: the discrepancy is O(n^2), so larger sets are
+                estimated from a random subset of this many poses
+            rng: a np.random.Generator or seed for the subset
+
+        Returns:
+            {label: {"num_samples", "discrepancy", "cell_coverage"}}"""
+        if isinstance(poses, pd.DataFrame):
+            poses = frame_to_poses(poses)
+        rng = np.random.default_rng(rng)
+        report = {}
+        for code, label in enumerate(LABELS):
+            unit = self.unit_from_poses(code, poses[poses["label"] == code], cup)
+            if len(unit) == 0:
+                continue
+            unit = np.clip(unit, 0, np.nextafter(1, 0))
+            cells_per_axis = max(int(len(unit) ** (1 / 3)), 1)
+            cells = np.floor(unit * cells_per_axis).astype(int)
+            occupied = len(np.unique(cells, axis=0))
+            if len(unit) > max_points:
+                unit = unit[rng.choice(len(unit), max_points, replace=False)]
+            report[label] = {
+                "num_samples": int(np.sum(poses["label"] == code)),
+                "discrepancy": float(qmc.discrepancy(unit)),
+                "cell_coverage": occupied / cells_per_axis**3,
             }
+        return report
+
+    def sample_valid_poses(
+        self,
+        num_samples: int,
+        cup: SuctionCup,
+        max_tilt=(0.0, 0.0, 0.0),
+        proportions=None,
+        rng=None,
+        board_clearance: float = 0.0,
+        batch_size: int = 1 << 16,
+    ) -> np.ndarray:
+        """Samples tilted poses, keeping only those that pass valid_poses.
+
+        Candidates are drawn with sample_poses, given uniform angles within
+        +/- max_tilt and checked in batches. The batch size follows the running
+        acceptance rate of each label so the exact class counts are reached in
+        a few batches.
+
+        Args:
+            num_samples: the total number of poses
+            cup: the suction cup being actuated
+            max_tilt: largest absolute (alpha, beta, gamma), in radians
+            proportions: see sample_poses
+            rng: a np.random.Generator or a seed
+            board_clearance: see valid_poses
+            batch_size: most candidates checked at a time
+
+        Returns:
+            an array of POSE_DTYPE
+
+        Raises:
+            ValueError: if no candidate poses of a label are valid"""
+        rng = np.random.default_rng(rng)
+        poses = np.empty(num_samples, dtype=POSE_DTYPE)
+
+        start = 0
+        for code, count in enumerate(class_counts(num_samples, proportions)):
+            one_hot = np.eye(len(LABELS))[code]
+            filled, drawn = 0, 0
+            while filled < count:
+                acceptance = max(filled / drawn, 0.01) if drawn else 1.0
+                num_candidates = min(
+                    int(np.ceil(1.1 * (count - filled) / acceptance)) + 16, batch_size
+                )
+                candidates = self.sample_poses(
+                    num_candidates, cup, one_hot, rng, shuffle=False
+                )
+                for angle, limit in zip(("alpha", "beta", "gamma"), max_tilt):
+                    candidates[angle] = rng.uniform(-limit, limit, num_candidates)
+                accepted = candidates[
+                    self.valid_poses(candidates, cup, board_clearance)
+                ]
+                accepted = accepted[: count - filled]
+                poses[start + filled : start + filled + len(accepted)] = accepted
+                filled += len(accepted)
+                drawn += num_candidates
+                if filled == 0 and drawn >= 100 * batch_size:
+                    raise ValueError(f"No valid {LABELS[code]} poses were found")
+            start += count
+
+        rng.shuffle(poses)
+        return poses
+
+    def valid_poses(
+        self,
+        poses: np.ndarray,
+        cup: SuctionCup,
+        board_clearance: float = 0.0,
+    ) -> np.ndarray:
+        """Checks which poses are valid: the tool does not collide with the
+        board, its bottom face touches the cup lip, and the lip is not pushed
+        down further than the cup's max_actuation.
+
+        Args:
+            poses: array of POSE_DTYPE
+            cup: the suction cup being actuated
+            board_clearance: the smallest allowed height of the tool above
+                the board
+
+        Returns:
+            (n,) boolean array"""
+        # The board check is cheap, so only the poses passing it are checked
+        # against the cup.
+        valid = self.board_clearance(poses) >= board_clearance
+        compression = self.cup_compression(poses[valid], cup)
+        with np.errstate(invalid="ignore"):
+            valid[valid] = (compression >= 0) & (
+                compression <= cup.max_actuation + 1e-9
+            )
+        return valid
+
+    def board_clearance(self, poses: np.ndarray) -> np.ndarray:
+        """Height of the lowest corner of the tool's bottom face above the board."""
+        # Only the bottom row of the rotation matters: (-sin b, cos b sin a, .)
+        return (
+            poses["z"]
+            - np.abs(np.sin(poses["beta"])) * self.x_size / 2
+            - np.abs(np.cos(poses["beta"]) * np.sin(poses["alpha"])) * self.y_size / 2
         )
-        return labeled_data
+
+    def cup_compression(
+        self, poses: np.ndarray, cup: SuctionCup, chunk_size: int = 1 << 16
+    ) -> np.ndarray:
+        """How far the tool's bottom face pushes the cup lip down, ie. the
+        largest distance between the lip height and the bottom face over the
+        part of the lip circle that lies under the face. NaN where no part of
+        the lip is under the tool (no contact).
+
+        The pose (x, y, z) is the center of the tool's bottom face relative to
+        the cup center on the board, rotated by rotation_matrices.
+
+        The compression is affine in the lip point, so its maximum over the
+        arcs of the lip under the face is either the unconstrained maximum on
+        the circle or one of the (up to 8) points where the circle crosses the
+        edges of the face's footprint. Only those 9 candidates are evaluated."""
+        radius = cup.diameter / 2
+        half_x, half_y = self.x_size / 2, self.y_size / 2
+        compression = np.empty(len(poses))
+
+        for start in range(0, len(poses), chunk_size):
+            chunk = poses[start : start + chunk_size]
+            rotation = rotation_matrices(chunk["alpha"], chunk["beta"], chunk["gamma"])
+            center_x, center_y = chunk["x"][:, None], chunk["y"][:, None]
+
+            # compression(q) = lip height - z + slope . (q - center)
+            slope_x = (rotation[:, 0, 2] / rotation[:, 2, 2])[:, None]
+            slope_y = (rotation[:, 1, 2] / rotation[:, 2, 2])[:, None]
+            # Face coordinates of the face point above q are inverse @ (q - center)
+            determinant = (
+                rotation[:, 0, 0] * rotation[:, 1, 1]
+                - rotation[:, 0, 1] * rotation[:, 1, 0]
+            )
+            inverse = (
+                (rotation[:, 1, 1] / determinant, -rotation[:, 0, 1] / determinant),
+                (-rotation[:, 1, 0] / determinant, rotation[:, 0, 0] / determinant),
+            )
+
+            # Candidate angles: maximum of the slope term, then the crossings
+            # of the circle with the 4 footprint edges local = +/- half size.
+            angles = [np.arctan2(slope_y[:, 0], slope_x[:, 0])]
+            for (row_x, row_y), half in zip(inverse, (half_x, half_y)):
+                row_norm = np.hypot(row_x, row_y)
+                phase = np.arctan2(row_y, row_x)
+                offset = row_x * center_x[:, 0] + row_y * center_y[:, 0]
+                for sign in (-1, 1):
+                    with np.errstate(invalid="ignore"):
+                        spread = np.arccos((sign * half + offset) / (radius * row_norm))
+                    angles += [phase - spread, phase + spread]
+            angles = np.stack(angles, axis=-1)  # (n, 9), NaN if no crossing
+
+            relative_x = radius * np.cos(angles) - center_x
+            relative_y = radius * np.sin(angles) - center_y
+            (inv_xx, inv_xy), (inv_yx, inv_yy) = inverse
+            under = (
+                np.abs(inv_xx[:, None] * relative_x + inv_xy[:, None] * relative_y)
+                <= half_x + 1e-9
+            )
+            under &= (
+                np.abs(inv_yx[:, None] * relative_x + inv_yy[:, None] * relative_y)
+                <= half_y + 1e-9
+            )
+
+            depth = slope_x * relative_x + slope_y * relative_y
+            depth += cup.lip_to_board_height - chunk["z"][:, None]
+            depth[~under] = -np.inf
+            compression[start : start + chunk_size] = depth.max(axis=1)
+        compression[np.isneginf(compression)] = np.nan
+        return compression
+
+    def sample_aligned(
+        self, num_samples: int, cup: SuctionCup, rng=None
+    ) -> pd.DataFrame:
+        return self._sample_label("aligned", num_samples, cup, rng)
+
+    def sample_edge_misaligned(
+        self, num_samples: int, cup: SuctionCup, rng=None
+    ) -> pd.DataFrame:
+        return self._sample_label("edge_misaligned", num_samples, cup, rng)
 
     def sample_corner_misaligned(
-        self, num_samples: int, cup: SuctionCup
+        self, num_samples: int, cup: SuctionCup, rng=None
     ) -> pd.DataFrame:
-        # From a corner, sample uniformly in a circle around that corner.
-        # Then randomly select a corner to center around.
-        radii = cup.diameter / 2 * np.sqrt(np.random.uniform(0, 1, num_samples))
-        thetas = np.random.uniform(0, np.pi * 2, num_samples)
-        x_disk = radii * np.cos(thetas)
-        y_disk = radii * np.sin(thetas)
-
-        x_choice = np.random.choice([-1, 1], num_samples)
-        y_choice = np.random.choice([-1, 1], num_samples)
-
-        x_corner = x_choice * self.x_size / 2
-        y_corner = y_choice * self.y_size / 2
-        x_samples = x_disk + x_corner
-        y_samples = y_disk + y_corner
-
-        z_samples = np.random.uniform(
-            cup.lip_to_board_height - cup.max_actuation,
-            cup.lip_to_board_height,
-            num_samples,
-        )
-        alpha_samples = np.zeros(num_samples)
-        beta_samples = np.zeros(num_samples)
-        gamma_samples = np.zeros(num_samples)
-
-        labels = ["corner_misaligned"] * num_samples
-        labeled_data = pd.DataFrame(
-            {
-                "x": x_samples,
-                "y": y_samples,
-                "z": z_samples,
-                "alpha": alpha_samples,
-                "beta": beta_samples,
-                "gamma": gamma_samples,
-                "label": labels,
-            }
-        )
-        return labeled_data
+        return self._sample_label("corner_misaligned", num_samples, cup, rng)
+
+    def _sample_label(self, label, num_samples, cup, rng) -> pd.DataFrame:
+        proportions = np.array([label == other for other in LABELS], dtype=float)
+        return poses_to_frame(self.sample_poses(num_samples, cup, proportions, rng))
 
 
 def main():
     box = Box(x_size=100, y_size=100)
     cup = SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
     num_samples = 1000
-    ground_truth = box.sample(num_samples, cup)
+    ground_truth = box.sample(num_samples, cup, method="sobol")
+    for label, coverage in box.coverage_report(ground_truth, cup).items():
+        print(label, coverage)
     ground_truth.to_csv("ground_truth.csv", index=False)
 
 
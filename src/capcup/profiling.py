@@ -0,0 +1,151 @@
+"""Opt-in stage timing for the loaders and the recorder.
+
+Code is instrumented with `with stage("name"):` blocks. Profiling is off
+unless the CAPCUP_PROFILE environment variable is set (or enable() is
+called), in which case stage() returns a shared do-nothing context, so the
+instrumentation costs one function call per block.
+
+CAPCUP_PROFILE values:
+    - "1": time stages, and print a report of them when the process exits
+    - "cprofile": also profile the whole run with cProfile
+    - "tracemalloc": also trace memory allocations over the whole run
+CAPCUP_PROFILE_OUTPUT can name a file for the cProfile stats (to open with
+pstats or snakeviz) instead of printing the top entries.
+"""
+
+import atexit
+from contextlib import contextmanager, nullcontext
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+CAPTURE_MODES = ("cprofile", "tracemalloc")
+
+_enabled = False
+_totals = {}  # name: [calls, total seconds, max seconds]
+_NULL = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        totals = _totals.get(self.name)
+        if totals is None:
+            _totals[self.name] = [1, elapsed, elapsed]
+        else:
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2] = max(totals[2], elapsed)
+        return False
+
+
+def stage(name: str):
+    """Context manager timing a stage, eg. "serial.parse", if enabled."""
+    if not _enabled:
+        return _NULL
+    return _Stage(name)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True) -> None:
+    global _enabled
+    _enabled = on
+
+
+def reset() -> None:
+    _totals.clear()
+
+
+def report() -> dict:
+    """{stage: {"calls", "total_s", "mean_ms", "max_ms"}}, slowest first."""
+    rows = sorted(_totals.items(), key=lambda item: -item[1][1])
+    return {
+        name: {
+            "calls": calls,
+            "total_s": total,
+            "mean_ms": 1000 * total / calls,
+            "max_ms": 1000 * longest,
+        }
+        for name, (calls, total, longest) in rows
+    }
+
+
+def format_report() -> str:
+    lines = [f"{'stage':<28}{'calls':>10}{'total s':>12}{'mean ms':>12}{'max ms':>12}"]
+    for name, row in report().items():
+        lines.append(
+            f"{name:<28}{row['calls']:>10}{row['total_s']:>12.3f}"
+            f"{row['mean_ms']:>12.3f}{row['max_ms']:>12.3f}"
+        )
+    return "\n".join(lines)
+
+
+@contextmanager
+def capture(mode: str = "cprofile", output: str = None, top: int = 25):
+    """Profiles the block with cProfile, or traces its memory allocations
+    with tracemalloc, and prints the top entries.
+
+    Args:
+        mode: one of CAPTURE_MODES
+        output: file to dump the cProfile stats to, instead of printing
+        top: number of entries printed"""
+    if mode not in CAPTURE_MODES:
+        raise ValueError(f"mode must be one of {CAPTURE_MODES}, not {mode}")
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            if output:
+                profiler.dump_stats(output)
+            else:
+                stream = io.StringIO()
+                pstats.Stats(profiler, stream=stream).sort_stats(
+                    "cumulative"
+                ).print_stats(top)
+                print(stream.getvalue(), file=sys.stderr)
+    else:
+        tracemalloc.start()
+        try:
+            yield None
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Peak traced memory: {peak / 2**20:.1f} MB", file=sys.stderr)
+            for statistic in snapshot.statistics("lineno")[:top]:
+                print(statistic, file=sys.stderr)
+
+
+def _profile_run(mode: str) -> None:
+    """Turns on profiling for the whole process from CAPCUP_PROFILE."""
+    enable()
+    if mode in CAPTURE_MODES:
+        context = capture(mode, os.environ.get("CAPCUP_PROFILE_OUTPUT"))
+        context.__enter__()
+        atexit.register(context.__exit__, None, None, None)
+    # registered last, so it runs before the capture is closed and printed
+    atexit.register(lambda: print(format_report(), file=sys.stderr))
+
+
+_mode = os.environ.get("CAPCUP_PROFILE", "").strip().lower()
+if _mode not in ("", "0", "false"):
+    _profile_run(_mode)
@@ -1,4 +1,5 @@
 import argparse
+import atexit
 from collections import deque
 import serial
 import time
@@ -8,6 +9,14 @@ from matplotlib.patches import Arc
 from matplotlib.widgets import Button
 import numpy as np
 
+from capcup import profiling
+from capcup.calibration import Calibration, LiveCalibration
+from capcup.latency import RollingLatency
+from capcup.profiling import stage
+from capcup.recording_segments import SegmentWriter
+from capcup.sample_bus import DEFAULT_NAME, SamplePublisher, TcpRelay
+from capcup.serial_stream import DATA_POINTS, SerialDecoder, parse_line
+
 # Parse args
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -32,9 +41,52 @@ parser.add_argument(
     dest="viz2",
     help="Turn off the second vizualizer",
 )
+parser.add_argument(
+    "--latency-window",
+    type=int,
+    default=100,
+    help="Samples after an actuation edge searched for the signal onset",
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Time the read, decode, write and render stages and report them on exit",
+)
+parser.add_argument(
+    "--segment-mb",
+    type=float,
+    help="Roll over to a new, gzipped segment file every this many MB",
+)
+parser.add_argument(
+    "--segment-minutes",
+    type=float,
+    help="Roll over to a new, gzipped segment file every this many minutes",
+)
+parser.add_argument(
+    "--publish",
+    nargs="?",
+    const=DEFAULT_NAME,
+    help="Publish samples to a shared memory ring buffer of this name for other processes",
+)
+parser.add_argument(
+    "--tcp-port",
+    type=int,
+    help="Also serve the published samples over TCP on this port",
+)
+parser.add_argument(
+    "--calibration",
+    type=str,
+    help="Calibration (.npz from calibration.Calibration.save) to show live estimates with",
+)
 args = parser.parse_args()
+if args.profile and not profiling.enabled():
+    profiling.enable()
+    atexit.register(lambda: print(profiling.format_report()))
 
 file = args.file + ".csv"
+segmented = args.segment_mb is not None or args.segment_minutes is not None
+if segmented:
+    file = args.file + ".segments.json"
 time_stop = args.time_stop
 viz = args.viz
 viz2 = args.viz2
@@ -42,7 +94,7 @@ viz2 = args.viz2
 print("Saving to", file)
 
 # Serial Setup
-data_points = 8 + 1  # 8 channels + 1 actuation flag
+data_points = DATA_POINTS
 ser = serial.Serial("/dev/ttyACM0", 115200, timeout=1)
 print("Attempting to read...")
 # Get first entry to initialize plot
@@ -155,19 +207,42 @@ class BufferOverflowError(IOError):
 
 
 monitor = BufferMonitor(ser)
-buffer = ""
+bus = None
+if args.publish or args.tcp_port:
+    bus = SamplePublisher(args.publish or DEFAULT_NAME)
+    atexit.register(bus.close)
+    print("Publishing samples to", bus.name)
+    if args.tcp_port:
+        relay = TcpRelay(bus.name, port=args.tcp_port).start()
+        atexit.register(relay.stop)
+        print("Relaying samples on port", args.tcp_port)
+latency = RollingLatency(window=args.latency_window)
+calibration = None
+if args.calibration:
+    calibration = LiveCalibration(Calibration.load(args.calibration))
+decoder = SerialDecoder()
 last_actuation = time.time()
-with open(file, "w") as f:
+if segmented:
+    output = SegmentWriter(
+        args.file,
+        max_bytes=int(args.segment_mb * 2**20) if args.segment_mb else float("inf"),
+        max_seconds=60 * args.segment_minutes if args.segment_minutes else None,
+    )
+else:
+    output = open(file, "w")
+with output as f:
     while True:
         if (time_stop != 0) and (time.time() - last_actuation > time_stop):
             print(f"Last actuation longer than {time_stop} seconds ago. Stopping.")
             break
-        chunk = monitor.safe_read(ser.in_waiting or 1).decode()
+        with stage("recorder.read"):
+            chunk = monitor.safe_read(ser.in_waiting or 1).decode()
         if not chunk:
             continue
-        buffer += chunk
 
-        while "\n" in buffer:
+        with stage("recorder.decode"):
+            lines = decoder.lines(chunk)
+        for line in lines:
             stats = monitor.get_stats()
             if stats["overflows"] > monitor.max_buffer:
                 raise BufferOverflowError(
@@ -176,44 +251,52 @@ with open(file, "w") as f:
             if viz:
                 ax.set_title(
                     f"Live Viewer | Buffer: {stats['buffer_usage']} | Overflows: {stats['overflows']}"
+                    f"\n{latency.status()}"
+                    + (f"\n{calibration.status()}" if calibration else "")
                 )
-            line, buffer = buffer.split("\n", 1)
             print("Buffer:", stats["buffer_usage"], "| Data:", line)
-            line = line.strip()
-            if not line:
-                continue
 
             try:
-                values = [int(entry) for entry in line.split(" ")]
-                if len(values) != data_points:
-                    raise ValueError(
-                        f"Expected {data_points} values, got {len(values)}. {values}"
-                    )
+                with stage("recorder.decode"):
+                    values = parse_line(line, data_points)
+                timestamp = time.time()
                 if values[-1] == 1:
-                    last_actuation = time.time()
+                    last_actuation = timestamp
                 data.append(values)
+                if bus is not None:
+                    with stage("recorder.publish"):
+                        bus.publish(timestamp, values)
+                if latency.update(timestamp, values[:-1], values[-1]) is not None:
+                    print(latency.status())
+                if calibration is not None:
+                    with stage("recorder.calibrate"):
+                        calibration.update(values[:-1], values[-1])
+                        if calibration.released:
+                            print(calibration.press_status())
+
+                with stage("recorder.write"):
+                    f.write(str(timestamp) + " " + line + "\n")
+                    f.flush()
 
-                f.write(str(time.time()) + " " + line + "\n")
-                f.flush()
-
-                if viz:
-                    for idx, (ch, datum, offset) in enumerate(
-                        zip(channels, zip(*data), offsets)
-                    ):
-                        scale = 10000 if idx == data_points - 1 else 1
-                        ch.set_ydata(np.array(datum) * scale - offset)
-                        ch.set_xdata(range(len(datum)))
-                    ax.relim()
-                    ax.autoscale_view()
-                    plt.pause(0.01)
-                if viz2:
-                    if zeros is None:
-                        zeros = np.array(values[:-1])
-                    colors = cmap(norm((values[:-1] - zeros) / scale))[::-1]
-                    for arc, color in zip(arcs, colors):
-                        arc.set_color(color)
-                    fig2.canvas.draw_idle()
-                    plt.pause(0.01)
+                with stage("recorder.render"):
+                    if viz:
+                        for idx, (ch, datum, offset) in enumerate(
+                            zip(channels, zip(*data), offsets)
+                        ):
+                            scale = 10000 if idx == data_points - 1 else 1
+                            ch.set_ydata(np.array(datum) * scale - offset)
+                            ch.set_xdata(range(len(datum)))
+                        ax.relim()
+                        ax.autoscale_view()
+                        plt.pause(0.01)
+                    if viz2:
+                        if zeros is None:
+                            zeros = np.array(values[:-1])
+                        colors = cmap(norm((values[:-1] - zeros) / scale))[::-1]
+                        for arc, color in zip(arcs, colors):
+                            arc.set_color(color)
+                        fig2.canvas.draw_idle()
+                        plt.pause(0.01)
 
             except Exception as e:
                 print(f"Error processing line: {e}")
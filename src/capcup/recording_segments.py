@@ -0,0 +1,295 @@
+"""Module for writing long recordings as rotating, compressed segment files,
+and reading them back as one recording.
+
+A segmented recording named "run" is a set of segment files run.seg00000.csv,
+run.seg00001.csv, ... and an index, run.segments.json, listing every segment
+with the time range and number of lines it holds. The writer moves on to a
+new segment when the current one reaches a size or an age, and gzips closed
+segments in a background thread so acquisition never waits on compression.
+A crash can only damage the tail of the segment being written.
+
+The loaders accept the index (or a single .gz file) wherever they accept a
+recording, see open_recording.
+"""
+
+import gzip
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+INDEX_SUFFIX = ".segments.json"
+SEGMENT_PATTERN = re.compile(r"\.seg\d{5}\.\w+(\.gz)?$")
+
+
+def index_path(base_path: str) -> str:
+    return base_path + INDEX_SUFFIX
+
+
+def is_segment_file(file_path: str) -> bool:
+    """Whether a file is one segment of a segmented recording, and so should
+    not be read as a trial on its own."""
+    return bool(SEGMENT_PATTERN.search(file_path)) or file_path.endswith(".tmp")
+
+
+def is_trial_file(item: str) -> bool:
+    """Whether a file of a data folder is a trial to load, rather than the
+    Settings.txt, a hidden file (eg. the sync manifest of
+    download_drive_data), a partial download or one segment of a segmented
+    recording."""
+    name = os.path.basename(item)
+    if name == "Settings.txt" or name.startswith(".") or name.endswith(".part"):
+        return False
+    return not is_segment_file(name)
+
+
+def _write_index(file_path: str, index: dict) -> None:
+    directory = os.path.dirname(os.path.abspath(file_path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(handle, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(temp_path, file_path)
+
+
+def _line_time(line: str):
+    """The host timestamp a recorded line starts with, if any."""
+    try:
+        return float(line.split(" ", 1)[0])
+    except ValueError:
+        return None
+
+
+class SegmentWriter:
+    """A text file-like writer that rolls over to a new segment file by size
+    or age and compresses closed segments in the background."""
+
+    def __init__(
+        self,
+        base_path: str,
+        extension: str = ".csv",
+        max_bytes: int = 256 << 20,
+        max_seconds: float = None,
+        compress: bool = True,
+    ):
+        """
+        Args:
+            base_path: path of the recording without extension, eg. "run"
+            extension: extension of the segment files
+            max_bytes: size at which a segment is closed
+            max_seconds: age at which a segment is closed, if given
+            compress: gzip closed segments in a background thread"""
+        self.base_path = base_path
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compress = compress
+        self.index_path = index_path(base_path)
+        self.index = {"extension": extension, "segments": []}
+        self._lock = threading.Lock()
+        self._file = None
+        self._queue = queue.Queue()
+        self._worker = None
+        if compress:
+            self._worker = threading.Thread(target=self._compress_worker, daemon=True)
+            self._worker.start()
+        self._open_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def segment(self) -> dict:
+        """Index entry of the segment being written."""
+        return self.index["segments"][-1]
+
+    def write(self, text: str) -> None:
+        """Writes recorded lines, rolling over first if the segment is full."""
+        if self._full():
+            self._close_segment()
+            self._open_segment()
+        self._file.write(text)
+        self._bytes += len(text)
+        self._lines += text.count("\n")
+        self._last_text = text
+        if self._first_text is None:
+            self._first_text = text
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        """Closes the last segment and waits for the compression to finish."""
+        if self._file is None:
+            return
+        self._close_segment()
+        self._file = None
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+
+    def _full(self) -> bool:
+        if self._bytes >= self.max_bytes:
+            return True
+        return (
+            self.max_seconds is not None
+            and self._bytes > 0
+            and time.time() - self._opened >= self.max_seconds
+        )
+
+    def _open_segment(self) -> None:
+        number = len(self.index["segments"])
+        name = f"{os.path.basename(self.base_path)}.seg{number:05d}{self.extension}"
+        path = os.path.join(os.path.dirname(self.base_path), name)
+        self._file = open(path, "w", encoding="utf-8")
+        self._bytes = self._lines = 0
+        self._opened = time.time()
+        self._first_text = self._last_text = None
+        with self._lock:
+            self.index["segments"].append(
+                {
+                    "file": name,
+                    "first_time": None,
+                    "last_time": None,
+                    "lines": 0,
+                    "bytes": 0,
+                    "closed": False,
+                    "compressed": False,
+                }
+            )
+            _write_index(self.index_path, self.index)
+
+    def _close_segment(self) -> None:
+        self._file.close()
+        with self._lock:
+            segment = self.segment
+            segment["closed"] = True
+            segment["bytes"] = self._bytes
+            if self._first_text is not None:
+                segment["first_time"] = _line_time(self._first_text)
+                segment["last_time"] = _line_time(
+                    self._last_text.rstrip("\n").rsplit("\n", 1)[-1]
+                )
+            segment["lines"] = self._lines
+            _write_index(self.index_path, self.index)
+        if self.compress:
+            self._queue.put(len(self.index["segments"]) - 1)
+
+    def _compress_worker(self) -> None:
+        directory = os.path.dirname(self.base_path)
+        while True:
+            number = self._queue.get()
+            if number is None:
+                return
+            with self._lock:
+                name = self.index["segments"][number]["file"]
+            path = os.path.join(directory, name)
+            temp_path = path + ".gz.tmp"
+            with open(path, "rb") as source, gzip.open(temp_path, "wb") as target:
+                shutil.copyfileobj(source, target, 1 << 20)
+            os.replace(temp_path, path + ".gz")
+            with self._lock:
+                self.index["segments"][number]["file"] = name + ".gz"
+                self.index["segments"][number]["compressed"] = True
+                _write_index(self.index_path, self.index)
+            os.remove(path)
+
+
+def segment_paths(file_path: str) -> list:
+    """Paths of the segments listed in an index, in order. A segment that was
+    compressed after the index was read is found under its .gz name."""
+    with open(file_path, encoding="utf-8") as f:
+        index = json.load(f)
+    directory = os.path.dirname(file_path)
+    paths = []
+    for segment in index["segments"]:
+        path = os.path.join(directory, segment["file"])
+        if not os.path.exists(path) and os.path.exists(path + ".gz"):
+            path += ".gz"
+        paths.append(path)
+    return paths
+
+
+class _SegmentReader(io.TextIOBase):
+    """Reads the segments of a recording one after another as one text file."""
+
+    def __init__(self, paths: list):
+        self._paths = list(paths)
+        self._file = None
+
+    def _next_file(self) -> bool:
+        if self._file is not None:
+            self._file.close()
+        if not self._paths:
+            self._file = None
+            return False
+        path = self._paths.pop(0)
+        opener = gzip.open if path.endswith(".gz") else open
+        self._file = opener(path, "rt", encoding="utf-8")
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+    def readline(self, size: int = -1) -> str:
+        if size == 0:
+            return ""
+        size = -1 if size is None else size
+        while self._file is not None or self._next_file():
+            line = self._file.readline(size)
+            if line:
+                return line
+            if not self._next_file():
+                break
+        return ""
+
+    def read(self, size: int = -1) -> str:
+        if size is None or size < 0:
+            return "".join(iter(self.readline, ""))
+        chunks = []
+        while size and (self._file is not None or self._next_file()):
+            chunk = self._file.read(size)
+            if not chunk:
+                self._next_file()
+                continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        return "".join(chunks)
+
+    def readlines(self, hint: int = -1) -> list:
+        if hint is None or hint <= 0:
+            return list(iter(self.readline, ""))
+        lines, total = [], 0
+        for line in iter(self.readline, ""):
+            lines.append(line)
+            total += len(line)
+            if total >= hint:
+                break
+        return lines
+
+    def __iter__(self):
+        return iter(self.readline, "")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._paths = []
+        super().close()
+
+
+def open_recording(file_path: str):
+    """Opens a recording for reading as text, whether it is a plain file, a
+    gzipped file or the index of a segmented recording."""
+    if file_path.endswith(INDEX_SUFFIX):
+        return _SegmentReader(segment_paths(file_path))
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rt", encoding="utf-8")
+    return open(file_path, "r", encoding="utf-8")
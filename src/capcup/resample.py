@@ -0,0 +1,278 @@
+"""Module for putting capacitance trials onto uniform time grids.
+
+Host timestamps jitter, and the eval board formats only have a nominal rate, so
+comparing or merging trials requires resampling them onto a shared, uniformly
+spaced timeline. All methods are vectorized over channels and can be fed
+chunk-by-chunk so long recordings never have to be resampled in one piece.
+"""
+
+import numpy as np
+from scipy import signal
+
+METHODS = ("linear", "zoh", "decimate")
+
+
+def uniform_grid(start: float, stop: float, period: float) -> np.ndarray:
+    """Returns the times start, start + period, ... that are <= stop."""
+    num_points = int(np.floor((stop - start) / period + 1e-9)) + 1
+    return start + period * np.arange(max(num_points, 0))
+
+
+def native_period(time: np.ndarray) -> float:
+    """Robust estimate of the sampling period of a jittery time vector."""
+    return float(np.median(np.diff(time)))
+
+
+class UniformResampler:
+    """Incrementally resamples an irregularly sampled stream onto a uniform grid.
+
+    Samples are given with push() in time order and any grid points that are
+    fully determined by the data seen so far are returned immediately, so a
+    recording can be resampled in fixed-size chunks. Call flush() after the
+    last chunk to emit the remaining grid points.
+
+    Methods
+        linear: linear interpolation between the neighbouring samples
+        zoh: zero-order hold, ie. the most recent sample at each grid time
+        decimate: anti-aliased downsampling. The stream is linearly
+            interpolated onto a grid `factor` times finer than the target,
+            low-pass filtered with a zero-phase FIR filter, and every
+            `factor`-th point is kept.
+    """
+
+    def __init__(
+        self,
+        period: float,
+        method: str = "linear",
+        start: float = None,
+        source_period: float = None,
+        numtaps: int = None,
+    ):
+        """
+        Args:
+            period: the output sampling period, in the units of the timestamps
+            method: one of METHODS
+            start: time of the first grid point. Defaults to the first sample.
+            source_period: approximate period of the incoming samples, only
+                used by "decimate" to pick the oversampling factor. Estimated
+                from the first pushed chunk if not given.
+            numtaps: length of the decimation filter. Defaults to 8 taps per
+                unit of the decimation factor (always odd)."""
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+        self.period = period
+        self.method = method
+        self.start = start
+        self.source_period = source_period
+        self.numtaps = numtaps
+
+        self._next_index = 0  # index of the next grid point to evaluate
+        self._last_time = None  # last raw sample, kept for interpolation
+        self._last_values = None
+        self._factor = 1
+        self._taps = None
+        self._fine = None  # filter history for the decimate method
+        self._fine_start = 0  # fine grid index of the first history point
+
+    def _setup(self, time: np.ndarray, values: np.ndarray):
+        if self.start is None:
+            self.start = float(time[0])
+        if self.method != "decimate":
+            return
+        if self.source_period is None:
+            self.source_period = native_period(time) if len(time) > 1 else self.period
+        self._factor = max(int(np.ceil(self.period / self.source_period)), 1)
+        if self._factor == 1:
+            self.numtaps = 1
+        elif self.numtaps is None:
+            self.numtaps = 8 * self._factor + 1
+        self.numtaps += 1 - self.numtaps % 2
+        self._taps = (
+            signal.firwin(self.numtaps, 1 / self._factor)
+            if self._factor > 1
+            else np.ones(1)
+        )
+        # Pad the history with the first value so the start has no transient.
+        self._fine = np.repeat(values[:1], self.numtaps // 2, axis=0)
+        self._fine_start = -(self.numtaps // 2)
+
+    def push(self, time: np.ndarray, values: np.ndarray):
+        """Adds a chunk of samples and returns the newly determined grid points.
+
+        Args:
+            time: (n,) increasing sample times
+            values: (n,) or (n, channels) sample values
+
+        Returns:
+            (grid_times, grid_values) where grid_values has shape
+            (len(grid_times), channels)"""
+        time = np.asarray(time, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values[:, None]
+        if len(time) == 0:
+            return self._empty(values.shape[1])
+        if self._last_time is None:
+            self._setup(time, values)
+        else:
+            time = np.r_[self._last_time, time]
+            values = np.r_[self._last_values[None, :], values]
+
+        # For linear and zoh, a grid point is determined once a sample at or
+        # after it has arrived. The last sample is carried to the next chunk.
+        step = self.period / self._factor
+        last_index = int(np.floor((time[-1] - self.start) / step + 1e-9))
+        grid = self.start + step * np.arange(self._next_index, last_index + 1)
+        self._next_index = max(last_index + 1, self._next_index)
+        self._last_time, self._last_values = time[-1], values[-1]
+
+        return self._emit(grid, self._evaluate(time, values, grid))
+
+    def flush(self):
+        """Emits the grid points still held back by the decimation filter."""
+        if self._last_time is None or self.method != "decimate":
+            channels = 1 if self._last_values is None else len(self._last_values)
+            return self._empty(channels)
+        padding = np.repeat(self._last_values[None, :], self.numtaps // 2, axis=0)
+        return self._emit(np.empty(0), padding)
+
+    def _evaluate(self, time, values, grid):
+        if self.method == "zoh":
+            index = np.searchsorted(time, grid, side="right") - 1
+            return values[np.clip(index, 0, None)]
+        if len(time) < 2:
+            return np.repeat(values[:1], len(grid), axis=0)
+        index = np.clip(np.searchsorted(time, grid, side="right") - 1, 0, len(time) - 2)
+        span = time[index + 1] - time[index]
+        weight = np.divide(
+            grid - time[index], span, out=np.zeros_like(grid), where=span > 0
+        )
+        weight = np.clip(weight, 0, 1)[:, None]
+        return values[index] * (1 - weight) + values[index + 1] * weight
+
+    def _emit(self, grid, grid_values):
+        if self.method != "decimate":
+            return grid, grid_values
+
+        # Filter the fine grid and keep every factor-th point. The history
+        # holds the fine points that still need right-hand filter context.
+        fine = np.r_[self._fine, grid_values]
+        if len(fine) < self.numtaps:
+            self._fine = fine
+            return self._empty(fine.shape[1])
+        filtered = signal.oaconvolve(fine, self._taps[:, None], mode="valid", axes=0)
+        fine_index = self._fine_start + self.numtaps // 2 + np.arange(len(filtered))
+        keep = fine_index % self._factor == 0
+        self._fine = fine[len(filtered) :]
+        self._fine_start += len(filtered)
+        return (
+            self.start + self.period * (fine_index[keep] // self._factor),
+            filtered[keep],
+        )
+
+    @staticmethod
+    def _empty(channels):
+        return np.empty(0), np.empty((0, channels))
+
+
+def resample(
+    time: np.ndarray,
+    values: np.ndarray,
+    period: float,
+    method: str = "linear",
+    start: float = None,
+    chunk_size: int = None,
+):
+    """Resamples a whole stream onto a uniform grid.
+
+    Args:
+        time: (n,) increasing sample times
+        values: (n,) or (n, channels) sample values
+        period: the output sampling period
+        method: one of METHODS, see UniformResampler
+        start: time of the first grid point. Defaults to time[0].
+        chunk_size: number of samples resampled at a time, to bound the size
+            of the intermediate arrays for long recordings
+
+    Returns:
+        (grid_times, grid_values) with grid_values of shape (m, channels)"""
+    source_period = native_period(time) if len(time) > 1 else None
+    resampler = UniformResampler(
+        period, method, start=start, source_period=source_period
+    )
+    chunk_size = chunk_size or max(len(time), 1)
+    pieces = [
+        resampler.push(time[idx : idx + chunk_size], values[idx : idx + chunk_size])
+        for idx in range(0, len(time), chunk_size)
+    ]
+    pieces.append(resampler.flush())
+    return (
+        np.concatenate([grid for grid, _ in pieces]),
+        np.concatenate([grid_values for _, grid_values in pieces]),
+    )
+
+
+def resample_trial(trial, period: float = None, method: str = "linear", **kwargs):
+    """Resamples the cap_counts of any trial object (SerialData,
+    EvalBoardData, SciosenseCapData) onto a uniform grid.
+
+    Args:
+        trial: an object with `time` and `cap_counts` attributes
+        period: the output period. Defaults to the median sampling period.
+        method: one of METHODS
+        kwargs: passed on to resample()"""
+    if period is None:
+        period = native_period(trial.time)
+    return resample(trial.time, trial.cap_counts, period, method, **kwargs)
+
+
+def align(
+    streams: list,
+    period: float,
+    method: str = "linear",
+    offsets: list = None,
+    chunk_size: int = None,
+):
+    """Merges several trials or devices onto one shared uniform timeline.
+
+    The grid covers the union of all the streams. Points outside a stream's
+    own time range are NaN for that stream.
+
+    Args:
+        streams: trial objects with `time` and `cap_counts` attributes, or
+            (time, values) tuples
+        period: the shared sampling period
+        method: one of METHODS
+        offsets: per-stream time added to each stream's timestamps to put them
+            on a common clock, eg. [trial.start_time for trial in trials] for
+            SerialData. Defaults to all streams starting at 0.
+        chunk_size: see resample()
+
+    Returns:
+        (grid_times, [grid_values per stream])"""
+    pairs = [
+        (stream.time, stream.cap_counts) if hasattr(stream, "time") else stream
+        for stream in streams
+    ]
+    if offsets is None:
+        offsets = np.zeros(len(pairs))
+    times = [
+        np.asarray(time, dtype=float) + offset
+        for (time, _), offset in zip(pairs, offsets)
+    ]
+    start = min(time[0] for time in times)
+    grid = uniform_grid(start, max(time[-1] for time in times), period)
+
+    aligned = []
+    for time, (_, values) in zip(times, pairs):
+        # Start every stream on the shared grid so the indices line up.
+        first = start + period * np.ceil((time[0] - start) / period - 1e-9)
+        stream_grid, stream_values = resample(
+            time, values, period, method, start=first, chunk_size=chunk_size
+        )
+        merged = np.full((len(grid), stream_values.shape[1]), np.nan)
+        index = np.rint((stream_grid - start) / period).astype(int)
+        valid = (index >= 0) & (index < len(grid))
+        merged[index[valid]] = stream_values[valid]
+        aligned.append(merged)
+    return grid, aligned
@@ -0,0 +1,341 @@
+"""Module for fanning the recorder's live samples out to other processes.
+
+Only one process can open the serial port, so the recorder publishes every
+decoded frame (host timestamp, 8 channel counts and the actuation flag) into a
+ring buffer in shared memory. Any number of local readers attach to it by
+name and copy out the frames they have not seen yet, without ever blocking
+the recorder. A TcpRelay serves the same frames as text lines to viewers on
+other machines.
+
+Shared memory layout, all 8 byte words:
+    header: [frames published, capacity, frame width, publisher pid]
+    seqs: (capacity,) sequence number of the frame in each slot, -1 while
+        the slot is being written
+    frames: (capacity, width) float64
+
+The publisher marks a slot -1, writes the frame, then stores its sequence
+number and finally advances the header. A reader checks a slot's sequence
+number before and after copying it (a seqlock), so frames overwritten while
+being copied are dropped rather than returned torn. This relies on stores
+becoming visible in program order, as they do on x86.
+"""
+
+import argparse
+from multiprocessing import resource_tracker, shared_memory
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+from capcup.serial_stream import DATA_POINTS, SerialDecoder
+
+DEFAULT_NAME = "capcup_samples"
+DEFAULT_CAPACITY = 1 << 16
+HEADER_WORDS = 4
+FRAME_WIDTH = 1 + DATA_POINTS  # host timestamp + counts + flag
+
+
+def _layout(buffer, capacity: int, width: int):
+    header = np.ndarray((HEADER_WORDS,), np.int64, buffer)
+    seqs = np.ndarray((capacity,), np.int64, buffer, HEADER_WORDS * 8)
+    frames = np.ndarray(
+        (capacity, width), np.float64, buffer, (HEADER_WORDS + capacity) * 8
+    )
+    return header, seqs, frames
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name != "posix":
+        # Windows frees shared memory with its last handle, so memory that
+        # still exists is in use
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_stale(name: str) -> None:
+    """Removes the shared memory of a name left behind by a publisher that
+    crashed, but not that of one still running (eg. the recorder of
+    another port using the default name)."""
+    existing = shared_memory.SharedMemory(name=name)
+    pid = 0
+    if existing.size >= HEADER_WORDS * 8:
+        pid = int(np.ndarray((HEADER_WORDS,), np.int64, existing.buf)[3])
+    if pid > 0 and _process_alive(pid):
+        if os.name == "posix" and pid != os.getpid():
+            # attaching registered it, don't unlink it when we exit
+            resource_tracker.unregister(existing._name, "shared_memory")
+        existing.close()
+        raise FileExistsError(
+            f"Shared memory {name} is in use by publisher process {pid}, "
+            "publish under another name"
+        )
+    existing.close()
+    existing.unlink()
+
+
+class SamplePublisher:
+    """Owns the shared memory ring buffer and writes frames into it."""
+
+    def __init__(
+        self,
+        name: str = DEFAULT_NAME,
+        capacity: int = DEFAULT_CAPACITY,
+        width: int = FRAME_WIDTH,
+    ):
+        """
+        Args:
+            name: shared memory name readers attach to
+            capacity: frames kept, ie. how far behind a reader may fall
+            width: values per frame
+
+        Raises:
+            FileExistsError: if a publisher of that name is still running"""
+        size = (HEADER_WORDS + capacity + capacity * width) * 8
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            _remove_stale(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        self.capacity = capacity
+        self.header, self.seqs, self.frames = _layout(self.shm.buf, capacity, width)
+        self.seqs[:] = -1
+        self.header[:] = (0, capacity, width, os.getpid())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def published(self) -> int:
+        return int(self.header[0])
+
+    def publish(self, timestamp: float, values) -> int:
+        """Writes one frame and returns its sequence number."""
+        seq = int(self.header[0])
+        slot = seq % self.capacity
+        self.seqs[slot] = -1
+        self.frames[slot, 0] = timestamp
+        self.frames[slot, 1:] = values
+        self.seqs[slot] = seq
+        self.header[0] = seq + 1
+        return seq
+
+    def close(self) -> None:
+        """Releases and removes the shared memory."""
+        if self.shm is None:
+            return
+        del self.header, self.seqs, self.frames
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+
+class SampleReader:
+    """Attaches to a publisher's ring buffer and reads the frames published
+    since its last read."""
+
+    def __init__(self, name: str = DEFAULT_NAME, from_start: bool = False):
+        """
+        Args:
+            name: the publisher's shared memory name
+            from_start: read the frames still in the buffer, instead of only
+                those published after attaching
+
+        Raises:
+            FileNotFoundError: if no publisher of that name is running"""
+        self.shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            # the publisher owns the memory, don't unlink it when we exit
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        header = np.ndarray((HEADER_WORDS,), np.int64, self.shm.buf)
+        self.capacity, self.width = int(header[1]), int(header[2])
+        self.header, self.seqs, self.frames = _layout(
+            self.shm.buf, self.capacity, self.width
+        )
+        head = self.published
+        self.next_seq = max(0, head - self.capacity) if from_start else head
+        self.dropped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def published(self) -> int:
+        return int(self.header[0])
+
+    @property
+    def lag(self) -> int:
+        """Frames published but not read yet."""
+        return self.published - self.next_seq
+
+    def read(self, max_frames: int = None) -> np.ndarray:
+        """Copies out the frames published since the last read, oldest first.
+
+        Frames the publisher overwrote before they were read are skipped and
+        counted in self.dropped.
+
+        Args:
+            max_frames: read at most this many (the oldest unread)
+
+        Returns:
+            (frames, width) array of [timestamp, counts..., flag]"""
+        head = self.published
+        start = self.next_seq
+        if head - start > self.capacity:
+            self.dropped += head - self.capacity - start
+            start = head - self.capacity
+        stop = head if max_frames is None else min(head, start + max_frames)
+        if stop <= start:
+            return np.empty((0, self.width))
+        expected = np.arange(start, stop)
+        slots = expected % self.capacity
+        before = self.seqs[slots]
+        frames = self.frames[slots]
+        valid = (before == expected) & (self.seqs[slots] == expected)
+        self.next_seq = stop
+        if not valid.all():
+            self.dropped += int(np.count_nonzero(~valid))
+            frames = frames[valid]
+        return frames
+
+    def latest(self, count: int) -> np.ndarray:
+        """A view of up to count most recent slots, without copying or
+        advancing the read position, eg. for a live plot. Slots may be
+        overwritten while the view is used."""
+        head = self.published
+        count = min(count, head, self.capacity)
+        slots = np.arange(head - count, head) % self.capacity
+        if count and slots[0] <= slots[-1]:
+            return self.frames[slots[0] : slots[-1] + 1]
+        return self.frames[slots]
+
+    def close(self) -> None:
+        if self.shm is None:
+            return
+        del self.header, self.seqs, self.frames
+        self.shm.close()
+        self.shm = None
+
+
+def format_frame(frame) -> str:
+    """A frame as a recorder file line: "timestamp c1 ... c8 flag"."""
+    return f"{frame[0]:.6f} " + " ".join(str(int(value)) for value in frame[1:])
+
+
+class _RelayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        relay = self.server.relay
+        with SampleReader(relay.name) as reader:
+            while not relay.stopped.is_set():
+                frames = reader.read()
+                if not len(frames):
+                    time.sleep(relay.poll_interval)
+                    continue
+                text = "\n".join(map(format_frame, frames)) + "\n"
+                try:
+                    self.request.sendall(text.encode())
+                except OSError:
+                    return
+
+
+class _RelayServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class TcpRelay:
+    """Serves the frames of a ring buffer as text lines over TCP. Every client
+    gets its own thread and reader, so a slow client only drops its own
+    frames."""
+
+    def __init__(
+        self,
+        name: str = DEFAULT_NAME,
+        host: str = "0.0.0.0",
+        port: int = 8765,
+        poll_interval: float = 0.005,
+    ):
+        """
+        Args:
+            name: the publisher's shared memory name
+            host: address to listen on, "127.0.0.1" for this machine only
+            port: port to listen on, 0 for any free port
+            poll_interval: seconds between polls of the ring buffer"""
+        self.name = name
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+        self.server = _RelayServer((host, port), _RelayHandler)
+        self.server.relay = self
+        self.address = self.server.server_address
+        self._thread = None
+
+    def start(self) -> "TcpRelay":
+        """Serves in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def tcp_frames(host: str, port: int = 8765, timeout: float = None):
+    """Yields the frames served by a TcpRelay as lists of floats."""
+    decoder = SerialDecoder()
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        while True:
+            chunk = connection.recv(1 << 16)
+            if not chunk:
+                return
+            for line in decoder.lines(chunk.decode()):
+                yield [float(value) for value in line.split(" ")]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Print the recorder's live samples, or relay them over TCP"
+    )
+    parser.add_argument("--name", type=str, default=DEFAULT_NAME)
+    parser.add_argument("--relay", type=int, help="Serve the samples on this port")
+    parser.add_argument("--connect", type=str, help="host:port of a relay to read")
+    args = parser.parse_args()
+
+    if args.relay:
+        relay = TcpRelay(args.name, port=args.relay)
+        print("Relaying", args.name, "on port", relay.address[1])
+        relay.server.serve_forever()
+    elif args.connect:
+        host, port = args.connect.rsplit(":", 1)
+        for frame in tcp_frames(host, int(port)):
+            print(format_frame(frame))
+    else:
+        with SampleReader(args.name) as reader:
+            while True:
+                frames = reader.read()
+                for frame in frames:
+                    print(format_frame(frame))
+                if reader.dropped:
+                    print("Dropped", reader.dropped, "frames")
+                    reader.dropped = 0
+                time.sleep(0.01)
+
+
+if __name__ == "__main__":
+    main()
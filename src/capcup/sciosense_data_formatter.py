@@ -4,6 +4,13 @@ import os
 import re
 import numpy as np
 
+from capcup.profiling import stage
+from capcup.recording_segments import is_trial_file, open_recording
+from capcup.trial_cache import LazyTrial, TrialCache, cached_read, trial_hash
+
+LABEL_PATTERN = r"%?C\d+/C\d+"
+CACHE_FIELDS = ("data_label", "data_labels", "cap_data")
+
 
 class SciosenseCapData:
     """An object defining a single data collection done on the PCAP01 eval
@@ -11,57 +18,111 @@ class SciosenseCapData:
     consistent, so the code for managing the header may not be correct in
     general.
 
+    The data section starts after a line of ratio labels (eg. "%C1/C0" or
+    "%C1/C0\t%C2/C0\t%C3/C0"). Every ratio column is loaded into cap_data;
+    cap_counts is the first column, as single column files were read before.
+
     """
 
-    def __init__(self, file_path: str, sampling_rate: float = 14.3):
+    def __init__(
+        self, file_path: str, sampling_rate: float = 14.3, cache: TrialCache = None
+    ):
         """
         Args:
-            file_path:"""
+            file_path:
+            sampling_rate: the nominal output rate of the board, in Hz
+            cache: if given, the parsed arrays are stored in and loaded from
+                this cache instead of parsing the file every time"""
         self.trial_name = os.path.split(file_path)[1]
-        self.data_label, self.cap_counts = self._read_file(file_path)
+        self.file_path = file_path
+        self.cache_key = trial_hash(file_path)
+        with stage("sciosense.load"):
+            self.data_label, self.data_labels, self.cap_data = cached_read(
+                cache, file_path, "sciosense", self._read_file, CACHE_FIELDS
+            )
+        self.data_labels = list(self.data_labels)
+        self.cap_counts = self.cap_data[:, 0]
         self.sampling_period = 1 / sampling_rate
         self.time = np.arange(
             0, len(self.cap_counts) * self.sampling_period, self.sampling_period
-        )
+        )[: len(self.cap_counts)]
+
+    def channel(self, label: str) -> np.ndarray:
+        """The column of cap_data for a ratio label, eg. "C2/C0"."""
+        return self.cap_data[:, self.data_labels.index(label.lstrip("%"))]
 
     def _read_file(self, file_path: str):
-        """Reads the file and extracts headers and numerical data as NumPy arrays."""
+        """Reads the file and extracts the ratio labels and all the ratio
+        columns as a 2D NumPy array in one pass."""
         data_label = ""
-        data_start = False
-        cap_data = []
-
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f.readlines():
+        with open_recording(file_path) as f:
+            # The header is short, read it line by line up to the label line
+            while True:
+                line = f.readline()
+                if not line:
+                    return data_label, [], np.empty((0, 1))
                 line = line.strip()
                 if not line:
                     continue
+                data_label = line
+                if re.fullmatch(rf"{LABEL_PATTERN}(\s+{LABEL_PATTERN})*", line):
+                    break
 
-                if not data_start:
-                    # Handle headers (only care about parameters, ie where ":" are)
-                    data_label = line
-                else:
-                    # Parse data section
-                    data_columns = line.split("\t")
-                    cap_data.append(float(data_columns[0]))
-
-                if not data_start and re.match(
-                    r"^%C\d+/C\d+$", line
-                ):  # Detects hexadecimal rows (data section)
-                    data_start = True
+            # then hand the rest of the file to NumPy's parser.
+            data_start = f.tell()
+            first_row = ""
+            while not first_row:
+                first_row = f.readline()
+                if not first_row:
+                    break
+                first_row = first_row.strip()
+            num_columns = max(len(first_row.split()), 1)
+            if first_row:
+                f.seek(data_start)
+                with stage("sciosense.parse"):
+                    try:
+                        cap_data = np.loadtxt(f, usecols=range(num_columns), ndmin=2)
+                    except ValueError:
+                        # An interrupted recording ends in a partial row, keep
+                        # only the complete ones
+                        f.seek(data_start)
+                        rows = [line.split()[:num_columns] for line in f]
+                        rows = [row for row in rows if len(row) == num_columns]
+                        cap_data = np.array(rows, dtype=float).reshape(
+                            -1, num_columns
+                        )
+            else:
+                cap_data = np.empty((0, num_columns))
 
-        cap_counts = np.array(cap_data)
+        data_labels = [label.lstrip("%") for label in data_label.split()]
+        data_labels += [f"col{idx}" for idx in range(len(data_labels), num_columns)]
+        return data_label, data_labels[:num_columns], cap_data
 
-        return data_label, cap_counts
 
+def format_folder(
+    folder_path: str,
+    sampling_rate: float = 14.3,
+    cache: TrialCache = None,
+    lazy: bool = False,
+):
+    """Given a folder path, generate SciosenseCapData objects for all files.
 
-def format_folder(folder_path: str):
-    """Given a folder path, generate EvalBoardData objects for all files."""
+    Args:
+        folder_path: the folder of recordings
+        sampling_rate: see SciosenseCapData
+        cache: optional TrialCache used by every trial
+        lazy: if True, return LazyTrial objects that only read their file when
+            first used"""
     data_objects = []
     directory_items = sorted(os.listdir(folder_path))
     for item in directory_items:
-        if item == "Settings.txt":
+        if not is_trial_file(item):
             continue
         item_path = os.path.join(folder_path, item)
         if os.path.isfile(item_path):
-            data_objects.append(SciosenseCapData(item_path))
+            kwargs = {"sampling_rate": sampling_rate, "cache": cache}
+            if lazy:
+                data_objects.append(LazyTrial(SciosenseCapData, item_path, **kwargs))
+            else:
+                data_objects.append(SciosenseCapData(item_path, **kwargs))
     return data_objects
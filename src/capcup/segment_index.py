@@ -0,0 +1,318 @@
+"""Module for finding the past actuation segments most similar to a given one.
+
+Every press of a SerialData trial (flag high from an actuation start to the
+next actuation end) is embedded as a fixed length vector: either its signal,
+relative to the baseline before the press, resampled to a fixed number of
+points per channel, or a set of feature_matrix FEATURES of the press. The
+vectors are stored as float32 next to references to where they came from, and
+k-nearest neighbour queries go through a scipy cKDTree.
+
+Trials are added incrementally. New vectors wait in a pending buffer that is
+searched by brute force alongside the tree, and the tree is only rebuilt once
+the buffer has grown to a fraction of the index.
+"""
+
+from dataclasses import dataclass, field
+import json
+import os
+import tempfile
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from capcup.feature_matrix import FEATURES
+from capcup.recording_segments import is_trial_file
+from capcup.serial_data_formatter import SerialData
+from capcup.trial_cache import LazyTrial, TrialCache, trial_hash
+
+EMBEDDINGS = ("signature", "features")
+
+
+def press_bounds(actuations: np.ndarray):
+    """(starts, ends) sample indices of every complete press of a trial."""
+    change = np.diff(np.asarray(actuations).astype(int))
+    starts = np.flatnonzero(change == 1) + 1
+    ends = np.flatnonzero(change == -1) + 1
+    ends = ends[ends > starts[0]] if len(starts) else ends[:0]
+    count = min(len(starts), len(ends))
+    return starts[:count], ends[:count]
+
+
+def resample_rows(data: np.ndarray, length: int) -> np.ndarray:
+    """Linearly resamples a (samples, channels) array to (length, channels)."""
+    position = np.linspace(0, len(data) - 1, length)
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1, len(data) - 1)
+    weight = (position - below)[:, None]
+    return data[below] * (1 - weight) + data[above] * weight
+
+
+def embed_segment(
+    counts: np.ndarray,
+    baseline: np.ndarray,
+    embedding: str = "signature",
+    length: int = 16,
+    features: tuple = ("mean", "std", "ptp", "slope"),
+) -> np.ndarray:
+    """The vector of one segment.
+
+    Args:
+        counts: (samples, channels) signal of the segment
+        baseline: (channels,) signal before the segment, subtracted first
+        embedding: one of EMBEDDINGS
+        length: points per channel of a signature
+        features: names of FEATURES for a "features" embedding
+
+    Returns:
+        (length * channels,) or (len(features) * channels,) float32 vector"""
+    data = np.asarray(counts, dtype=float) - baseline
+    if embedding == "signature":
+        vector = resample_rows(data, length).T.ravel()
+    elif embedding == "features":
+        windows = data.T[None]
+        vector = np.concatenate([FEATURES[name](windows)[0] for name in features])
+    else:
+        raise ValueError(f"embedding must be one of {EMBEDDINGS}, not {embedding}")
+    return vector.astype(np.float32)
+
+
+@dataclass
+class SegmentRef:
+    """Where an indexed segment came from. The trial is only read when the
+    segment's data is first used.
+
+    Attributes:
+        file_path: the trial's file
+        start: first sample of the segment
+        stop: sample after the segment
+    """
+
+    file_path: str
+    start: int
+    stop: int
+    trial: LazyTrial = field(default=None, repr=False, compare=False)
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.trial.time[self.start : self.stop]
+
+    @property
+    def cap_counts(self) -> np.ndarray:
+        return self.trial.cap_counts[self.start : self.stop]
+
+
+@dataclass
+class SegmentMatch:
+    distance: float
+    ref: SegmentRef
+
+
+def _save_atomic(path: str, write) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class SegmentIndex:
+    """A k-nearest neighbour index of the presses of many trials, optionally
+    kept in a directory between sessions."""
+
+    def __init__(
+        self,
+        index_dir: str = None,
+        embedding: str = "signature",
+        length: int = 16,
+        features: tuple = ("mean", "std", "ptp", "slope"),
+        baseline_samples: int = 20,
+        cache: TrialCache = None,
+        rebuild_fraction: float = 0.1,
+    ):
+        """
+        Args:
+            index_dir: directory the index is saved to and loaded from. The
+                embedding settings of an existing index take precedence.
+            embedding: one of EMBEDDINGS, see embed_segment
+            length: points per channel of a signature
+            features: names of FEATURES for a "features" embedding
+            baseline_samples: samples before a press its baseline is the
+                median of
+            cache: optional TrialCache trials are read through
+            rebuild_fraction: the tree is rebuilt when the pending vectors
+                reach this fraction of the indexed ones"""
+        self.index_dir = index_dir
+        self.settings = {
+            "embedding": embedding,
+            "length": length,
+            "features": list(features),
+            "baseline_samples": baseline_samples,
+        }
+        self.cache = cache
+        self.rebuild_fraction = rebuild_fraction
+        self.vectors = None  # (segments, dims) float32, in the tree
+        self.pending = []  # vectors not in the tree yet
+        self.refs = []  # [file_path, start, stop] per vector, tree then pending
+        self.trials = {}  # file_path: trial hash when it was indexed
+        self._tree = None
+        self._lazy = {}
+        if index_dir is not None and os.path.isfile(self._path("index.json")):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _load(self) -> None:
+        with open(self._path("index.json"), encoding="utf-8") as f:
+            saved = json.load(f)
+        self.settings = saved["settings"]
+        self.refs = saved["refs"]
+        self.trials = saved["trials"]
+        vectors = np.load(self._path("vectors.npy"))
+        # An index saved while empty has (0, 0) vectors, which would not
+        # concatenate with the first real ones.
+        self.vectors = vectors if len(vectors) else None
+        self._tree = cKDTree(self.vectors) if len(vectors) else None
+
+    def save(self) -> None:
+        """Writes the index to index_dir, merging in the pending vectors."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.rebuild()
+        vectors = self._all_vectors()
+        _save_atomic(self._path("vectors.npy"), lambda f: np.save(f, vectors))
+        saved = {"settings": self.settings, "refs": self.refs, "trials": self.trials}
+        _save_atomic(
+            self._path("index.json"), lambda f: f.write(json.dumps(saved).encode())
+        )
+
+    def embed(self, counts: np.ndarray, baseline: np.ndarray) -> np.ndarray:
+        settings = self.settings
+        return embed_segment(
+            counts,
+            baseline,
+            settings["embedding"],
+            settings["length"],
+            tuple(settings["features"]),
+        )
+
+    def trial_vectors(self, trial) -> tuple:
+        """(vectors, refs) of the presses of a loaded trial."""
+        starts, ends = press_bounds(trial.actuations)
+        vectors, refs = [], []
+        for start, end in zip(starts, ends):
+            before = trial.cap_counts[
+                max(start - self.settings["baseline_samples"], 0) : start
+            ]
+            if not len(before):
+                continue
+            baseline = np.median(before, axis=0)
+            vectors.append(self.embed(trial.cap_counts[start:end], baseline))
+            refs.append([trial.file_path, int(start), int(end)])
+        return vectors, refs
+
+    def add_trial(self, file_path: str) -> int:
+        """Indexes the presses of a SerialData file, unless it is indexed
+        already. A file that changed since it was indexed is re-indexed.
+
+        Returns:
+            the number of segments added"""
+        key = trial_hash(file_path)
+        if self.trials.get(file_path) == key:
+            return 0
+        if file_path in self.trials:
+            self._remove(file_path)
+        trial = SerialData(file_path, cache=self.cache)
+        vectors, refs = self.trial_vectors(trial)
+        self.pending += vectors
+        self.refs += refs
+        self.trials[file_path] = key
+        built = 0 if self.vectors is None else len(self.vectors)
+        if len(self.pending) > max(self.rebuild_fraction * built, 256):
+            self.rebuild()
+        return len(vectors)
+
+    def add_folder(self, folder_path: str) -> int:
+        """add_trial for every trial in a folder, see format_folder."""
+        added = 0
+        for item in sorted(os.listdir(folder_path)):
+            item_path = os.path.join(folder_path, item)
+            if not is_trial_file(item):
+                continue
+            if os.path.isfile(item_path):
+                added += self.add_trial(item_path)
+        return added
+
+    def _all_vectors(self) -> np.ndarray:
+        parts = [] if self.vectors is None else [self.vectors]
+        if self.pending:
+            parts.append(np.array(self.pending, dtype=np.float32))
+        if not parts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(parts)
+
+    def _remove(self, file_path: str) -> None:
+        keep = [idx for idx, ref in enumerate(self.refs) if ref[0] != file_path]
+        vectors = self._all_vectors()
+        self.vectors = vectors[keep] if keep else None
+        self.refs = [self.refs[idx] for idx in keep]
+        self.pending = []
+        self._tree = cKDTree(self.vectors) if len(keep) else None
+        del self.trials[file_path]
+        self._lazy.pop(file_path, None)
+
+    def remove_trial(self, file_path: str) -> None:
+        """Drops the segments of a trial, eg. after its file was deleted."""
+        if file_path in self.trials:
+            self._remove(file_path)
+
+    def rebuild(self) -> None:
+        """Moves the pending vectors into the tree."""
+        if self.pending:
+            self.vectors = self._all_vectors()
+            self.pending = []
+            self._tree = cKDTree(self.vectors) if len(self.vectors) else None
+
+    def ref(self, idx: int) -> SegmentRef:
+        file_path, start, stop = self.refs[idx]
+        if file_path not in self._lazy:
+            self._lazy[file_path] = LazyTrial(SerialData, file_path, cache=self.cache)
+        return SegmentRef(file_path, start, stop, self._lazy[file_path])
+
+    def query(self, vector: np.ndarray, k: int = 5) -> list:
+        """The k indexed segments closest to an embedded segment.
+
+        Args:
+            vector: output of embed (or embed_segment with the same settings)
+            k: number of matches
+
+        Returns:
+            SegmentMatch list, nearest first"""
+        vector = np.asarray(vector, dtype=np.float32)
+        distances, indices = np.empty(0), np.empty(0, dtype=int)
+        built = 0
+        if self._tree is not None:
+            built = len(self.vectors)
+            distances, indices = self._tree.query(vector, k=min(k, built))
+            distances, indices = np.atleast_1d(distances), np.atleast_1d(indices)
+        if self.pending:
+            pending = np.linalg.norm(
+                np.array(self.pending, dtype=np.float32) - vector, axis=1
+            )
+            distances = np.r_[distances, pending]
+            indices = np.r_[indices, built + np.arange(len(pending))]
+        order = np.argsort(distances, kind="stable")[:k]
+        return [
+            SegmentMatch(float(distances[idx]), self.ref(int(indices[idx])))
+            for idx in order
+        ]
+
+    def query_segment(self, counts: np.ndarray, baseline: np.ndarray, k: int = 5):
+        """query with a segment's signal, see embed_segment."""
+        return self.query(self.embed(counts, baseline), k)
@@ -1,37 +1,59 @@
 """Module for processing AD7746 switch mux board serial data files."""
 
+import json
 import os
 import numpy as np
+import pandas as pd
+
+from capcup.profiling import stage
+from capcup.recording_segments import is_trial_file, open_recording
+from capcup.trial_cache import LazyTrial, TrialCache, cached_read, trial_hash
+
+CACHE_FIELDS = ("time", "cap_counts", "actuations", "start_time")
+EVENT_PREFIX = "#EVENT"
 
 
 class SerialData:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, cache: TrialCache = None):
         """
         Args:
-            file_path:"""
+            file_path:
+            cache: if given, the parsed arrays are stored in and loaded from
+                this cache instead of parsing the file every time"""
         self.name = os.path.split(file_path)[1]
-        self.time, self.cap_counts, self.actuations = self._read_file(file_path)
+        self.file_path = file_path
+        self.cache_key = trial_hash(file_path)
+        with stage("serial.load"):
+            self.time, self.cap_counts, self.actuations, self.start_time = (
+                cached_read(cache, file_path, "serial", self._read_file, CACHE_FIELDS)
+            )
         self.sampling_period = np.mean(np.diff(self.time))
 
-        self.actuation_starts = (
-            np.where(np.diff(self.actuations.astype(int)) == 1)[0] + 1
-        )
-        self.actuation_ends = (
-            np.where(np.diff(self.actuations.astype(int)) == -1)[0] + 1
-        )
-        self.segment_starts = np.r_[
-            0, np.where(np.diff(self.actuations.astype(int)) == -1)[0][:-1] + 1
-        ]
-        self.segment_ends = np.where(np.diff(self.actuations.astype(int)) == 1)[0] + 1
+        with stage("serial.segments"):
+            self.actuation_starts = (
+                np.where(np.diff(self.actuations.astype(int)) == 1)[0] + 1
+            )
+            self.actuation_ends = (
+                np.where(np.diff(self.actuations.astype(int)) == -1)[0] + 1
+            )
+            self.segment_starts = np.r_[
+                0, np.where(np.diff(self.actuations.astype(int)) == -1)[0][:-1] + 1
+            ]
+            self.segment_ends = (
+                np.where(np.diff(self.actuations.astype(int)) == 1)[0] + 1
+            )
 
     def _read_file(self, file_path: str):
         """Reads the file and extracts headers and numerical data as NumPy arrays."""
         timestamps, cap_data, actuation = [], [], []
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f.readlines():
+        with stage("serial.io"), open_recording(file_path) as f:
+            lines = f.readlines()
+
+        with stage("serial.parse"):
+            for line in lines:
                 line = line.strip()
-                if not line:
+                if not line or line[0] == "#":
                     continue
 
                 raw_values = line.split(" ")
@@ -46,25 +68,55 @@ class SerialData:
                     cap_data.append(values[1:9])
                     actuation.append(values[-1])
 
-        cap_counts = np.array(cap_data, dtype=np.int32)
-        actuations = np.array(actuation, dtype=np.int32)
-        timestamps = np.array(timestamps) - timestamps[0]
+        with stage("serial.to_numpy"):
+            cap_counts = np.array(cap_data, dtype=np.int32)
+            actuations = np.array(actuation, dtype=np.int32)
+            start_time = timestamps[0]  # host clock, for aligning with other streams
+            timestamps = np.array(timestamps) - start_time
 
-        return timestamps, cap_counts, actuations
+        return timestamps, cap_counts, actuations, start_time
 
     def normalize(self, data):
         """Zero the data around its mean"""
         return data - np.mean(data[: self.segment_ends[0]], axis=0)
 
 
-def format_folder(folder_path: str):
-    """Given a folder path, generate EvalBoardData objects for all files."""
+def format_event(timestamp: float, kind: str, **payload) -> str:
+    """A line stamping an event (eg. a commanded pose) into a recording, at a
+    host time comparable to the samples'. The loaders skip it."""
+    return f"{EVENT_PREFIX} {timestamp} {kind} {json.dumps(payload)}\n"
+
+
+def read_events(file_path: str) -> pd.DataFrame:
+    """The events stamped into a recording, with a "time" and a "kind" column
+    and a column per payload key."""
+    events = []
+    with open_recording(file_path) as f:
+        for line in f:
+            if line.startswith(EVENT_PREFIX):
+                _, timestamp, kind, payload = line.rstrip("\n").split(" ", 3)
+                events.append({"time": float(timestamp), "kind": kind})
+                events[-1].update(json.loads(payload))
+    return pd.DataFrame(events, columns=None if events else ["time", "kind"])
+
+
+def format_folder(folder_path: str, cache: TrialCache = None, lazy: bool = False):
+    """Given a folder path, generate SerialData objects for all files.
+
+    Args:
+        folder_path: the folder of recordings
+        cache: optional TrialCache used by every trial
+        lazy: if True, return LazyTrial objects that only read their file when
+            first used"""
     data_objects = []
     directory_items = sorted(os.listdir(folder_path))
     for item in directory_items:
-        if item == "Settings.txt":
+        if not is_trial_file(item):
             continue
         item_path = os.path.join(folder_path, item)
         if os.path.isfile(item_path):
-            data_objects.append(SerialData(item_path))
+            if lazy:
+                data_objects.append(LazyTrial(SerialData, item_path, cache=cache))
+            else:
+                data_objects.append(SerialData(item_path, cache=cache))
     return data_objects
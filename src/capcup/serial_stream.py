@@ -0,0 +1,37 @@
+"""Module for decoding the mux board's serial stream, as record_serial does.
+
+The board sends one line per sample: 8 channel counts and the actuation flag,
+separated by spaces. Reads return arbitrary chunks of that stream, so the
+decoder keeps the trailing partial line until the rest of it arrives.
+"""
+
+DATA_POINTS = 8 + 1  # 8 channels + 1 actuation flag
+
+
+class SerialDecoder:
+    """Splits chunks of the serial stream into complete lines."""
+
+    def __init__(self):
+        self.buffer = ""
+
+    def lines(self, chunk: str) -> list:
+        """Adds a chunk and returns the complete, non-empty lines, stripped.
+
+        The buffer is split once per chunk, rather than once per line, so a
+        large backlog is decoded in linear time."""
+        if not chunk:
+            return []
+        *lines, self.buffer = (self.buffer + chunk).split("\n")
+        return [line for line in map(str.strip, lines) if line]
+
+
+def parse_line(line: str, data_points: int = DATA_POINTS) -> list:
+    """The integer values of a line.
+
+    Raises:
+        ValueError: if a value is not an integer or there are not data_points
+            of them"""
+    values = [int(entry) for entry in line.split(" ")]
+    if len(values) != data_points:
+        raise ValueError(f"Expected {data_points} values, got {len(values)}. {values}")
+    return values
@@ -0,0 +1,417 @@
+"""Module for generating synthetic recordings in the formats of the three
+loaders, at any size, to test and benchmark them at realistic scale.
+
+Files are written in chunks, and every line of a format has a fixed width so
+a chunk is formatted with integer arithmetic straight into a byte buffer
+rather than with a string format per line. This writes roughly 100 MB/s, so a
+10 GB file takes a couple of minutes.
+
+Deliberate corruption mimics what each loader has to cope with:
+    - serial (SerialData): garbled lines, where a dropped or broken byte
+        splits a field. The loader skips them.
+    - eval (EvalBoardData) and sciosense (SciosenseCapData): glitched
+        samples, ie. a flipped bit or a spike in otherwise valid lines, since
+        those loaders parse every line of the data section.
+"""
+
+import argparse
+import os
+
+import numpy as np
+from scipy.signal import lfilter
+
+FORMATS = ("serial", "eval", "sciosense")
+PATTERNS = ("square", "random", "none")
+START_TIME = 1_700_000_000  # host clock of the first serial sample, in s
+
+SERIAL_LINE = 17 + 9 * 8 + 2 + 1  # time, 8 channels, flag, newline
+EVAL_LINE = 6 + 1 + 6 + 1
+SCIOSENSE_FIELD = 8 + 1  # d.dddddd and a tab or newline
+EVAL_HEADER = (
+    "AD7746 Evaluation Board\n"
+    "Channel: CAP1\tExcitation: EXC A\tCapdac: 0\n"
+    "Conv. Time: {conv_time} ms\tMode: Continuous\n"
+    "\n"
+    "CAP\tVT\n"
+)
+SCIOSENSE_HEADER = "PCAP01 Evaluation\nFirmware: 03.01.02\n\n"
+DIGIT_PAIRS = np.array([[48 + i // 10, 48 + i % 10] for i in range(100)], np.uint8)
+
+
+class SignalGenerator:
+    """Streams capacitance-like counts and an actuation flag, chunk by chunk.
+
+    Each channel is a baseline plus a slow random walk drift, a first order
+    response to the actuation flag and white noise. The filter and drift state
+    carry over between chunks and every random process draws from its own
+    stream, so the output does not depend on chunk size (for a given seed)."""
+
+    def __init__(
+        self,
+        channels: int = 8,
+        baseline: float = 8_000_000,
+        noise: float = 50.0,
+        amplitude: float = 20_000,
+        drift: float = 1.0,
+        response_samples: float = 5,
+        pattern: str = "square",
+        cycle: int = 200,
+        duty: float = 0.5,
+        rng=None,
+    ):
+        """
+        Args:
+            channels: number of channels
+            baseline: mean count of the channels at rest
+            noise: standard deviation of the white noise, in counts
+            amplitude: largest change of a channel when actuated. Each channel
+                gets a random fraction of it, of either sign.
+            drift: standard deviation of the drift per sample, in counts
+            response_samples: time constant of the response, in samples
+            pattern: one of PATTERNS. "square" actuates for duty * cycle
+                samples every cycle samples, "random" alternates segments with
+                exponentially distributed lengths averaging cycle / 2, "none"
+                never actuates.
+            cycle: samples per actuation cycle
+            duty: fraction of each cycle actuated
+            rng: a np.random.Generator or seed"""
+        if pattern not in PATTERNS:
+            raise ValueError(f"pattern must be one of {PATTERNS}, not {pattern}")
+        rng = np.random.default_rng(rng)
+        self.channels = channels
+        self.noise = noise
+        self.drift = drift
+        self.pattern = pattern
+        self.cycle = cycle
+        self.duty = duty
+        self.baseline = baseline + rng.normal(0, baseline / 100, channels)
+        self.amplitude = amplitude * rng.uniform(-1, 1, channels)
+        self._flag_rng, self._drift_rng, self._noise_rng = rng.spawn(3)
+        self.alpha = 1 / max(response_samples, 1)
+        self.num_samples = 0
+        self._drift = np.zeros(channels)
+        self._response = np.zeros((1, channels))
+        self._flag = 0
+        self._remaining = 0  # samples left in the current "random" segment
+
+    def flags(self, num_samples: int) -> np.ndarray:
+        """The next num_samples of the actuation flag."""
+        if self.pattern == "none":
+            return np.zeros(num_samples, dtype=np.int8)
+        if self.pattern == "square":
+            phase = (self.num_samples + np.arange(num_samples)) % self.cycle
+            return (phase >= self.cycle * (1 - self.duty)).astype(np.int8)
+
+        flags = np.empty(num_samples, dtype=np.int8)
+        filled = 0
+        while filled < num_samples:
+            if self._remaining == 0:
+                self._flag = 1 - self._flag
+                self._remaining = 1 + int(self._flag_rng.exponential(self.cycle / 2))
+            count = min(self._remaining, num_samples - filled)
+            flags[filled : filled + count] = self._flag
+            self._remaining -= count
+            filled += count
+        return flags
+
+    def chunk(self, num_samples: int):
+        """Returns the next (num_samples, channels) counts and the flag."""
+        flags = self.flags(num_samples)
+        target = flags[:, None] * self.amplitude
+        response, self._response = lfilter(
+            [self.alpha], [1, self.alpha - 1], target, axis=0, zi=self._response
+        )
+        drift = self._drift + np.cumsum(
+            self._drift_rng.normal(0, self.drift, (num_samples, self.channels)), axis=0
+        )
+        if num_samples:
+            self._drift = drift[-1]
+        noise = self._noise_rng.normal(0, self.noise, (num_samples, self.channels))
+        self.num_samples += num_samples
+        return self.baseline + drift + response + noise, flags
+
+
+def decimal_digits(values: np.ndarray, width: int) -> np.ndarray:
+    """(n, width) ASCII codes of the zero padded decimal non-negative ints.
+    Digits are looked up two at a time, which halves the divisions."""
+    values = np.asarray(values)
+    values = values.astype(np.uint32 if values.max(initial=0) < 2**32 else np.int64)
+    num_pairs = (width + 1) // 2
+    powers = 100 ** np.arange(num_pairs - 1, -1, -1).astype(values.dtype)
+    pairs = np.take(DIGIT_PAIRS.view(np.uint16)[:, 0], values[:, None] // powers % 100)
+    return pairs.view(np.uint8)[:, 2 * num_pairs - width :]
+
+
+def hex_digits(values: np.ndarray, width: int) -> np.ndarray:
+    """(n, width) ASCII codes of the zero padded uppercase hex ints."""
+    table = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+    shifts = 4 * np.arange(width - 1, -1, -1, dtype=np.int64)
+    return table[np.asarray(values, dtype=np.int64)[:, None] >> shifts & 0xF]
+
+
+def _streams(rng):
+    """Independent random streams for the signal, which samples are corrupt,
+    how they are corrupted and the timestamp jitter, so a file does not
+    depend on the chunk size it is written with."""
+    return np.random.default_rng(rng).spawn(4)
+
+
+def _corrupt_rows(rng, num_samples: int, corruption: float) -> np.ndarray:
+    return np.flatnonzero(rng.random(num_samples) < corruption)
+
+
+def _chunks(num_samples: int, chunk_size: int):
+    for start in range(0, num_samples, chunk_size):
+        yield start, min(chunk_size, num_samples - start)
+
+
+def _num_samples(num_samples: int, size_bytes: int, line_bytes: int) -> int:
+    if num_samples is None:
+        if size_bytes is None:
+            raise ValueError("Must specify either num_samples or size_bytes")
+        num_samples = size_bytes // line_bytes
+    return int(num_samples)
+
+
+def write_serial(
+    file_path: str,
+    num_samples: int = None,
+    size_bytes: int = None,
+    period: float = 0.01,
+    time_jitter: float = 0.0,
+    corruption: float = 0.0,
+    chunk_size: int = 1 << 16,
+    rng=None,
+    **signal_kwargs,
+) -> dict:
+    """Writes a record_serial style recording: host timestamp, 8 channels of
+    8 digit counts and the actuation flag per line.
+
+    Args:
+        file_path: where to write the file
+        num_samples: number of samples, or
+        size_bytes: approximate file size to generate instead
+        period: sampling period in seconds
+        time_jitter: standard deviation of the timestamp jitter, in seconds
+        corruption: fraction of lines garbled (and skipped by SerialData)
+        chunk_size: samples generated and written at a time
+        rng: a np.random.Generator or seed
+        signal_kwargs: passed on to SignalGenerator
+
+    Returns:
+        {"num_samples", "bytes", "corrupted": indices of the garbled lines}"""
+    signal_rng, corrupt_rng, glitch_rng, jitter_rng = _streams(rng)
+    num_samples = _num_samples(num_samples, size_bytes, SERIAL_LINE)
+    signal = SignalGenerator(channels=8, rng=signal_rng, **signal_kwargs)
+    corrupted = []
+
+    with open(file_path, "wb") as f:
+        for start, count in _chunks(num_samples, chunk_size):
+            counts, flags = signal.chunk(count)
+            times = START_TIME + (start + np.arange(count)) * period
+            if time_jitter:
+                times += jitter_rng.normal(0, time_jitter, count)
+            micros = np.round(times * 1e6).astype(np.int64)
+
+            line = np.full((count, SERIAL_LINE), ord(" "), dtype=np.uint8)
+            line[:, :10] = decimal_digits(micros // 1_000_000, 10)
+            line[:, 10] = ord(".")
+            line[:, 11:17] = decimal_digits(micros % 1_000_000, 6)
+            counts = np.clip(np.round(counts), 0, 99_999_999)
+            fields = line[:, 18:90].reshape(count, 8, 9)
+            fields[:, :, :8] = decimal_digits(counts.ravel(), 8).reshape(count, 8, 8)
+            line[:, -2] = flags + 48
+            line[:, -1] = ord("\n")
+
+            # A space inside a count splits it, so the line has too many fields
+            rows = _corrupt_rows(corrupt_rng, count, corruption)
+            channel, digit = np.divmod(glitch_rng.integers(0, 8 * 7, count)[rows], 7)
+            line[rows, 18 + 9 * channel + 1 + digit] = ord(" ")
+            corrupted.append(start + rows)
+            f.write(line.tobytes())
+
+    return {
+        "num_samples": num_samples,
+        "bytes": num_samples * SERIAL_LINE,
+        "corrupted": np.concatenate(corrupted) if corrupted else np.empty(0, int),
+    }
+
+
+def write_eval(
+    file_path: str,
+    num_samples: int = None,
+    size_bytes: int = None,
+    conv_time: float = 62.0,
+    corruption: float = 0.0,
+    chunk_size: int = 1 << 16,
+    rng=None,
+    **signal_kwargs,
+) -> dict:
+    """Writes an AD7746 eval board export: a header with the conversion time
+    and a tab separated hex data section of capacitance and voltage/temperature
+    counts.
+
+    Args:
+        file_path: where to write the file
+        num_samples: number of samples, or
+        size_bytes: approximate file size to generate instead
+        conv_time: the conversion time in the header, in ms
+        corruption: fraction of samples with a flipped bit
+        chunk_size: samples generated and written at a time
+        rng: a np.random.Generator or seed
+        signal_kwargs: passed on to SignalGenerator
+
+    Returns:
+        {"num_samples", "bytes", "corrupted": indices of the glitched samples}"""
+    signal_rng, corrupt_rng, glitch_rng, _ = _streams(rng)
+    num_samples = _num_samples(num_samples, size_bytes, EVAL_LINE)
+    signal_kwargs = {"amplitude": 200_000, **signal_kwargs}
+    signal = SignalGenerator(channels=2, rng=signal_rng, **signal_kwargs)
+    header = EVAL_HEADER.format(conv_time=conv_time).encode()
+    corrupted = []
+
+    with open(file_path, "wb") as f:
+        f.write(header)
+        for start, count in _chunks(num_samples, chunk_size):
+            counts, _ = signal.chunk(count)
+            counts = np.clip(np.round(counts), 0, 0xFFFFFF).astype(np.int64)
+            rows = _corrupt_rows(corrupt_rng, count, corruption)
+            counts[rows, 0] ^= 1 << glitch_rng.integers(0, 24, count)[rows]
+            corrupted.append(start + rows)
+
+            line = np.empty((count, EVAL_LINE), dtype=np.uint8)
+            line[:, :6] = hex_digits(counts[:, 0], 6)
+            line[:, 6] = ord("\t")
+            line[:, 7:13] = hex_digits(counts[:, 1], 6)
+            line[:, 13] = ord("\n")
+            f.write(line.tobytes())
+
+    return {
+        "num_samples": num_samples,
+        "bytes": len(header) + num_samples * EVAL_LINE,
+        "corrupted": np.concatenate(corrupted) if corrupted else np.empty(0, int),
+    }
+
+
+def write_sciosense(
+    file_path: str,
+    num_samples: int = None,
+    size_bytes: int = None,
+    channels: int = 1,
+    corruption: float = 0.0,
+    chunk_size: int = 1 << 16,
+    rng=None,
+    **signal_kwargs,
+) -> dict:
+    """Writes a PCAP01 eval board export: a short header, a line of ratio
+    labels (%C1/C0 ...) and tab separated ratios with 6 decimals.
+
+    Args:
+        file_path: where to write the file
+        num_samples: number of samples, or
+        size_bytes: approximate file size to generate instead
+        channels: number of ratio columns
+        corruption: fraction of samples with a spike in the first column
+        chunk_size: samples generated and written at a time
+        rng: a np.random.Generator or seed
+        signal_kwargs: passed on to SignalGenerator (in counts of 1e-6)
+
+    Returns:
+        {"num_samples", "bytes", "corrupted": indices of the glitched samples}"""
+    signal_rng, corrupt_rng, glitch_rng, _ = _streams(rng)
+    line_bytes = SCIOSENSE_FIELD * channels
+    num_samples = _num_samples(num_samples, size_bytes, line_bytes)
+    signal_kwargs = {"baseline": 1_200_000, "amplitude": 100_000, **signal_kwargs}
+    signal = SignalGenerator(channels=channels, rng=signal_rng, **signal_kwargs)
+    labels = "\t".join(f"%C{ch + 1}/C0" for ch in range(channels)) + "\n"
+    header = (SCIOSENSE_HEADER + labels).encode()
+    corrupted = []
+
+    with open(file_path, "wb") as f:
+        f.write(header)
+        for start, count in _chunks(num_samples, chunk_size):
+            micros, _ = signal.chunk(count)
+            rows = _corrupt_rows(corrupt_rng, count, corruption)
+            micros[rows, 0] += glitch_rng.choice((-1, 1), count)[rows] * 5_000_000
+            corrupted.append(start + rows)
+            micros = np.clip(np.round(micros), 0, 9_999_999).astype(np.int64)
+
+            line = np.empty((count, line_bytes), dtype=np.uint8)
+            for ch in range(channels):
+                column = SCIOSENSE_FIELD * ch
+                line[:, column] = micros[:, ch] // 1_000_000 + 48
+                line[:, column + 1] = ord(".")
+                line[:, column + 2 : column + 8] = decimal_digits(
+                    micros[:, ch] % 1_000_000, 6
+                )
+                line[:, column + 8] = ord("\t")
+            line[:, -1] = ord("\n")
+            f.write(line.tobytes())
+
+    return {
+        "num_samples": num_samples,
+        "bytes": len(header) + num_samples * line_bytes,
+        "corrupted": np.concatenate(corrupted) if corrupted else np.empty(0, int),
+    }
+
+
+WRITERS = {"serial": write_serial, "eval": write_eval, "sciosense": write_sciosense}
+
+
+def write_folder(
+    folder_path: str, file_format: str, num_files: int, rng=None, **kwargs
+) -> list:
+    """Writes num_files synthetic trials of one format into a folder, named
+    like the lab recordings are (trial_000.txt, ...).
+
+    Returns:
+        the paths of the files written"""
+    rng = np.random.default_rng(rng)
+    os.makedirs(folder_path, exist_ok=True)
+    file_paths = []
+    for idx in range(num_files):
+        file_path = os.path.join(folder_path, f"trial_{idx:03d}.txt")
+        WRITERS[file_format](file_path, rng=rng, **kwargs)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def parse_size(size: str) -> int:
+    """Bytes in a size such as "512MB" or "20GB"."""
+    units = {"KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30, "B": 1}
+    size = size.strip().upper()
+    for unit, scale in units.items():
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * scale)
+    return int(size)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("format", choices=FORMATS, help="File format to generate")
+    parser.add_argument("output", type=str, help="File to write")
+    parser.add_argument("-s", "--size", type=str, default="100MB", help="eg. 20GB")
+    parser.add_argument(
+        "-c", "--corruption", type=float, default=0.0, help="Corrupt fraction"
+    )
+    parser.add_argument("--noise", type=float, default=50.0, help="Noise, counts")
+    parser.add_argument("--pattern", choices=PATTERNS, default="square")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    args = parser.parse_args()
+
+    info = WRITERS[args.format](
+        args.output,
+        size_bytes=parse_size(args.size),
+        corruption=args.corruption,
+        rng=args.seed,
+        noise=args.noise,
+        pattern=args.pattern,
+    )
+    print(
+        f"Wrote {info['num_samples']} samples ({info['bytes'] / 2**20:.0f} MB), "
+        f"{len(info['corrupted'])} corrupted"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Module for caching parsed trial data on disk and loading trials lazily."""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from capcup.recording_segments import INDEX_SUFFIX, segment_paths
+
+JSON_PREFIX = "__json__"
+
+
+def trial_hash(file_path: str) -> str:
+    """A key that identifies the current contents of a data file. It changes
+    whenever the file is moved, rewritten or grows."""
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    if file_path.endswith(INDEX_SUFFIX):
+        # a segmented recording also changes when its open segment grows
+        for path in segment_paths(file_path):
+            stat = os.stat(path)
+            key += f"|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class TrialCache:
+    """A directory of .npz files holding arrays computed from trials, keyed by
+    the trial hash and the name of what was computed (parsed data, pyramids,
+    features...)."""
+
+    def __init__(self, cache_dir: str = None):
+        """
+        Args:
+            cache_dir: where the cache files are stored. Defaults to a folder
+                called '.cache' in the 'data/' folder of the working directory."""
+        if cache_dir is None:
+            cache_dir = os.path.join(os.getcwd(), "data", ".cache")
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key: str, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{name}.npz")
+
+    def load(self, key: str, name: str):
+        """Returns the dictionary of cached values, or None if not cached.
+        Zero dimensional arrays are returned as scalars."""
+        path = self.path(key, name)
+        if not os.path.isfile(path):
+            return None
+        values = {}
+        with np.load(path) as cached:
+            for field in cached.files:
+                value = cached[field]
+                if field.startswith(JSON_PREFIX):
+                    values[field[len(JSON_PREFIX) :]] = json.loads(value[()])
+                else:
+                    values[field] = value[()] if value.ndim == 0 else value
+        return values
+
+    def save(self, key: str, name: str, **values) -> None:
+        """Stores arrays (or json-able dicts/lists/strings) under key and name.
+        The file is written to a temporary path and moved into place, so
+        readers never see a partially written cache entry."""
+        arrays = {}
+        for field, value in values.items():
+            if isinstance(value, (dict, list, str)):
+                arrays[JSON_PREFIX + field] = np.array(json.dumps(value))
+            else:
+                arrays[field] = np.asarray(value)
+        handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(temp_path, self.path(key, name))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def get_or_compute(self, key: str, name: str, compute) -> dict:
+        """Loads the cached values, or calls compute() to make (and cache) them."""
+        values = self.load(key, name)
+        if values is None:
+            values = compute()
+            self.save(key, name, **values)
+        return values
+
+
+def cached_read(cache: TrialCache, file_path: str, name: str, read, fields: tuple):
+    """Returns the tuple read(file_path), going through the cache if given.
+
+    Args:
+        cache: a TrialCache, or None to always read the file
+        file_path: the data file
+        name: name of the cache entry, usually the data format
+        read: function parsing the file into a tuple of values
+        fields: names for each of the values returned by read"""
+    if cache is None:
+        return read(file_path)
+    values = cache.get_or_compute(
+        trial_hash(file_path), name, lambda: dict(zip(fields, read(file_path)))
+    )
+    return tuple(values[field] for field in fields)
+
+
+class LazyTrial:
+    """Stands in for a trial object and only loads it when one of its
+    attributes is first used."""
+
+    def __init__(self, trial_class, file_path: str, **kwargs):
+        """
+        Args:
+            trial_class: SerialData, EvalBoardData or SciosenseCapData
+            file_path: the data file
+            kwargs: passed on to trial_class"""
+        self.trial_class = trial_class
+        self.file_path = file_path
+        self.kwargs = kwargs
+        self._trial = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._trial is not None
+
+    def load(self):
+        if self._trial is None:
+            self._trial = self.trial_class(self.file_path, **self.kwargs)
+        return self._trial
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the LazyTrial itself.
+        if name.startswith("__") or name in ("trial_class", "file_path", "_trial"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
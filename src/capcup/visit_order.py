@@ -0,0 +1,150 @@
+"""Reorders ground truth poses to cut the Jubilee's travel between visits.
+
+The sampled poses are shuffled, so visiting them in file order zig-zags
+across the whole workspace. Here the poses are split into blocks of random
+poses, and the XY visits within each block are ordered with a nearest
+neighbor tour improved by 2-opt. Each block is still a random mix of labels
+and the blocks follow each other in random order, so slow drift over a run
+is not confounded with any one class.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Assumed XY motion limits of the Jubilee, used to estimate travel time.
+XY_SPEED = 100.0  # mm/s
+XY_ACCELERATION = 1000.0  # mm/s^2
+
+
+def move_time(distance, speed: float = XY_SPEED, acceleration: float = XY_ACCELERATION):
+    """Duration of straight moves with a trapezoidal (or triangular, for short
+    moves) velocity profile, starting and ending at rest."""
+    distance = np.asarray(distance, dtype=float)
+    ramp_distance = speed**2 / acceleration
+    return np.where(
+        distance >= ramp_distance,
+        distance / speed + speed / acceleration,
+        2 * np.sqrt(distance / acceleration),
+    )
+
+
+def path_moves(xy: np.ndarray, order: np.ndarray, start=(0.0, 0.0)) -> np.ndarray:
+    """Lengths of the moves visiting xy[order] from start."""
+    path = np.vstack((start, xy[order]))
+    return np.hypot(*np.diff(path, axis=0).T)
+
+
+def nearest_neighbor(xy: np.ndarray, start=(0.0, 0.0)) -> np.ndarray:
+    """Order visiting the closest unvisited point each time, from start."""
+    remaining = np.ones(len(xy), dtype=bool)
+    order = np.empty(len(xy), dtype=int)
+    position = np.asarray(start, dtype=float)
+    for step in range(len(xy)):
+        distance = np.hypot(*(xy - position).T)
+        distance[~remaining] = np.inf
+        order[step] = np.argmin(distance)
+        remaining[order[step]] = False
+        position = xy[order[step]]
+    return order
+
+
+def two_opt(
+    xy: np.ndarray, order: np.ndarray, start=(0.0, 0.0), max_passes: int = 20
+) -> np.ndarray:
+    """Improves an open path from a fixed start by reversing segments.
+
+    For each segment start, the gain of every possible segment end is
+    evaluated at once, and the best improving reversal is applied."""
+    order = np.array(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(len(order) - 1):
+            path = np.vstack((start, xy[order]))
+            # Reversing order[i..j] replaces edges a-b and c-d with a-c and b-d
+            a, b = path[i], path[i + 1]
+            c = path[i + 2 :]
+            d = np.vstack((path[i + 3 :], [np.nan, np.nan]))
+            old = np.hypot(*(a - b)) + np.nan_to_num(np.hypot(*(c - d).T))
+            new = np.hypot(*(a - c).T) + np.nan_to_num(np.hypot(*(b - d).T))
+            gain = old - new
+            j = np.argmax(gain)
+            if gain[j] > 1e-9:
+                order[i : i + j + 2] = order[i : i + j + 2][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def order_visits(
+    poses: pd.DataFrame,
+    block_size: int = 50,
+    start=(0.0, 0.0),
+    rng=None,
+    speed: float = XY_SPEED,
+    acceleration: float = XY_ACCELERATION,
+):
+    """Reorders poses to minimize XY travel within blocks of random poses.
+
+    Args:
+        poses: a ground truth DataFrame with x and y columns
+        block_size: poses per block. Smaller blocks spread classes more evenly
+            over time, larger blocks save more travel.
+        start: XY position of the tool before the first pose
+        rng: a np.random.Generator or seed used to shuffle the poses
+        speed: XY speed used to estimate move times, in mm/s
+        acceleration: XY acceleration used to estimate move times, in mm/s^2
+
+    Returns:
+        (reordered poses, report) where report has the travel distance and
+        estimated travel time before and after, and the time saved"""
+    rng = np.random.default_rng(rng)
+    xy = poses[["x", "y"]].to_numpy(dtype=float)
+    shuffled = rng.permutation(len(poses))
+
+    order = []
+    position = np.asarray(start, dtype=float)
+    for block_start in range(0, len(shuffled), block_size):
+        block = shuffled[block_start : block_start + block_size]
+        tour = two_opt(xy[block], nearest_neighbor(xy[block], position), position)
+        order.append(block[tour])
+        position = xy[order[-1][-1]]
+    order = np.concatenate(order) if order else np.empty(0, dtype=int)
+
+    before = path_moves(xy, np.arange(len(poses)), start)
+    after = path_moves(xy, order, start)
+    time_before = float(move_time(before, speed, acceleration).sum())
+    time_after = float(move_time(after, speed, acceleration).sum())
+    report = {
+        "distance_before": float(before.sum()),
+        "distance_after": float(after.sum()),
+        "time_before": time_before,
+        "time_after": time_after,
+        "time_saved": time_before - time_after,
+    }
+    return poses.iloc[order].reset_index(drop=True), report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", type=str, help="Ground truth CSV to reorder")
+    parser.add_argument("output", type=str, help="File to save the ordered CSV to")
+    parser.add_argument(
+        "-b", "--block_size", type=int, default=50, help="Poses per ordered block"
+    )
+    parser.add_argument("-s", "--seed", type=int, default=None, help="Random seed")
+    args = parser.parse_args()
+
+    poses = pd.read_csv(args.input)
+    ordered, report = order_visits(poses, args.block_size, rng=args.seed)
+    ordered.to_csv(args.output, index=False)
+    print(
+        f"Travel {report['distance_before']:.0f} mm -> {report['distance_after']:.0f}"
+        f" mm, estimated time saved {report['time_saved'] / 60:.1f} min"
+    )
+
+
+if __name__ == "__main__":
+    main()
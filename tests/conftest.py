@@ -0,0 +1,20 @@
+"""Fixtures shared by the tests."""
+
+import pytest
+
+
+def _write_serial_file(path, num_samples=200, period=0.01):
+    """Writes a small SerialData recording, actuated for 50 samples every 100,
+    ending in one corrupt line."""
+    with open(path, "w", encoding="utf-8") as f:
+        for idx in range(num_samples):
+            actuation = int((idx // 50) % 2)
+            counts = " ".join(f"{10_000_000 + idx + ch:08d}" for ch in range(8))
+            f.write(f"{1700000000 + idx * period:.6f} {counts} {actuation}\n")
+        f.write("1700000099.0 1234 garbled\n")
+    return str(path)
+
+
+@pytest.fixture
+def write_serial_file():
+    return _write_serial_file
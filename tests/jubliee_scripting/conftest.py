@@ -0,0 +1,26 @@
+import os
+import sys
+import types
+
+# The Jubilee scripts import their siblings by module name, as when they are
+# run from their own directory, and the rest of capcup by package. The tests
+# do the same, so every script module is only loaded once.
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__), "..", "..", "src", "capcup", "jubliee_scripting"
+    ),
+)
+
+# The machine's controller library is not installed to run the tests. The
+# scripts that import it build the stand-in instead, unless a test simulates
+# them (see simulator.SimulatedJubilee.simulate).
+if "jubilee_controller" not in sys.modules:
+    from stand_in import StandInJubilee
+
+    _controller = types.ModuleType("jubilee_controller.jubilee_controller")
+    _controller.JubileeMotionController = StandInJubilee
+    _package = types.ModuleType("jubilee_controller")
+    _package.jubilee_controller = _controller
+    sys.modules["jubilee_controller"] = _package
+    sys.modules["jubilee_controller.jubilee_controller"] = _controller
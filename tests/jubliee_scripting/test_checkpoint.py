@@ -0,0 +1,121 @@
+"""Test functions and class methods in jubliee_scripting/checkpoint.py"""
+
+import json
+
+import numpy as np
+import pytest
+
+import checkpoint
+import gcode_program
+from stand_in import StandInJubilee
+
+
+class EStop(Exception):
+    pass
+
+
+class FailingJubilee(StandInJubilee):
+    """Stops responding after a number of round trips."""
+
+    def __init__(self, fail_after: int):
+        super().__init__()
+        self.fail_after = fail_after
+
+    def gcode(self, command: str) -> str:
+        if self.round_trips == self.fail_after:
+            raise EStop
+        return super().gcode(command)
+
+
+class StoppedMidPose(StandInJubilee):
+    """Stops responding once a pose was sent in full, before the controller
+    reported that it ran."""
+
+    def __init__(self, poses: int):
+        super().__init__()
+        self.poses = poses
+
+    def status(self) -> str:
+        poses = [c for c in self.commands if c.startswith("G0") and "Z" not in c]
+        if len(poses) == self.poses and self.commands[-1] == gcode_program.SYNC:
+            raise EStop
+        return super().status()
+
+
+def skip_sleep(seconds):
+    """The stand-ins run every batch right away, no need to wait it out."""
+
+
+@pytest.fixture
+def ground_truth(tmp_path):
+    csv_path = tmp_path / "ground_truth.csv"
+    rows = np.c_[np.arange(10), -np.arange(10), np.full(10, 3.0)]
+    np.savetxt(csv_path, rows, delimiter=",", header="x,y,z", comments="")
+    return str(csv_path)
+
+
+def test_resumes_after_last_completed_row(ground_truth):
+    center = gcode_program.ground_truth_center()
+    path = checkpoint.manifest_path(ground_truth)
+
+    jubilee = FailingJubilee(fail_after=8)
+    with pytest.raises(EStop):
+        checkpoint.resume_ground_truth(
+            jubilee,
+            ground_truth,
+            checkpoint.RunManifest(path, ground_truth),
+            center,
+            5,
+            sleep=skip_sleep,
+        )
+    interrupted = checkpoint.RunManifest(path, ground_truth)
+    assert not interrupted.finished
+    completed = interrupted.completed_row
+    assert 0 <= completed < 9
+    assert interrupted.position == [completed, -completed, 3]
+
+    resumed = StandInJubilee(position=jubilee.position)
+    checkpoint.resume_ground_truth(
+        resumed, ground_truth, interrupted, center, 5, sleep=skip_sleep
+    )
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["completed_row"] == 9
+    first, second = manifest["sessions"]
+    assert first["interrupted"] and not first["finished"]
+    assert (first["first_row"], first["last_row"]) == (0, completed)
+    assert (second["first_row"], second["last_row"]) == (completed + 1, 9)
+    assert second["finished"] and not second["interrupted"]
+
+    # completed rows are not pressed again, only the interrupted one may be
+    pressed = [
+        command
+        for command in jubilee.commands + resumed.commands
+        if command.startswith("G0") and "Z" not in command
+    ]
+    assert sorted(set(pressed)) == [f"G0 X{x:.3f} Y{-x:.3f}" for x in range(10)]
+    assert len(pressed) <= 11
+
+
+def test_pose_sent_but_not_run_is_not_checkpointed(ground_truth):
+    center = gcode_program.ground_truth_center()
+    path = checkpoint.manifest_path(ground_truth)
+    jubilee = StoppedMidPose(poses=3)
+    with pytest.raises(EStop):
+        checkpoint.resume_ground_truth(
+            jubilee,
+            ground_truth,
+            checkpoint.RunManifest(path, ground_truth),
+            center,
+            5,
+            sleep=skip_sleep,
+        )
+    assert jubilee.commands[-2:] == [gcode_program.FLAG_OFF, gcode_program.SYNC]
+    assert checkpoint.RunManifest(path, ground_truth).next_row == 2
+
+
+def test_manifest_rejects_other_csv(ground_truth, tmp_path):
+    path = checkpoint.manifest_path(ground_truth)
+    checkpoint.RunManifest(path, ground_truth).start_session()
+    with pytest.raises(ValueError):
+        checkpoint.RunManifest(path, str(tmp_path / "other.csv"))
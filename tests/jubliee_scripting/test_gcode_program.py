@@ -0,0 +1,182 @@
+"""Test functions and class methods in jubliee_scripting/gcode_program.py"""
+
+import json
+
+import numpy as np
+import pytest
+
+import gcode_program as gp
+from stand_in import StandInJubilee
+
+
+class ScriptCalls:
+    """Records the calls a script makes on a JubileeMotionController, without
+    turning moves into G-code."""
+
+    def __init__(self):
+        self.calls = []
+
+    def gcode(self, command: str) -> str:
+        self.calls.append(command)
+        return ""
+
+    def move_xyz_absolute(self, x: float = None, y: float = None, z: float = None):
+        self.calls.append((x, y, z))
+
+
+def run_ground_truth_per_command(jubilee, rows, center, dwell):
+    """The loop ground_truth_runner.main used to run, one command at a time."""
+    jubilee.gcode('M950 P4 C"io4.out"')
+    jubilee.move_xyz_absolute(z=center[-1])
+    jubilee.move_xyz_absolute(*center)
+    for row in rows:
+        position = np.array(row[:3], dtype=float)
+        jubilee.move_xyz_absolute(*position[:-1])
+        jubilee.gcode(f"G4 P{dwell}")
+        jubilee.gcode("M400")
+        jubilee.gcode("M42 P4 S1")
+        jubilee.gcode("M400")
+        jubilee.move_xyz_absolute(z=position[-1])
+        jubilee.gcode("M400")
+        jubilee.gcode("M42 P4 S0")
+        jubilee.gcode(f"G4 P{dwell}")
+        jubilee.gcode("M400")
+        jubilee.gcode("M42 P4 S1")
+        jubilee.gcode("M400")
+        jubilee.move_xyz_absolute(z=center[-1])
+        jubilee.gcode("M400")
+        jubilee.gcode("M42 P4 S0")
+    done_offset = np.array([10, 0, 0])
+    for _ in range(4):
+        jubilee.move_xyz_absolute(*center)
+        jubilee.move_xyz_absolute(*(center + done_offset))
+    jubilee.move_xyz_absolute(*center)
+
+
+def as_call(line: str):
+    """A compiled line as the call a script would have made: moves as their
+    (x, y, z) targets, anything else as is."""
+    if not line.startswith("G0 "):
+        return line
+    axes = dict((word[0], float(word[1:])) for word in line.split()[1:])
+    return tuple(axes.get(axis) for axis in "XYZ")
+
+
+class BusyJubilee(StandInJubilee):
+    """Reports itself busy for a few status polls after every batch, and
+    counts batches that arrive while it is still busy."""
+
+    def __init__(self, busy_polls: int = 3):
+        super().__init__()
+        self.busy_polls = busy_polls
+        self.busy = 0
+        self.overruns = 0
+
+    def gcode(self, command: str) -> str:
+        if not command.startswith("M408"):
+            self.overruns += self.busy > 0
+            self.busy = self.busy_polls
+        return super().gcode(command)
+
+    def status(self) -> str:
+        self.busy = max(self.busy - 1, 0)
+        return json.dumps({"status": "B" if self.busy else "I"})
+
+
+def test_compiled_ground_truth_matches_script_calls(tmp_path):
+    csv_path = tmp_path / "ground_truth.csv"
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("x,y,z,alpha,beta,gamma,label\n")
+        for idx in range(20):
+            f.write(f"{idx - 10},{2 * idx},{2 + idx / 10},0,0,0,aligned\n")
+
+    script = ScriptCalls()
+    center = np.array([0, 0, 6.7 + 5])
+    run_ground_truth_per_command(script, gp.read_ground_truth(csv_path), center, 5000)
+
+    program = gp.compile_ground_truth(str(csv_path))
+    compiled = [as_call(line) for line in program.lines]
+    assert len(compiled) == len(script.calls)
+    for line, call in zip(compiled, script.calls):
+        if isinstance(call, tuple):
+            assert len(line) == 3
+            for value, expected in zip(line, call):
+                assert (value is None) == (expected is None)
+                if expected is not None:
+                    assert value == pytest.approx(float(expected), abs=1e-3)
+        else:
+            assert line == call
+
+    batched = StandInJubilee()
+    slept = []
+    round_trips = gp.submit(batched, program, max_bytes=200, sleep=slept.append)
+    assert batched.commands == program.lines
+    assert np.allclose(batched.position, center)
+    assert batched.flag == 0
+    # one status poll per batch, as the stand-in is idle right away
+    assert round_trips == batched.round_trips == 2 * len(program.batches(200))
+    assert round_trips < len(script.calls) / 5
+    assert all(len(batch) <= 200 for batch in program.batches(200))
+    # the two 5 s dwells of every pose are slept through instead of polled
+    assert sum(slept) >= 20 * 2 * 5
+
+    # no batch ends with the flag high
+    for batch in program.batches(200):
+        lines = batch.splitlines()
+        assert lines.count(gp.FLAG_ON) == lines.count(gp.FLAG_OFF)
+        toggles = [line for line in lines if line in (gp.FLAG_ON, gp.FLAG_OFF)]
+        assert toggles == [gp.FLAG_ON, gp.FLAG_OFF] * (len(toggles) // 2)
+
+
+def test_submit_waits_for_the_controller_between_batches():
+    program = gp.GcodeProgram()
+    for idx in range(50):
+        program.move_xyz_absolute(x=idx)
+        program.dwell(100)
+    jubilee = BusyJubilee(busy_polls=3)
+    slept = []
+    round_trips = gp.submit(jubilee, program, max_bytes=100, sleep=slept.append)
+    batches = len(program.batches(100))
+    assert batches > 1
+    assert jubilee.overruns == 0
+    assert round_trips == jubilee.round_trips == 4 * batches
+    # each batch is slept through, then polled a tenth of it apart
+    expected = []
+    for duration in program.batch_durations(100):
+        expected += [duration] + [max(0.05, duration / 10)] * 2
+    assert slept == pytest.approx(expected)
+    assert all(duration >= 0.1 for duration in program.batch_durations(100))
+    assert jubilee.commands == program.lines
+
+
+def test_batches_are_cut_between_actuations():
+    program = gp.GcodeProgram()
+    for _ in range(10):
+        program.dwell(100)
+        program.actuate_absolute((None, None, -2.5))
+        program.actuate_absolute((None, None, 0))
+    # small enough that a cut by size alone would land inside an actuation
+    batches = [batch.splitlines() for batch in program.batches(60)]
+    assert sum(batches, []) == program.lines
+    for lines in batches:
+        if gp.FLAG_ON in lines:
+            assert lines.index(gp.FLAG_ON) < lines.index(gp.FLAG_OFF)
+        flag = 0
+        for line in lines:
+            if line in (gp.FLAG_ON, gp.FLAG_OFF):
+                flag = int(line == gp.FLAG_ON)
+        assert flag == 0
+
+
+
+def test_machine_idle_rejects_unexpected_replies():
+    with pytest.raises(ValueError):
+        gp.machine_idle(ScriptCalls())
+
+
+def test_program_tracks_position_and_flag_toggles():
+    program = gp.GcodeProgram(position=(1, 2, 3))
+    program.load_unload(1000, [1.5, 2.5])
+    assert np.allclose(program.position, (1, 2, 3))
+    assert program.lines.count(gp.FLAG_ON) == program.lines.count(gp.FLAG_OFF) == 3
+    assert program.lines[0] == "G4 P1000"
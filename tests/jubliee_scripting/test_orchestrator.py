@@ -0,0 +1,98 @@
+"""Test functions and class methods in jubliee_scripting/orchestrator.py"""
+
+import time
+
+import numpy as np
+
+import orchestrator
+from capcup.serial_data_formatter import SerialData, read_events
+from gcode_program import ground_truth_center
+from stand_in import StandInJubilee, StandInSerial
+
+ROWS = [[1.0, 2.0, 4.0], [-3.0, 0.5, 3.5], [0.0, -1.0, 5.0]]
+
+
+def test_ground_truth_run_against_stand_ins(tmp_path):
+    path = str(tmp_path / "run.csv")
+    jubilee = StandInJubilee(dwell=True, speed=200)
+    port = StandInSerial(jubilee, period=0.002, rng=0)
+    steps = orchestrator.ground_truth_steps(ROWS, ground_truth_center(), dwell=40)
+    with open(path, "w", encoding="utf-8") as output:
+        run = orchestrator.Orchestrator(jubilee, port, output)
+        run.run(steps)
+    port.close()
+
+    events = read_events(path)
+    assert events["kind"].iloc[0] == "start" and events["kind"].iloc[-1] == "end"
+    poses = events[events["kind"] == "pose"]
+    assert poses["row"].tolist() == [0, 1, 2]
+    np.testing.assert_allclose(poses[["x", "y", "z"]].to_numpy(), ROWS)
+    flags = events[events["kind"] == "flag"]
+    assert flags["value"].tolist() == [1, 0] * 6
+
+    # moves are stamped once the controller finished them, so the XY move to
+    # each pose lands at least its travel time after the pose
+    moves = events[events["kind"] == "move"]
+    assert len(moves) == 1 + 3 * 3 + 1
+    previous = ground_truth_center()
+    for (_, pose), row in zip(poses.iterrows(), ROWS):
+        arrival = moves[moves["time"] > pose["time"]].iloc[0]
+        assert arrival["position"] == [row[0], row[1], previous[-1]]
+        travel = np.hypot(row[0] - previous[0], row[1] - previous[1]) / 200
+        assert arrival["time"] - pose["time"] >= travel
+        previous = [row[0], row[1], previous[-1]]
+    assert moves["position"].iloc[-1] == ground_truth_center().tolist()
+    assert moves["time"].iloc[-1] <= events["time"].iloc[-1]
+
+    # the loader skips the event lines, and the recording spans the run only
+    trial = SerialData(path)
+    assert len(trial.time) == run.samples
+    host_time = trial.time + trial.start_time
+    start, end = events["time"].iloc[0], events["time"].iloc[-1]
+    assert host_time[0] <= start and host_time[-1] - end < 0.05
+    assert end - start < 2
+
+    # the board saw the flag high while each press was stamped as pressed
+    on, off = flags["time"].to_numpy()[::2], flags["time"].to_numpy()[1::2]
+    for press_on, press_off in zip(on, off):
+        pressed = (host_time > press_on + 0.01) & (host_time < press_off - 0.01)
+        assert trial.actuations[pressed].all()
+        assert (trial.cap_counts[pressed] > 10_000_500).all()
+    assert len(trial.actuation_starts) == 6
+
+
+def test_stand_in_queues_moves_until_sync():
+    jubilee = StandInJubilee(speed=100)
+    start = time.monotonic()
+    jubilee.move_xyz_absolute(x=20)
+    assert time.monotonic() - start < 0.1
+    assert '"B"' in jubilee.gcode("M408 S0")
+    jubilee.gcode("M400")
+    assert time.monotonic() - start >= 0.2
+    assert '"I"' in jubilee.gcode("M408 S0")
+
+
+class FloodingSerial:
+    """A port that always has another sample waiting, until a read limit."""
+
+    def __init__(self, limit: int = 200_000):
+        self.limit = limit
+        self.reads = 0
+
+    @property
+    def in_waiting(self) -> int:
+        return 0 if self.reads >= self.limit else 1
+
+    def read(self, size: int = 1) -> bytes:
+        self.reads += 1
+        return (" ".join(["10000000"] * 8) + " 0\n").encode()
+
+
+def test_run_progresses_while_the_port_never_goes_quiet(tmp_path):
+    port = FloodingSerial()
+    steps = orchestrator.ground_truth_steps(ROWS, ground_truth_center(), dwell=1)
+    with open(tmp_path / "run.csv", "w", encoding="utf-8") as output:
+        run = orchestrator.Orchestrator(StandInJubilee(), port, output)
+        run.run(steps)
+    assert port.reads < port.limit
+    assert run.events == 1 + 3 + 12 + 11 + 1
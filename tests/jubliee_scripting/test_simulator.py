@@ -0,0 +1,91 @@
+"""Test functions and class methods in jubliee_scripting/simulator.py"""
+
+import time
+
+import numpy as np
+import pytest
+
+import concentric_cycles
+import cup_configs
+import gcode_program
+import simulator
+
+
+def test_axis_time_matches_trapezoid():
+    # 100 mm at 10 mm/s: 10 s cruising plus 0.1 s lost ramping up and down
+    assert simulator.axis_time(-100, 10, 100) == pytest.approx(10.1)
+    # too short to reach speed: two 0.1 s ramps
+    assert simulator.axis_time(1, 10, 100) == pytest.approx(0.2)
+
+
+def test_moves_queue_until_sync():
+    jubilee = simulator.SimulatedJubilee(latency=0.01)
+    jubilee.move_xyz_absolute(z=1)  # 0.2 s
+    jubilee.gcode("M42 P4 S1")
+    assert jubilee.flag_intervals()[0][0] == pytest.approx(0.02)
+
+    jubilee.gcode("M400\nM42 P4 S0\nG4 P500")
+    intervals = jubilee.flag_intervals()
+    assert intervals[0] == pytest.approx([0.02, 0.21])
+    assert jubilee.duration == pytest.approx(0.71)
+    assert np.allclose(jubilee.position, (0, 0, 1))
+
+
+def duration_script(jubilee, duration):
+    """A load/unload loop that runs for a duration, as cup_cycles does."""
+    start_time = time.time()
+    while time.time() - start_time < duration:
+        jubilee.gcode("G4 P1000")
+        jubilee.gcode("M400\nM42 P4 S1\nM400")
+        jubilee.move_xyz_absolute(z=0)
+        jubilee.gcode("M400\nM42 P4 S0\nG4 P1000\nM400\nM42 P4 S1\nM400")
+        jubilee.move_xyz_absolute(z=3)
+        jubilee.gcode("M400\nM42 P4 S0")
+
+
+def test_simulate_runs_duration_scripts_on_virtual_clock():
+    jubilee = simulator.SimulatedJubilee(position=(0, 0, 3))
+    start = time.perf_counter()
+    jubilee.simulate(duration_script, jubilee, 600)
+    assert time.perf_counter() - start < 1
+    assert duration_script.__globals__["time"] is time
+
+    intervals = jubilee.flag_intervals()
+    assert 600 <= jubilee.duration < 610
+    # the flag stays high for the 3 mm Z move (0.4 s) and its round trip
+    assert np.allclose(np.diff(intervals, axis=1), 0.4 + 0.005)
+
+
+def test_ground_truth_campaign_is_fast(tmp_path):
+    csv_path = tmp_path / "ground_truth.csv"
+    rng = np.random.default_rng(0)
+    rows = rng.uniform(-5, 5, (1000, 3)) + (0, 0, 5)
+    np.savetxt(
+        csv_path,
+        np.c_[rows, np.zeros((1000, 3))],
+        delimiter=",",
+        header="x,y,z,alpha,beta,gamma",
+        comments="",
+    )
+    program = gcode_program.compile_ground_truth(str(csv_path))
+    start = time.perf_counter()
+    jubilee = simulator.estimate_program(program)
+    assert time.perf_counter() - start < 1
+    assert len(jubilee.flag_intervals()) == 2000
+    # two 5 s dwells per pose dominate
+    assert 10_000 < jubilee.duration < 12_000
+
+
+def test_simulate_runs_concentric_cycles_unchanged():
+    jubilee = simulator.SimulatedJubilee()
+    jubilee.simulate(concentric_cycles.main)
+    assert concentric_cycles.time is time
+
+    cup = cup_configs.NBR_40mm
+    assert jubilee.commands[:2] == ['M950 P4 C"io4.out"', "M42 P4 S0"]
+    assert np.allclose(jubilee.position, cup.origin + concentric_cycles.CLEAR)
+    # triangles presses 5 mm (0.6 s) down and back up for 10 s
+    intervals = jubilee.flag_intervals()
+    assert len(intervals) % 2 == 0 and len(intervals) >= 12
+    assert np.allclose(np.diff(intervals, axis=1), 0.6 + 3 * simulator.LATENCY)
+    assert 10 <= jubilee.duration < 15
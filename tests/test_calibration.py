@@ -0,0 +1,122 @@
+"""Test functions and class methods in calibration.py"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import capcup.calibration as cal
+from capcup.offset_generator import Box, SuctionCup
+
+BOX = Box(x_size=100, y_size=100)
+CUP = SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
+ANGLES = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+
+
+def _levels(targets, rng, noise=2.0):
+    """Channel levels that grow with compression and lean towards the offset."""
+    compression, x, y = targets.T
+    lean = 1 + 0.05 * (x[:, None] * np.cos(ANGLES) + y[:, None] * np.sin(ANGLES))
+    gains = np.linspace(300, 600, 8)
+    return gains * compression[:, None] ** 1.3 * lean + rng.normal(0, noise, lean.shape)
+
+
+def _labeled(name, num_presses, rng):
+    targets = np.stack(
+        [
+            rng.uniform(0.5, 4, num_presses),
+            rng.uniform(-3, 3, num_presses),
+            rng.uniform(-3, 3, num_presses),
+        ],
+        axis=1,
+    )
+    return cal.LabeledPresses(name, _levels(targets, rng), targets)
+
+
+def test_fit_lookup_and_holdout_report(tmp_path):
+    rng = np.random.default_rng(0)
+    labeled = [_labeled(f"trial{idx}", 200, rng) for idx in range(4)]
+    calibration = cal.fit_calibration(labeled[:3])
+
+    # the tables interpolate like np.interp on each channel's grid
+    levels = labeled[3].levels
+    grid = calibration.start[:, None] + calibration.step[:, None] * np.arange(256)
+    expected = np.stack(
+        [np.interp(levels[:, ch], grid[ch], calibration.tables[ch]) for ch in range(8)],
+        axis=1,
+    )
+    np.testing.assert_allclose(calibration.channel_estimates(levels), expected)
+
+    report = cal.validation_report(calibration, labeled[3:])
+    assert report.loc[("trial3", "compression"), "mae"] < 0.05
+    assert report.loc[("trial3", "x"), "r2"] > 0.95
+    assert report.loc[("trial3", "y"), "r2"] > 0.95
+
+    path = str(tmp_path / "calibration.npz")
+    calibration.save(path)
+    loaded = cal.Calibration.load(path)
+    np.testing.assert_array_equal(loaded.predict(levels), calibration.predict(levels))
+    assert loaded.predict(levels[0]).shape == (3,)
+
+    loo = cal.holdout_report(labeled)
+    assert list(loo.index.get_level_values("trial").unique()) == [
+        "trial0",
+        "trial1",
+        "trial2",
+        "trial3",
+    ]
+    assert (loo.xs("compression", level="target")["mae"] < 0.05).all()
+
+
+def test_label_trial_and_live_calibration(tmp_path):
+    rng = np.random.default_rng(1)
+    poses = pd.DataFrame(
+        {
+            "x": rng.uniform(-3, 3, 30),
+            "y": rng.uniform(-3, 3, 30),
+            "z": CUP.lip_to_board_height - rng.uniform(0.5, 4, 30),
+            "alpha": 0.0,
+            "beta": 0.0,
+            "gamma": 0.0,
+            "label": "aligned",
+        }
+    )
+    targets = cal.pose_targets(cal.frame_to_poses(poses), BOX, CUP)
+    np.testing.assert_allclose(
+        targets[:, 0], CUP.lip_to_board_height - poses["z"], atol=1e-9
+    )
+    levels = _levels(targets, rng, noise=0)
+
+    path = tmp_path / "run.csv"
+    with open(path, "w", encoding="utf-8") as f:
+        sample = 0
+        for level in list(levels) + [None]:
+            rows = [(np.zeros(8), 0)] * 30
+            if level is not None:
+                rows += [(level * min(step / 5, 1), 1) for step in range(30)]
+            for counts, flag in rows:
+                values = " ".join(f"{int(10_000_000 + c):08d}" for c in counts)
+                f.write(f"{1700000000 + 0.01 * sample:.6f} {values} {flag}\n")
+                sample += 1
+
+    trial = cal.label_trial(str(path), poses, BOX, CUP)
+    np.testing.assert_allclose(trial.levels, levels.astype(int), atol=1)
+    np.testing.assert_allclose(trial.targets, targets)
+    with pytest.raises(ValueError):
+        cal.label_trial(str(path), poses[:-1], BOX, CUP)
+
+    calibration = cal.fit_calibration([_labeled("train", 500, rng)])
+    live = cal.LiveCalibration(calibration, baseline_samples=10)
+    assert live.update(np.full(8, 5000), 1) is None
+    for _ in range(10):
+        live.update(np.full(8, 5000), 0)
+    estimate = live.update(5000 + levels[0], 1)
+    assert abs(estimate[0] - targets[0, 0]) < 0.1
+    assert live.status().startswith("Calibration: compression")
+    assert not live.released and live.press is None
+    live.update(5000 + levels[0] / 2, 1)
+    live.update(np.full(8, 5000), 0)
+    assert live.released
+    np.testing.assert_allclose(live.press, estimate)
+    assert live.press_status().startswith("Calibration: press at compression")
+    live.update(np.full(8, 5000), 0)
+    assert not live.released
@@ -0,0 +1,89 @@
+"""Test functions and class methods in degradation.py"""
+
+import numpy as np
+
+import capcup.degradation as dg
+
+
+def _endurance_run(cycles=300, period=100, wear_from=200):
+    """Cycles of 40 samples pressed then 60 released. Channel 0 responds with
+    a peak of +1000, which drops to +700 from cycle wear_from on, the others
+    with a steady peak, and every cycle leaves the baseline 2 counts higher."""
+    rng = np.random.default_rng(0)
+    num_samples = cycles * period + 50
+    phase = (np.arange(num_samples) - 50) % period
+    flags = ((phase < 40) & (np.arange(num_samples) >= 50)).astype(int)
+    cycle = np.maximum(np.arange(num_samples) - 50, 0) // period
+    counts = 10_000 + rng.normal(0, 3, (num_samples, 8))
+    counts += 2.0 * cycle[:, None]
+    response = np.array([1, 0.5, 0.4, 0.3, 0.2, -0.3, -0.4, -0.5]) * 1000
+    response = np.where(cycle[:, None] >= wear_from, [700, *response[1:]], response)
+    counts += flags[:, None] * response
+    times = 0.01 * np.arange(num_samples)
+    return times, counts, flags
+
+
+def test_cycle_summaries_do_not_depend_on_chunking():
+    times, counts, flags = _endurance_run()
+    whole = dg.CycleTracker()
+    records = np.concatenate([whole.update(times, counts, flags), whole.finish()])
+    assert len(records) == 300
+    np.testing.assert_array_equal(records["cycle"], np.arange(300))
+    np.testing.assert_allclose(records["duration"][:-1], 1.0)
+    np.testing.assert_allclose(records["on_duration"], 0.4)
+    np.testing.assert_allclose(records["peak"][:200, 0], 1000, atol=15)
+    np.testing.assert_allclose(records["peak"][200:, 0], 700, atol=15)
+    np.testing.assert_allclose(records["peak"][:, 5], -300, atol=15)
+    assert abs(records["hysteresis"][:-1, 3].mean() - 2) < 0.2
+
+    chunked = dg.CycleTracker()
+    parts = [
+        chunked.update(
+            times[idx : idx + 37], counts[idx : idx + 37], flags[idx : idx + 37]
+        )
+        for idx in range(0, len(times), 37)
+    ]
+    np.testing.assert_array_equal(np.concatenate(parts + [chunked.finish()]), records)
+
+
+def test_table_trend_and_change_detection(tmp_path):
+    times, counts, flags = _endurance_run()
+    tracker = dg.CycleTracker()
+    table = dg.CycleTable(str(tmp_path / "run.cycles"))
+    for idx in range(0, len(times), 1000):
+        table.append(
+            tracker.update(*(a[idx : idx + 1000] for a in (times, counts, flags)))
+        )
+    table.append(tracker.finish())
+
+    # reopened, and with a torn record at the end
+    with open(table.file_path, "ab") as f:
+        f.write(b"\0" * 10)
+    table = dg.CycleTable(table.file_path)
+    assert len(table) == 300
+    assert table.read(-10)["cycle"][0] == 290
+    frame = table.to_frame(100, 110)
+    assert list(frame.index) == list(range(100, 110))
+    assert frame["peak_0"].between(985, 1015).all()
+
+    baseline = table.read()["baseline"]
+    np.testing.assert_allclose(dg.rolling_slope(baseline, 50)[49:, 2], 2, atol=0.1)
+    assert np.isnan(dg.rolling_slope(baseline, 50)[:49]).all()
+
+    detector = dg.CusumDetector()
+    for record in table.read():
+        detector.update(record["cycle"], record["peak"])
+    assert detector.changes == [(200, 0, -1)]
+
+
+def test_summarize_recording(tmp_path, write_serial_file):
+    path = write_serial_file(tmp_path / "trial.csv", num_samples=400)
+    records = dg.summarize_recording(path, baseline_samples=10, chunk_lines=64)
+    # pressed for samples 50-99 and 150-199..., the last press runs to the end
+    assert len(records) == 4
+    np.testing.assert_allclose(records["on_duration"][:-1], 0.5)
+    np.testing.assert_allclose(records["duration"][:-1], 1.0)
+    # counts rise by one per sample, the baseline is the median of the 10
+    # samples before the press and the peak is the last pressed sample
+    np.testing.assert_allclose(records["peak"], 54.5)
+    np.testing.assert_allclose(records["hysteresis"][:-1], 100)
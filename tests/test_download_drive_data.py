@@ -5,10 +5,19 @@ help as described here https://github.com/wkentaro/gdown?tab=readme-ov-file#faq
 or you can just wait a bit.
 """
 
+import functools
+import hashlib
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import json
 import os
+import shutil
+import threading
+
 import pytest
 
 import capcup.download_drive_data as down
+from capcup.segment_index import SegmentIndex
+from capcup.serial_data_formatter import format_folder
 
 
 def test_download_file():
@@ -104,3 +113,119 @@ def test_download_folder_to_directory():
         # assert not os.path.isdir(data_directory)
     except OSError:
         pass
+
+
+class FlakyHandler(SimpleHTTPRequestHandler):
+    """Serves a directory, but fails the first request for every data file."""
+
+    failed = set()
+
+    def do_GET(self):
+        if not self.path.endswith("index.json") and self.path not in self.failed:
+            self.failed.add(self.path)
+            self.send_error(503)
+            return
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def remote_folder(tmp_path):
+    """A folder with an index.json served over HTTP on localhost."""
+    served = tmp_path / "remote"
+    served.mkdir()
+
+    def publish(files):
+        index = []
+        for name, content in files.items():
+            (served / name).write_bytes(content)
+            index.append(
+                {
+                    "name": name,
+                    "size": len(content),
+                    "md5": hashlib.md5(content).hexdigest(),
+                }
+            )
+        (served / "index.json").write_text(json.dumps(index))
+
+    FlakyHandler.failed = set()
+    handler = functools.partial(FlakyHandler, directory=str(served))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/", publish
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_folder_only_downloads_missing_or_changed(remote_folder, tmp_path):
+    url, publish = remote_folder
+    local = str(tmp_path / "local")
+    files = {f"trial_{idx}.txt": f"data {idx}\n".encode() * 100 for idx in range(8)}
+    publish(files)
+
+    report = down.sync_folder(down.list_index(url), local, backoff=0.01)
+    assert sorted(report["downloaded"]) == sorted(files)
+    assert not report["failed"]
+    for name, content in files.items():
+        with open(os.path.join(local, name), "rb") as f:
+            assert f.read() == content
+    assert not [name for name in os.listdir(local) if name.endswith(".part")]
+
+    report = down.sync_folder(down.list_index(url), local, backoff=0.01)
+    assert report["downloaded"] == []
+    assert sorted(report["skipped"]) == sorted(files)
+
+    files["trial_3.txt"] = b"rewritten"
+    files["trial_8.txt"] = b"new"
+    publish(files)
+    os.remove(os.path.join(local, "trial_5.txt"))
+    report = down.sync_folder(down.list_index(url), local, backoff=0.01)
+    assert sorted(report["downloaded"]) == ["trial_3.txt", "trial_5.txt", "trial_8.txt"]
+    assert down.load_manifest(local)["trial_3.txt"]["size"] == len(b"rewritten")
+
+
+def test_sync_folder_reports_failures(remote_folder, tmp_path):
+    url, publish = remote_folder
+    publish({"good.txt": b"good"})
+    remote_files = down.list_index(url)
+    remote_files.append(down.RemoteFile("missing.txt", url + "missing.txt"))
+
+    local = str(tmp_path / "local")
+    report = down.sync_folder(remote_files, local, retries=2, backoff=0.01)
+    assert report["downloaded"] == ["good.txt"]
+    assert list(report["failed"]) == ["missing.txt"]
+    assert "missing.txt" not in down.load_manifest(local)
+
+
+def test_sync_folder_creates_subfolders(tmp_path):
+    def fetch(url, file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(url)
+
+    remote_files = [
+        down.RemoteFile("top.txt", "top"),
+        down.RemoteFile(os.path.join("day1", "trial.txt"), "day1 trial"),
+    ]
+    local = str(tmp_path / "local")
+    report = down.sync_folder(remote_files, local, fetch=fetch)
+    assert sorted(report["downloaded"]) == sorted(r.name for r in remote_files)
+    with open(os.path.join(local, "day1", "trial.txt"), encoding="utf-8") as f:
+        assert f.read() == "day1 trial"
+
+    report = down.sync_folder(remote_files, local, fetch=fetch)
+    assert report["downloaded"] == []
+
+
+def test_synced_folder_loads_as_trials(tmp_path, write_serial_file):
+    source = write_serial_file(tmp_path / "source.csv")
+    local = str(tmp_path / "local")
+    remote_files = [down.RemoteFile("trial.csv", source)]
+    down.sync_folder(remote_files, local, fetch=shutil.copyfile)
+    assert down.MANIFEST_NAME in os.listdir(local)
+
+    trials = format_folder(local)
+    assert [trial.name for trial in trials] == ["trial.csv"]
+    assert SegmentIndex().add_folder(local) == 1
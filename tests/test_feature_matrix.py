@@ -0,0 +1,55 @@
+"""Test functions in feature_matrix.py"""
+
+import os
+
+import numpy as np
+
+import capcup.feature_matrix as fm
+from capcup.trial_cache import TrialCache
+
+
+def test_window_features_match_loop():
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1000, (500, 8))
+    features = ("mean", "std", "ptp", "delta", "slope")
+    matrix = fm.window_features(data, 20, 7, features)
+
+    starts = range(0, len(data) - 20 + 1, 7)
+    assert matrix.shape == (len(starts), 5 * 8)
+    for row, start in zip(matrix, starts):
+        window = data[start : start + 20]
+        expected = [
+            window.mean(axis=0),
+            window.std(axis=0),
+            np.ptp(window, axis=0),
+            window[-1] - window[0],
+            np.polyfit(np.arange(20), window, 1)[0],
+        ]
+        assert np.allclose(row, np.concatenate(expected))
+
+
+def test_build_feature_matrices_uses_cache(tmp_path, write_serial_file):
+    paths = []
+    for idx in range(3):
+        paths.append(str(tmp_path / f"trial{idx}.csv"))
+        write_serial_file(paths[-1], num_samples=150 + idx)
+    cache = TrialCache(str(tmp_path / "cache"))
+
+    matrices = fm.build_feature_matrices(paths, 10, 5, cache=cache, workers=2)
+    assert [matrix.name for matrix in matrices] == [
+        "trial0.csv",
+        "trial1.csv",
+        "trial2.csv",
+    ]
+    assert matrices[0].features.shape == (29, len(fm.DEFAULT_FEATURES) * 8)
+    assert matrices[0].feature_names[0] == "mean_C1"
+    num_cached = len(os.listdir(cache.cache_dir))
+
+    again = fm.build_feature_matrices(paths, 10, 5, cache=cache)
+    assert len(os.listdir(cache.cache_dir)) == num_cached
+    for first, second in zip(matrices, again):
+        assert np.array_equal(first.features, second.features)
+        assert np.array_equal(first.actuated, second.actuated)
+
+    fm.build_feature_matrices(paths, 10, 2, cache=cache, workers=1)
+    assert len(os.listdir(cache.cache_dir)) == num_cached + 3
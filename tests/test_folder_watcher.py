@@ -0,0 +1,107 @@
+"""Test functions and class methods in folder_watcher.py"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+import capcup.feature_matrix as fm
+import capcup.folder_watcher as fw
+from capcup.segment_index import SegmentIndex
+from capcup.trial_cache import TrialCache
+
+
+def _poll_until(watcher, count, timeout=5.0):
+    """Polls until count changed or removed paths were reported."""
+    changed, removed = [], []
+    deadline = time.monotonic() + timeout
+    while len(changed) + len(removed) < count and time.monotonic() < deadline:
+        new_changed, new_removed = watcher.poll(0.05)
+        changed += new_changed
+        removed += new_removed
+    return changed, removed
+
+
+def test_trial_name():
+    assert fw.trial_name("run.csv") == "run.csv"
+    assert fw.trial_name("run.seg00003.csv.gz") == "run.segments.json"
+    assert fw.trial_name("Settings.txt") is None
+    assert fw.trial_name("tmpab12.tmp") is None
+    assert fw.trial_name(".cache") is None
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watcher_waits_for_files_to_settle(tmp_path, write_serial_file, use_inotify):
+    folder = str(tmp_path)
+    write_serial_file(tmp_path / "first.csv")
+    (tmp_path / "Settings.txt").write_text("settings")
+    with fw.FolderWatcher(
+        folder, settle=0.3, poll_interval=0.05, use_inotify=use_inotify
+    ) as watcher:
+        assert watcher.backend == ("inotify" if use_inotify else "polling")
+        assert _poll_until(watcher, 1) == ([os.path.join(folder, "first.csv")], [])
+
+        # a file that keeps growing is only reported once it stopped
+        path = os.path.join(folder, "growing.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            for _ in range(8):
+                f.write("1700000000.0 00000001\n")
+                f.flush()
+                assert watcher.poll(0.05) == ([], [])
+        assert _poll_until(watcher, 1) == ([path], [])
+
+        os.remove(path)
+        assert _poll_until(watcher, 1) == ([], [path])
+        assert watcher.poll(0.4) == ([], [])
+
+
+def test_ingest_updates_only_changed_trials(tmp_path, write_serial_file):
+    folder = tmp_path / "data"
+    folder.mkdir()
+    paths = [write_serial_file(folder / f"trial{idx}.csv") for idx in range(2)]
+    cache = TrialCache(str(tmp_path / "cache"))
+    index = SegmentIndex(str(tmp_path / "index"), cache=cache)
+    ingest = fw.FolderIngest(cache, index, window=10, stride=5)
+
+    with fw.FolderWatcher(str(folder), settle=0.1) as watcher:
+        changed, removed = _poll_until(watcher, 2)
+        assert ingest.update(changed, removed) == paths
+        assert len(index) == 2
+        expected = fm.build_folder_features(str(folder), 10, stride=5)
+        for matrix, other in zip(ingest.feature_matrices(), expected):
+            assert matrix.name == other.name
+            np.testing.assert_array_equal(matrix.features, other.features)
+
+        # only the new trial is read, the others come from memory
+        num_cached = len(os.listdir(cache.cache_dir))
+        paths.append(write_serial_file(folder / "trial2.csv", num_samples=300))
+        (folder / "notes.txt").write_text("not a recording")
+        changed, removed = _poll_until(watcher, 2)
+        assert ingest.update(changed, removed) == [paths[2]]
+        assert os.path.join(str(folder), "notes.txt") in ingest.errors
+        assert len(os.listdir(cache.cache_dir)) == num_cached + 2
+        assert len(index) == 4
+        assert len(ingest.trials[paths[2]].time) == 300
+
+        os.remove(paths[0])
+        changed, removed = _poll_until(watcher, 1)
+        ingest.update(changed, removed)
+        assert sorted(ingest.matrices) == paths[1:]
+        assert len(SegmentIndex(str(tmp_path / "index"))) == 3
+
+
+def test_ingest_keeps_going_when_the_index_cannot_be_saved(tmp_path, write_serial_file):
+    blocked = tmp_path / "index"
+    blocked.write_text("a file where the index directory should be")
+    index = SegmentIndex(str(blocked))
+    ingest = fw.FolderIngest(None, index)
+    path = write_serial_file(tmp_path / "trial.csv")
+    assert ingest.update([path], []) == [path]
+    assert str(blocked) in ingest.errors
+    assert len(index) == 1
+
+    blocked.unlink()
+    assert ingest.update([], []) == []
+    assert str(blocked) not in ingest.errors
+    assert len(SegmentIndex(str(blocked))) == 1
@@ -0,0 +1,73 @@
+"""Test functions in ground_truth_viz.py"""
+
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import capcup.ground_truth_viz as gtv
+import capcup.offset_generator as og
+
+EXTENT = (-80, 80, -60, 60)
+
+
+def brute_force(x, y, inside, resolution):
+    cx, cy = gtv.pixel_centers(EXTENT, resolution)
+    X, Y = np.meshgrid(cx, cy)
+    return sum(inside(X - x_center, Y - y_center) for x_center, y_center in zip(x, y))
+
+
+def test_coverage_counts_match_brute_force():
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(-90, 90, (2, 200))
+    rectangles = gtv.rectangle_coverage(x, y, 30, 20, EXTENT, 0.5)
+    expected = brute_force(
+        x, y, lambda dx, dy: (np.abs(dx) <= 15) & (np.abs(dy) <= 10), 0.5
+    )
+    assert np.array_equal(rectangles, expected)
+
+    # circle centers are snapped to pixels, so pixels on circle edges can be off
+    circles = gtv.circle_coverage(x, y, 20, EXTENT, 0.5)
+    expected = brute_force(x, y, lambda dx, dy: np.hypot(dx, dy) <= 20, 0.5)
+    assert circles.shape == expected.shape
+    assert np.abs(circles - expected).mean() < 0.15
+    assert abs(circles.sum() / expected.sum() - 1) < 0.01
+
+
+def test_coverage_image_alpha_composites_like_patches():
+    image = gtv.coverage_image(np.array([[0, 1, 2]]), "blue")
+    assert np.allclose(image[0, :, 3], [0, 0.05, 1 - 0.95**2])
+    assert np.allclose(image[0, :, :3], [0, 0, 1])
+
+
+def test_density_mode_renders_million_poses_quickly():
+    rng = np.random.default_rng(0)
+    samples = pd.DataFrame(
+        {
+            "x": rng.uniform(-30, 30, 1_000_000),
+            "y": rng.uniform(-30, 30, 1_000_000),
+            "label": rng.choice(og.LABELS, 1_000_000),
+        }
+    )
+    box = og.Box(x_size=100, y_size=100)
+    cup = og.SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
+    start = time.perf_counter()
+    gtv.cup_centric(samples, box, cup, mode="density")
+    gtv.tool_centric(samples, box, cup, mode="density")
+    plt.gcf().canvas.draw()
+    assert time.perf_counter() - start < 10
+    plt.close("all")
+
+
+def test_collection_mode_adds_one_artist_per_label():
+    samples = pd.DataFrame({"x": [0.0, 1.0], "y": [0.0, 2.0], "label": ["a", "a"]})
+    box = og.Box(x_size=100, y_size=100)
+    cup = og.SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
+    gtv.tool_centric(samples, box, cup, mode="collection")
+    ax = plt.gcf().axes[0]
+    assert len(ax.collections) == 1 and len(ax.patches) == 1
+    plt.close("all")
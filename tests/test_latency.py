@@ -0,0 +1,60 @@
+"""Test functions and class methods in latency.py"""
+
+import numpy as np
+
+import capcup.latency as lat
+
+
+def delayed_response(delays, period=0.01, segment=100, channels=3, seed=0):
+    """A recording whose channels step up `delays` samples after every rising
+    flag edge and back down as long after every falling edge."""
+    rng = np.random.default_rng(seed)
+    num_samples = segment * (len(delays) + 1)
+    time = np.arange(num_samples) * period
+    actuations = np.zeros(num_samples, dtype=int)
+    response = np.zeros(num_samples)
+    for idx, delay in enumerate(delays):
+        edge = segment * (idx + 1)
+        actuations[edge:] = 1 - actuations[edge - 1]
+        response[edge + delay :] = actuations[edge] * 50
+    cap_counts = 1e6 + response[:, None] + rng.normal(0, 0.5, (num_samples, channels))
+    return time, cap_counts, actuations
+
+
+def test_onset_latencies_recover_delays():
+    delays = [3, 7, 12, 5, 9]
+    time, cap_counts, actuations = delayed_response(delays)
+    edges, rising, latencies = lat.onset_latencies(time, cap_counts, actuations)
+    assert np.array_equal(edges, 100 * np.arange(1, 6))
+    assert np.array_equal(rising, [True, False, True, False, True])
+    assert np.allclose(latencies, np.array(delays)[:, None] * 0.01)
+
+
+def test_missing_onset_is_nan():
+    time, cap_counts, actuations = delayed_response([3, 150])
+    _, _, latencies = lat.onset_latencies(time, cap_counts, actuations, window=50)
+    assert np.allclose(latencies[0], 0.03)
+    assert np.isnan(latencies[1]).all()
+
+
+def test_summary_and_rolling_latency_agree():
+    delays = np.tile([2, 4, 6, 8], 10)
+    time, cap_counts, actuations = delayed_response(delays)
+    edges, rising, latencies = lat.onset_latencies(time, cap_counts, actuations)
+    result = lat.TrialLatency("trial", time[edges], rising, latencies)
+    summary = lat.latency_summary([result, result])
+    assert summary.loc[("rising", "first"), "edges"] == 40
+    assert summary.loc[("falling", "C2"), "detected"] == 1
+    assert np.isclose(summary.loc[("rising", "C1"), "p50_ms"], 40)
+
+    rolling = lat.RollingLatency()
+    measured = [
+        rolling.update(t, counts, flag)
+        for t, counts, flag in zip(time, cap_counts, actuations)
+    ]
+    measured = [value for value in measured if value is not None]
+    assert np.allclose(measured, result.first_onset)
+    assert np.allclose(
+        rolling.percentiles((50, 99)), np.percentile(delays * 0.01, (50, 99))
+    )
+    assert "p50/p99: 50/80 ms" in rolling.status()
@@ -0,0 +1,71 @@
+"""Test functions and class methods in minmax_pyramid.py"""
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+import capcup.minmax_pyramid as mmp
+from capcup.trial_cache import TrialCache
+
+
+class FakeTrial:
+    def __init__(self, num_samples=10_000, seed=0):
+        rng = np.random.default_rng(seed)
+        self.time = np.arange(num_samples) * 0.01
+        self.cap_counts = rng.integers(0, 1_000_000, (num_samples, 8), dtype=np.int32)
+        self.cache_key = f"fake{seed}"
+
+
+def test_streaming_matches_single_pass():
+    trial = FakeTrial()
+    whole = mmp.MinMaxPyramid(8)
+    whole.extend(trial.time, trial.cap_counts)
+    streamed = mmp.MinMaxPyramid(8)
+    for idx in range(0, len(trial.time), 333):
+        streamed.extend(trial.time[idx : idx + 333], trial.cap_counts[idx : idx + 333])
+
+    assert whole.num_levels == streamed.num_levels
+    for level in range(whole.num_levels):
+        for expected, actual in zip(whole.level(level), streamed.level(level)):
+            assert np.array_equal(expected, actual)
+
+
+def test_levels_bound_the_data():
+    trial = FakeTrial(10_003)
+    pyramid = mmp.MinMaxPyramid(8, factor=4)
+    pyramid.extend(trial.time, trial.cap_counts)
+    times, mins, maxs = pyramid.level(1)
+    assert len(times) == int(np.ceil(len(trial.time) / 16))
+    assert np.array_equal(mins[0], trial.cap_counts[:16].min(axis=0))
+    assert np.array_equal(maxs[-1], trial.cap_counts[-3:].max(axis=0))
+    assert np.array_equal(
+        pyramid.level(pyramid.num_levels - 1)[2].max(axis=0),
+        trial.cap_counts.max(axis=0),
+    )
+
+
+def test_cached_pyramid_can_keep_growing(tmp_path):
+    trial = FakeTrial()
+    cache = TrialCache(str(tmp_path))
+    pyramid = mmp.MinMaxPyramid.from_trial(trial, cache)
+    loaded = mmp.MinMaxPyramid.from_trial(trial, cache)
+    more = FakeTrial(seed=1)
+    pyramid.extend(more.time + 100, more.cap_counts)
+    loaded.extend(more.time + 100, more.cap_counts)
+    assert loaded.num_samples == 20_000
+    for expected, actual in zip(pyramid.level(3), loaded.level(3)):
+        assert np.array_equal(expected, actual)
+
+
+def test_plot_swaps_levels_on_zoom():
+    trial = FakeTrial(100_000)
+    fig, ax = plt.subplots()
+    plot = mmp.MinMaxPlot(ax, trial.time, trial.cap_counts, max_points=1000)
+    assert plot.current_level >= 0
+    assert len(plot.lines[0].get_xdata()) <= 2 * 1000 + 4
+    ax.set_xlim(10, 12)
+    assert plot.current_level == -1
+    plt.close(fig)
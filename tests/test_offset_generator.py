@@ -0,0 +1,128 @@
+"""Test functions and class methods in offset_generator.py"""
+
+import numpy as np
+
+import capcup.offset_generator as og
+
+BOX = og.Box(x_size=100, y_size=100)
+CUP = og.SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
+
+
+def test_sample_poses_is_seeded():
+    first = BOX.sample_poses(1000, CUP, rng=42)
+    second = BOX.sample_poses(1000, CUP, rng=42)
+    assert first.dtype == og.POSE_DTYPE
+    assert np.array_equal(first, second)
+    assert not np.array_equal(first, BOX.sample_poses(1000, CUP, rng=43))
+
+
+def test_class_proportions():
+    poses = BOX.sample_poses(1001, CUP, proportions=(2, 1, 1), rng=0)
+    assert np.array_equal(np.bincount(poses["label"]), [501, 250, 250])
+    assert len(set(poses["label"][:20])) > 1  # shuffled
+
+
+def test_poses_are_in_their_regions():
+    poses = BOX.sample_poses(30_000, CUP, rng=1)
+    radius = CUP.diameter / 2
+    assert np.all((poses["z"] >= 1.7) & (poses["z"] <= 6.7))
+
+    aligned = poses[poses["label"] == 0]
+    assert np.abs(aligned["x"]).max() <= 50 - radius
+    assert np.abs(aligned["y"]).max() <= 50 - radius
+
+    edge = poses[poses["label"] == 1]
+    outer = np.maximum(np.abs(edge["x"]), np.abs(edge["y"]))
+    inner = np.minimum(np.abs(edge["x"]), np.abs(edge["y"]))
+    assert np.all((outer >= 50 - radius) & (outer <= 50 + radius))
+    assert inner.max() <= 50 - radius
+
+    corner = poses[poses["label"] == 2]
+    distance = np.hypot(np.abs(corner["x"]) - 50, np.abs(corner["y"]) - 50)
+    assert distance.max() <= radius
+    # all 4 corners and strips are used
+    assert len(set(zip(np.sign(corner["x"]), np.sign(corner["y"])))) == 4
+
+
+def test_sample_dataframe():
+    frame = BOX.sample(10, CUP, rng=0)
+    assert len(frame) == 30
+    assert list(frame.columns) == ["x", "y", "z", "alpha", "beta", "gamma", "label"]
+    assert set(frame["label"]) == set(og.LABELS)
+    assert set(BOX.sample_edge_misaligned(5, CUP)["label"]) == {"edge_misaligned"}
+
+
+def test_untilted_samples_are_valid():
+    poses = BOX.sample_poses(10_000, CUP, rng=2)
+    compression = BOX.cup_compression(poses, CUP)
+    assert np.allclose(compression, CUP.lip_to_board_height - poses["z"])
+    assert BOX.valid_poses(poses, CUP).all()
+
+
+def test_collisions_are_rejected():
+    poses = BOX.sample_poses(100, CUP, proportions=(1, 0, 0), rng=3)
+    poses["beta"] = 0.2  # 100 mm box edge dips ~10 mm: hits the board
+    assert not BOX.valid_poses(poses, CUP).any()
+
+    poses = BOX.sample_poses(100, CUP, proportions=(1, 0, 0), rng=3)
+    poses["z"] = CUP.lip_to_board_height - CUP.max_actuation - 0.5
+    assert not BOX.valid_poses(poses, CUP).any()  # pushed past max_actuation
+
+    poses["x"] = 200
+    assert np.isnan(BOX.cup_compression(poses, CUP)).all()  # no contact
+
+
+def test_tilted_compression_matches_dense_lip():
+    poses = BOX.sample_poses(500, CUP, rng=4)
+    rng = np.random.default_rng(4)
+    for angle, limit in (("alpha", 0.05), ("beta", 0.05), ("gamma", np.pi)):
+        poses[angle] = rng.uniform(-limit, limit, len(poses))
+    compression = BOX.cup_compression(poses, CUP)
+
+    theta = np.linspace(0, 2 * np.pi, 20_000)
+    lip = CUP.diameter / 2 * np.stack((np.cos(theta), np.sin(theta), 0 * theta))
+    for pose, expected in zip(poses, compression):
+        rotation = og.rotation_matrices(pose["alpha"], pose["beta"], pose["gamma"])
+        normal = rotation[:, 2]
+        relative = lip[:2] - np.array([[pose["x"]], [pose["y"]]])
+        dz = -(normal[:2] @ relative) / normal[2]
+        local = rotation.T @ np.vstack((relative, dz))
+        under = (np.abs(local[0]) <= 50) & (np.abs(local[1]) <= 50)
+        if under.any():
+            dense = (CUP.lip_to_board_height - pose["z"] - dz)[under].max()
+            assert abs(dense - expected) < 1e-2
+        else:
+            assert np.isnan(expected)
+
+
+def test_sample_valid_poses():
+    poses = BOX.sample_valid_poses(
+        3000, CUP, max_tilt=(0.05, 0.05, np.pi), proportions=(1, 1, 1), rng=5
+    )
+    assert np.array_equal(np.bincount(poses["label"]), [1000, 1000, 1000])
+    assert BOX.valid_poses(poses, CUP).all()
+    assert np.abs(poses["gamma"]).max() > 1
+
+
+def test_unit_from_poses_inverts_map_unit():
+    unit = np.random.default_rng(6).random((3, 1000))
+    poses = np.zeros(1000, dtype=og.POSE_DTYPE)
+    for code in range(len(og.LABELS)):
+        BOX.map_unit(code, unit.copy(), CUP, poses)
+        assert np.allclose(BOX.unit_from_poses(code, poses, CUP), unit.T)
+
+
+def test_low_discrepancy_sampling():
+    random = BOX.sample_poses(3 * 512, CUP, rng=7)
+    sobol = BOX.sample_poses(3 * 512, CUP, rng=7, method="sobol")
+    assert np.array_equal(sobol, BOX.sample_poses(3 * 512, CUP, rng=7, method="sobol"))
+    random_report = BOX.coverage_report(random, CUP)
+    for method in ("sobol", "halton"):
+        poses = BOX.sample_poses(3 * 512, CUP, rng=7, method=method)
+        assert BOX.valid_poses(poses, CUP).all()
+        report = BOX.coverage_report(og.poses_to_frame(poses), CUP)
+        for label in og.LABELS:
+            assert report[label]["num_samples"] == 512
+            assert (
+                report[label]["discrepancy"] < random_report[label]["discrepancy"] / 5
+            )
@@ -0,0 +1,49 @@
+"""Test functions in profiling.py"""
+
+import pytest
+
+import capcup.profiling as prof
+from capcup.serial_data_formatter import SerialData
+
+
+@pytest.fixture
+def profiling():
+    prof.reset()
+    prof.enable()
+    yield prof
+    prof.enable(False)
+    prof.reset()
+
+
+def test_disabled_stage_is_shared_no_op():
+    assert not prof.enabled()
+    assert prof.stage("a") is prof.stage("b")
+    with prof.stage("a"):
+        pass
+    assert "a" not in prof.report()
+
+
+def test_loader_stages_are_reported(profiling, tmp_path, write_serial_file):
+    path = write_serial_file(tmp_path / "trial.txt")
+    SerialData(path)
+    SerialData(path)
+    report = profiling.report()
+    for name in ("serial.load", "serial.io", "serial.parse", "serial.to_numpy"):
+        assert report[name]["calls"] == 2
+    assert report["serial.load"]["total_s"] >= report["serial.parse"]["total_s"]
+    assert "serial.segments" in profiling.format_report()
+
+
+def test_capture_modes(capsys, tmp_path):
+    with prof.capture("cprofile"):
+        sum(range(1000))
+    assert "cumulative" in capsys.readouterr().err
+
+    with prof.capture("tracemalloc", top=3):
+        data = [bytes(1000) for _ in range(100)]
+    assert "Peak traced memory" in capsys.readouterr().err
+
+    output = tmp_path / "stats.prof"
+    with prof.capture("cprofile", output=str(output)):
+        del data
+    assert output.stat().st_size > 0
@@ -0,0 +1,96 @@
+"""Test functions and class methods in recording_segments.py"""
+
+import gzip
+import json
+import os
+
+import numpy as np
+
+import capcup.recording_segments as rs
+from capcup.serial_data_formatter import SerialData, format_folder
+from capcup.trial_cache import TrialCache
+
+
+def _record(writer, path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            writer.write(line)
+            writer.flush()
+    writer.close()
+
+
+def test_segmented_recording_reads_as_one_trial(tmp_path, write_serial_file):
+    plain = write_serial_file(tmp_path / "plain.csv")
+    folder = tmp_path / "segmented"
+    folder.mkdir()
+    writer = rs.SegmentWriter(str(folder / "run"), max_bytes=4000)
+    _record(writer, plain)
+
+    index = json.loads((folder / "run.segments.json").read_text())
+    segments = index["segments"]
+    assert len(segments) > 3
+    assert all(seg["closed"] and seg["compressed"] for seg in segments)
+    assert set(os.listdir(folder)) == {"run.segments.json"} | {
+        seg["file"] for seg in segments
+    }
+    assert sum(seg["lines"] for seg in segments) == 201
+    times = [seg["first_time"] for seg in segments]
+    assert times == sorted(times)
+    assert segments[0]["first_time"] == 1700000000.0
+
+    expected = SerialData(plain)
+    trial = SerialData(str(folder / "run.segments.json"))
+    np.testing.assert_array_equal(trial.cap_counts, expected.cap_counts)
+    np.testing.assert_allclose(trial.time, expected.time)
+    assert trial.start_time == expected.start_time
+
+    trials = format_folder(str(folder))
+    assert len(trials) == 1
+    np.testing.assert_array_equal(trials[0].actuations, expected.actuations)
+
+
+def test_uncompressed_and_gzipped_files(tmp_path, write_serial_file):
+    plain = write_serial_file(tmp_path / "plain.csv")
+    with open(plain, "rb") as source, gzip.open(tmp_path / "one.csv.gz", "wb") as f:
+        f.write(source.read())
+    np.testing.assert_array_equal(
+        SerialData(str(tmp_path / "one.csv.gz")).cap_counts,
+        SerialData(plain).cap_counts,
+    )
+
+    writer = rs.SegmentWriter(str(tmp_path / "run"), max_bytes=4000, compress=False)
+    _record(writer, plain)
+    paths = rs.segment_paths(writer.index_path)
+    assert not any(path.endswith(".gz") for path in paths)
+    assert all(rs.is_segment_file(path) for path in paths)
+    assert not rs.is_segment_file(writer.index_path)
+    with rs.open_recording(writer.index_path) as f, open(plain) as expected:
+        assert f.read() == expected.read()
+
+    # sized reads cross segment boundaries like one file
+    with rs.open_recording(writer.index_path) as f, open(plain) as expected:
+        assert f.readline(5) == expected.readline(5)
+        assert f.read(5000) == expected.read(5000)
+        assert f.readlines(100) == expected.readlines(100)
+        assert f.read() == expected.read()
+
+
+def test_time_rollover_and_cache_key(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rs.time, "time", lambda: clock[0])
+    writer = rs.SegmentWriter(str(tmp_path / "run"), max_seconds=60, compress=False)
+    counts = " ".join(["10000000"] * 8)
+    for idx in range(10):
+        clock[0] += 20
+        writer.write(f"{clock[0]} {counts} {idx % 2}\n")
+    writer.flush()
+    cache = TrialCache(str(tmp_path / "cache"))
+    trial = SerialData(writer.index_path, cache=cache)
+    assert len(trial.time) == 10
+
+    # growing the open segment changes the key, so the cache is not stale
+    writer.write(f"{clock[0] + 1} {counts} 0\n")
+    writer.close()
+    assert len(writer.index["segments"]) == 4
+    assert writer.index["segments"][1]["first_time"] == 1060.0
+    assert len(SerialData(writer.index_path, cache=cache).time) == 11
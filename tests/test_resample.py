@@ -0,0 +1,54 @@
+"""Test functions in resample.py"""
+
+import numpy as np
+
+import capcup.resample as rs
+
+
+def jittery_stream(num_samples=2000, period=0.01, seed=0):
+    rng = np.random.default_rng(seed)
+    time = np.cumsum(period + rng.uniform(-0.3, 0.3, num_samples) * period)
+    values = np.c_[np.sin(2 * np.pi * time), 2 * time]
+    return time, values
+
+
+def test_linear_is_exact_for_ramps():
+    time, values = jittery_stream()
+    grid, grid_values = rs.resample(time, values, 0.01)
+    assert np.allclose(np.diff(grid), 0.01)
+    assert np.allclose(grid_values[:, 1], 2 * grid)
+
+
+def test_chunked_matches_whole():
+    time, values = jittery_stream()
+    for method in rs.METHODS:
+        grid, whole = rs.resample(time, values, 0.05, method)
+        chunked_grid, chunked = rs.resample(time, values, 0.05, method, chunk_size=97)
+        assert np.allclose(grid, chunked_grid)
+        assert np.allclose(whole, chunked)
+
+
+def test_zoh_holds_last_sample():
+    time = np.array([0.0, 1.0, 2.5])
+    grid, grid_values = rs.resample(time, np.array([1, 2, 3]), 0.5, "zoh")
+    assert np.allclose(grid, [0, 0.5, 1, 1.5, 2, 2.5])
+    assert np.allclose(grid_values[:, 0], [1, 1, 2, 2, 2, 3])
+
+
+def test_decimate_removes_aliasing_tone():
+    time = np.arange(0, 20, 0.001)
+    slow, fast = np.sin(2 * np.pi * 1 * time), np.sin(2 * np.pi * 45 * time)
+    grid, grid_values = rs.resample(time, np.c_[slow + fast], 0.02, "decimate")
+    expected = np.sin(2 * np.pi * grid)
+    assert np.abs(grid_values[:, 0] - expected)[50:-50].max() < 0.05
+
+
+def test_align_pads_streams_with_nan():
+    time_a, values_a = np.arange(0, 10, 0.1), np.arange(100.0)
+    time_b, values_b = np.arange(0, 5, 0.1), np.arange(50.0)
+    grid, (a, b) = rs.align(
+        [(time_a, values_a), (time_b, values_b)], 0.5, offsets=[0, 2]
+    )
+    assert len(grid) == len(a) == len(b)
+    assert np.isnan(b[grid < 2]).all()
+    assert np.allclose(b[grid == 2.5, 0], 5)
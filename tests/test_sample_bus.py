@@ -0,0 +1,121 @@
+"""Test functions and class methods in sample_bus.py"""
+
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import capcup.sample_bus as sb
+
+
+@pytest.fixture
+def publisher():
+    with sb.SamplePublisher(f"capcup_test_{os.getpid()}", capacity=16) as bus:
+        yield bus
+
+
+def _frame(seq):
+    return [seq] * 8 + [seq % 2]
+
+
+def test_readers_see_every_frame_in_order(publisher):
+    first = sb.SampleReader(publisher.name)
+    publisher.publish(100.0, _frame(0))
+    second = sb.SampleReader(publisher.name)
+    for seq in range(1, 10):
+        publisher.publish(100.0 + seq, _frame(seq))
+
+    frames = first.read(max_frames=4)
+    np.testing.assert_array_equal(frames[:, 0], [100, 101, 102, 103])
+    np.testing.assert_array_equal(frames[1, 1:], _frame(1))
+    assert first.lag == 6
+    assert len(first.read()) == 6
+    np.testing.assert_array_equal(second.read()[:, 0], 101.0 + np.arange(9))
+    assert len(second.read()) == 0
+    assert first.dropped == second.dropped == 0
+
+    np.testing.assert_array_equal(second.latest(3)[:, 0], [107, 108, 109])
+    first.close()
+    second.close()
+
+
+def test_lagging_reader_drops_oldest_frames(publisher):
+    reader = sb.SampleReader(publisher.name)
+    for seq in range(40):
+        publisher.publish(float(seq), _frame(seq))
+    frames = reader.read()
+    assert reader.dropped == 24
+    np.testing.assert_array_equal(frames[:, 0], np.arange(24, 40))
+
+    # a slot being rewritten is dropped rather than returned torn
+    publisher.publish(40.0, _frame(40))
+    publisher.seqs[41 % 16] = -1
+    publisher.header[0] = 42
+    frames = reader.read()
+    np.testing.assert_array_equal(frames[:, 0], [40])
+    assert reader.dropped == 25
+    reader.close()
+
+
+def test_publisher_replaces_only_stale_memory(publisher):
+    with pytest.raises(FileExistsError):
+        sb.SamplePublisher(publisher.name, capacity=16)
+    publisher.publish(1.0, _frame(1))
+    with sb.SampleReader(publisher.name, from_start=True) as reader:
+        assert len(reader.read()) == 1
+
+    # memory left behind by a publisher that exited without closing
+    child = multiprocessing.get_context("spawn").Process(target=os.getpid)
+    child.start()
+    child.join()
+    name = f"capcup_stale_{os.getpid()}"
+    stale = sb.SamplePublisher(name, capacity=16)
+    stale.header[3] = child.pid
+    del stale.header, stale.seqs, stale.frames
+    stale.shm.close()
+    stale.shm = None
+    with sb.SamplePublisher(name, capacity=16) as replacement:
+        assert replacement.header[3] == os.getpid()
+
+
+def _read_in_child(name, queue):
+    with sb.SampleReader(name, from_start=True) as reader:
+        queue.put(reader.read()[:, 0].tolist())
+
+
+def test_reader_in_another_process(publisher):
+    for seq in range(5):
+        publisher.publish(float(seq), _frame(seq))
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    child = context.Process(target=_read_in_child, args=(publisher.name, queue))
+    child.start()
+    assert queue.get(timeout=30) == [0, 1, 2, 3, 4]
+    child.join()
+    # the child detached without removing the publisher's memory
+    publisher.publish(5.0, _frame(5))
+    with sb.SampleReader(publisher.name, from_start=True) as reader:
+        assert len(reader.read()) == 6
+
+
+def test_tcp_relay(publisher):
+    relay = sb.TcpRelay(publisher.name, host="127.0.0.1", port=0).start()
+    frames = sb.tcp_frames(*relay.address, timeout=5)
+    done = threading.Event()
+
+    def publish():
+        # the client's reader starts at the head once it is connected
+        while not done.wait(0.01):
+            publisher.publish(1.5, _frame(7))
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    try:
+        assert next(frames) == [1.5] + _frame(7)
+    finally:
+        done.set()
+        thread.join()
+        frames.close()
+        relay.stop()
@@ -0,0 +1,51 @@
+"""Test functions and class methods in sciosense_data_formatter.py"""
+
+import numpy as np
+
+import capcup.sciosense_data_formatter as ssdf
+from capcup.trial_cache import TrialCache
+
+
+def write_sciosense_file(path, labels, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("PCAP01 Evaluation\nFirmware: 03.01.02\n\n")
+        f.write("\t".join(labels) + "\n")
+        for row in rows:
+            f.write("\t".join(f"{value:.6f}" for value in row) + "\n")
+
+
+def test_single_column(tmp_path):
+    path = tmp_path / "single.txt"
+    write_sciosense_file(path, ["%C1/C0"], np.arange(10.0)[:, None])
+    trial = ssdf.SciosenseCapData(str(path))
+    assert trial.data_label == "%C1/C0"
+    assert trial.data_labels == ["C1/C0"]
+    assert np.allclose(trial.cap_counts, np.arange(10.0))
+    assert len(trial.time) == 10
+
+
+def test_multi_column_cached(tmp_path):
+    path = tmp_path / "multi.txt"
+    rows = np.random.default_rng(0).uniform(0, 2, (50, 3))
+    write_sciosense_file(path, ["%C1/C0", "%C2/C0", "%C3/C0"], rows)
+    cache = TrialCache(str(tmp_path / "cache"))
+
+    trial = ssdf.SciosenseCapData(str(path), cache=cache)
+    cached = ssdf.format_folder(str(tmp_path), cache=cache, lazy=True)[0]
+    assert trial.data_labels == ["C1/C0", "C2/C0", "C3/C0"]
+    assert trial.cap_data.shape == (50, 3)
+    assert np.allclose(trial.channel("C2/C0"), rows[:, 1], atol=1e-6)
+    assert cached.data_labels == trial.data_labels
+    assert np.array_equal(cached.cap_data, trial.cap_data)
+
+
+def test_truncated_last_row(tmp_path):
+    path = tmp_path / "interrupted.txt"
+    rows = np.random.default_rng(1).uniform(0, 2, (20, 3))
+    write_sciosense_file(path, ["%C1/C0", "%C2/C0", "%C3/C0"], rows)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("1.234567\t0.5")  # the recording stopped mid-row
+
+    trial = ssdf.SciosenseCapData(str(path))
+    assert trial.cap_data.shape == (20, 3)
+    assert np.allclose(trial.cap_data, rows, atol=1e-6)
@@ -0,0 +1,98 @@
+"""Test functions and class methods in segment_index.py"""
+
+import numpy as np
+
+import capcup.segment_index as si
+from capcup.trial_cache import TrialCache
+
+
+def _write_trial(path, amplitudes, rng):
+    """A recording with one 30 sample press per amplitude, each channel
+    responding with amplitude * (channel + 1), 40 released samples apart."""
+    lines = []
+    sample = 0
+    for amplitude in list(amplitudes) + [None]:
+        for _ in range(40):
+            counts = 10_000_000 + rng.integers(0, 5, 8)
+            lines.append((sample, counts, 0))
+            sample += 1
+        if amplitude is None:
+            break
+        ramp = np.sin(np.linspace(0, np.pi, 30))[:, None] * (np.arange(8) + 1)
+        for row in ramp:
+            counts = 10_000_000 + (amplitude * row).astype(int) + rng.integers(0, 5, 8)
+            lines.append((sample, counts, 1))
+            sample += 1
+    with open(path, "w", encoding="utf-8") as f:
+        for idx, counts, flag in lines:
+            values = " ".join(f"{value:08d}" for value in counts)
+            f.write(f"{1700000000 + idx * 0.01:.6f} {values} {flag}\n")
+    return str(path)
+
+
+def test_press_bounds_and_embedding():
+    starts, ends = si.press_bounds(np.array([1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 0, 1]))
+    np.testing.assert_array_equal(starts, [4, 8])
+    np.testing.assert_array_equal(ends, [7, 9])
+
+    counts = np.arange(10.0)[:, None] * [1, 2]
+    vector = si.embed_segment(counts, np.array([1, 0]), length=4)
+    assert vector.dtype == np.float32
+    np.testing.assert_allclose(vector, [-1, 2, 5, 8, 0, 6, 12, 18])
+    features = si.embed_segment(counts, 0, "features", features=("max", "delta"))
+    np.testing.assert_allclose(features, [9, 18, 9, 18])
+
+
+def test_index_queries_incremental_inserts_and_reload(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = [
+        _write_trial(tmp_path / f"trial{idx}.csv", amplitudes, rng)
+        for idx, amplitudes in enumerate([(100, 400), (200, 800, 300)])
+    ]
+    cache = TrialCache(str(tmp_path / "cache"))
+    index = si.SegmentIndex(str(tmp_path / "index"), cache=cache)
+    assert index.add_trial(paths[0]) == 2
+    assert index.add_trial(paths[0]) == 0
+    assert index.add_trial(paths[1]) == 3
+    assert len(index.pending) == 5 and index.vectors is None
+
+    probe = np.sin(np.linspace(0, np.pi, 30))[:, None] * (np.arange(8) + 1) * 310
+    matches = index.query_segment(probe, np.zeros(8), k=2)
+    assert [(m.ref.file_path, m.ref.start) for m in matches] == [
+        (paths[1], 180),
+        (paths[0], 110),
+    ]
+    assert not matches[0].ref.trial.loaded
+    assert matches[0].ref.cap_counts.shape == (30, 8)
+    assert matches[0].ref.trial.loaded
+
+    index.save()
+    reloaded = si.SegmentIndex(str(tmp_path / "index"), cache=cache)
+    assert len(reloaded) == 5 and not reloaded.pending
+    again = reloaded.query_segment(probe, np.zeros(8), k=2)
+    assert [m.ref for m in again] == [m.ref for m in matches]
+    np.testing.assert_allclose(
+        [m.distance for m in again], [m.distance for m in matches], rtol=1e-5
+    )
+
+    # a trial that grew is re-indexed rather than duplicated
+    _write_trial(paths[0], (100, 400, 600), rng)
+    assert reloaded.add_trial(paths[0]) == 3
+    assert len(reloaded) == 6
+    assert reloaded.query(reloaded.vectors[0], k=1)[0].distance == 0
+
+
+def test_index_saved_empty_reloads_and_grows(tmp_path):
+    rng = np.random.default_rng(1)
+    empty = _write_trial(tmp_path / "empty.csv", (), rng)
+    index = si.SegmentIndex(str(tmp_path / "index"))
+    assert index.add_trial(empty) == 0
+    index.save()
+
+    reloaded = si.SegmentIndex(str(tmp_path / "index"))
+    assert reloaded.vectors is None and len(reloaded) == 0
+    assert reloaded.add_trial(_write_trial(tmp_path / "trial.csv", (100,), rng)) == 1
+    reloaded.save()
+    again = si.SegmentIndex(str(tmp_path / "index"))
+    assert again.vectors.shape == (1, 16 * 8)
+    assert again.query(again.vectors[0], k=1)[0].ref.file_path.endswith("trial.csv")
@@ -0,0 +1,32 @@
+"""Test functions and class methods in serial_data_formatter.py"""
+
+import numpy as np
+
+import capcup.serial_data_formatter as sdf
+from capcup.trial_cache import TrialCache
+
+
+def test_SerialData(tmp_path, write_serial_file):
+    data_path = tmp_path / "trial.csv"
+    write_serial_file(data_path)
+    trial = sdf.SerialData(str(data_path))
+    assert trial.cap_counts.shape == (200, 8)
+    assert trial.start_time == 1700000000
+    assert np.array_equal(trial.actuation_starts, [50, 150])
+    assert np.array_equal(trial.actuation_ends, [100])
+
+
+def test_cached_and_lazy_format_folder(tmp_path, write_serial_file):
+    folder = tmp_path / "trials"
+    folder.mkdir()
+    write_serial_file(folder / "a.csv")
+    write_serial_file(folder / "b.csv", num_samples=120)
+    cache = TrialCache(str(tmp_path / "cache"))
+
+    parsed = sdf.format_folder(str(folder), cache=cache)
+    lazy = sdf.format_folder(str(folder), cache=cache, lazy=True)
+    assert not any(trial.loaded for trial in lazy)
+    for expected, trial in zip(parsed, lazy):
+        assert np.array_equal(expected.cap_counts, trial.cap_counts)
+        assert expected.start_time == trial.start_time
+    assert all(trial.loaded for trial in lazy)
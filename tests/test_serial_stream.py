@@ -0,0 +1,24 @@
+"""Test functions and class methods in serial_stream.py"""
+
+import pytest
+
+import capcup.serial_stream as ss
+
+
+def test_lines_across_chunk_boundaries():
+    stream = "".join(f"{idx} 1 2 3 4 5 6 7 0\r\n" for idx in range(100)) + "\n\n99 1"
+    decoder = ss.SerialDecoder()
+    lines = []
+    for start in range(0, len(stream), 7):
+        lines += decoder.lines(stream[start : start + 7])
+    assert lines == [f"{idx} 1 2 3 4 5 6 7 0" for idx in range(100)]
+    assert decoder.buffer == "99 1"
+    assert decoder.lines("") == []
+
+
+def test_parse_line():
+    assert ss.parse_line("1 2 3 4 5 6 7 8 1") == [1, 2, 3, 4, 5, 6, 7, 8, 1]
+    with pytest.raises(ValueError):
+        ss.parse_line("1 2 3")
+    with pytest.raises(ValueError):
+        ss.parse_line("1 2 3 4 5 6 7 8 x")
@@ -0,0 +1,59 @@
+"""Test functions and class methods in synthetic_data.py"""
+
+import os
+
+import numpy as np
+
+import capcup.synthetic_data as sd
+from capcup.eval_data_formatter import EvalBoardData
+from capcup.sciosense_data_formatter import SciosenseCapData
+from capcup.serial_data_formatter import SerialData
+
+
+def test_serial_round_trip_skips_corrupt_lines(tmp_path):
+    path = str(tmp_path / "serial.txt")
+    info = sd.write_serial(path, 20_000, corruption=0.01, chunk_size=3000, rng=0)
+    assert 100 < len(info["corrupted"]) < 300
+
+    trial = SerialData(path)
+    assert len(trial.time) == 20_000 - len(info["corrupted"])
+    assert trial.cap_counts.shape[1] == 8
+    assert np.allclose(np.median(np.diff(trial.time)), 0.01)
+    # square actuation: 100 samples at rest, then 100 actuated
+    assert np.array_equal(np.unique(trial.actuations), [0, 1])
+    assert abs(trial.actuations.mean() - 0.5) < 0.01
+
+
+def test_output_does_not_depend_on_chunk_size(tmp_path):
+    paths = [str(tmp_path / f"{size}.txt") for size in (777, 1 << 16)]
+    for path, size in zip(paths, (777, 1 << 16)):
+        sd.write_serial(path, 5000, chunk_size=size, rng=1, pattern="random")
+    with open(paths[0], "rb") as first, open(paths[1], "rb") as second:
+        assert first.read() == second.read()
+
+
+def test_eval_round_trip(tmp_path):
+    path = str(tmp_path / "eval.txt")
+    info = sd.write_eval(path, size_bytes=140_000, corruption=0.001, rng=2)
+    trial = EvalBoardData(path)
+    assert len(trial.cap_counts) == info["num_samples"] == 10_000
+    assert trial.sampling_period == 0.062
+    assert trial.headers["Capdac"] == "0"
+
+
+def test_sciosense_round_trip(tmp_path):
+    path = str(tmp_path / "sciosense.txt")
+    info = sd.write_sciosense(path, 5000, channels=3, noise=10, rng=3)
+    trial = SciosenseCapData(path)
+    assert trial.data_labels == ["C1/C0", "C2/C0", "C3/C0"]
+    assert trial.cap_data.shape == (5000, 3)
+    assert np.all((0.5 < trial.cap_data) & (trial.cap_data < 2))
+    assert info["bytes"] == os.path.getsize(path)
+
+
+def test_signal_responds_to_actuation():
+    signal = sd.SignalGenerator(channels=2, noise=1, drift=0, rng=4)
+    counts, flags = signal.chunk(400)
+    actuated = counts[flags == 1][-10:].mean(axis=0)
+    rest = counts[flags == 0][-10:].mean(axis=0)
+    assert np.allclose(actuated - rest, signal.amplitude, rtol=0.01)
@@ -0,0 +1,33 @@
+"""Test functions in visit_order.py"""
+
+import numpy as np
+
+import capcup.offset_generator as og
+import capcup.visit_order as vo
+
+
+def test_move_time():
+    # 100 mm at 100 mm/s with 1000 mm/s^2: 1 s cruise + 0.1 s of ramps
+    assert np.isclose(vo.move_time(100), 1.1)
+    assert np.isclose(vo.move_time(1, speed=100, acceleration=1000), 2 * np.sqrt(1e-3))
+
+
+def test_two_opt_untangles_path():
+    xy = np.array([[1, 0], [3, 0], [2, 0], [4, 0]], dtype=float)
+    order = vo.two_opt(xy, np.arange(4), start=(0, 0))
+    assert np.array_equal(order, [0, 2, 1, 3])
+
+
+def test_order_visits():
+    box = og.Box(x_size=100, y_size=100)
+    cup = og.SuctionCup(diameter=40, lip_to_board_height=6.7, max_actuation=5)
+    poses = box.sample(100, cup, rng=0)
+    ordered, report = vo.order_visits(poses, block_size=60, rng=0)
+
+    assert len(ordered) == len(poses)
+    assert sorted(ordered["x"]) == sorted(poses["x"])
+    assert report["distance_after"] < report["distance_before"] / 2
+    assert report["time_saved"] > 0
+    # every block is still a mix of labels
+    for block in range(0, 300, 60):
+        assert ordered["label"][block : block + 60].nunique() == 3